@@ -0,0 +1,96 @@
+import datetime
+import json
+from hashlib import sha256
+
+from .merkle import merkle_root
+
+
+# the fields of a block covered by header_bytes(), the transactions through their merkle root
+HEADER_FIELDS = frozenset(('index', 'prev_hash', 'timestamp', 'transactions', 'miner'))
+
+
+class Block:
+    """
+    A block of the chain. Blocks keep their fields in slots instead of a __dict__ to use less memory. The hash of a
+    block covers its transactions through their merkle root, so the header that is hashed has the same size whatever
+    the number of transactions. The merkle root and the serialization of the header are computed once and reused for
+    every hash of the block until one of the fields they cover is assigned.
+
+    :param miner: The address credited with the fees of the transactions of the block, None for blocks without a miner
+                  such as the genesis block
+    """
+
+    __slots__ = ('index', 'nonce', 'transactions', 'timestamp', 'prev_hash', 'miner', 'hash', '_header',
+                 '_merkle_root')
+
+    def __init__(self, index, transactions, prev_hash, nonce=0, timestamp=str(datetime.datetime.now()), miner=None):
+        self.index = index
+        self.nonce = nonce
+        self.transactions = transactions
+        self.timestamp = timestamp
+        self.prev_hash = prev_hash
+        self.miner = miner
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in HEADER_FIELDS:
+            object.__setattr__(self, '_header', None)
+            if name == 'transactions':
+                object.__setattr__(self, '_merkle_root', None)
+
+    @classmethod
+    def from_dict(cls, x: dict) -> 'Block':
+        """
+        Rebuilds a Block from its dictionary, for example a block received from another node.
+        :param x: The dictionary of a block including its hash
+        :return: A Block object with its hash set
+        """
+        block = cls(x['index'], x['transactions'], x['prev_hash'], x['nonce'], x['timestamp'], x.get('miner'))
+        block.hash = x['hash']
+        return block
+
+    def to_dict(self) -> dict:
+        """
+        :return: The dictionary of the block, including its hash once it is set
+        """
+        x = {'index': self.index, 'nonce': self.nonce, 'transactions': self.transactions, 'timestamp': self.timestamp,
+             'prev_hash': self.prev_hash, 'miner': self.miner}
+        if hasattr(self, 'hash'):
+            x['hash'] = self.hash
+        return x
+
+    @property
+    def merkle_root(self) -> str:
+        """The hex merkle root of the transactions of the block."""
+        if self._merkle_root is None:
+            object.__setattr__(self, '_merkle_root', merkle_root(self.transactions))
+        return self._merkle_root
+
+    def header_bytes(self) -> bytes:
+        """
+        Serializes every field of the block that is covered by its hash except the nonce. The nonce is appended after
+        this serialization when hashing so miners can hash the header once and only hash the nonce for every attempt.
+        :return: The canonical json serialization of the header of the block, with the merkle root of its transactions
+                 instead of the transactions, without its nonce and hash
+        """
+        if self._header is None:
+            header = {'index': self.index, 'prev_hash': self.prev_hash, 'timestamp': self.timestamp,
+                      'merkle_root': self.merkle_root, 'miner': self.miner}
+            object.__setattr__(self, '_header', json.dumps(header, sort_keys=True).encode())
+        return self._header
+
+    def compute_hash(self):
+        """Simple function to calculate the hash given the current state of the block"""
+        return sha256(self.header_bytes() + str(self.nonce).encode()).hexdigest()
+
+    def __repr__(self):
+        return f"""Transactions: {self.transactions}\n
+                        Proof: {self.nonce}\n
+                        Previous Hash: {self.prev_hash}\n
+                        Creation date: {self.timestamp}"""
+
+    def __str__(self):
+        return f"""Transactions: {self.transactions}\n
+                Proof: {self.nonce}\n
+                Previous Hash: {self.prev_hash}\n
+                Creation date: {self.timestamp}"""
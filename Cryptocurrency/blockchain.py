@@ -1,40 +1,30 @@
-import datetime
-from hashlib import sha256
 import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
 import requests
-from .network import Network, Node
+from .block import Block
+from .network import GossipQueue, Network, Node, SeenCache
 from .mempool import MemPool, Transaction
-from typing import List, Union
+from .mining import Miner, MiningScheduler
+from .template import BlockTemplate
+from .chain import Chain
+from .blocktree import BlockTree
+from .storage import BlockStore
+from .verification import ChainVerifier
+from . import wire
+from .merkle import merkle_proof
+from .txindex import TxIndex
+from .ledger import Ledger
+from .metrics import NodeMetrics
+from typing import Iterable, Iterator, List, Optional, Union
 from requests import Response
 
 
-class Block:
-
-    def __init__(self, index, transactions, prev_hash, nonce=0, timestamp=str(datetime.datetime.now())):
-        self.index = index
-        self.nonce = nonce
-        self.transactions = transactions
-        self.timestamp = timestamp
-        self.prev_hash = prev_hash
-
-    def compute_hash(self):
-        """Simple function to calculate the hash given the current state of the block"""
-        block = json.dumps(self.__dict__, sort_keys=True).encode()
-        return sha256(block).hexdigest()
-
-    def __repr__(self):
-        return f"""Transactions: {self.transactions}\n
-                        Proof: {self.nonce}\n
-                        Previous Hash: {self.prev_hash}\n
-                        Creation date: {self.timestamp}"""
-
-    def __str__(self):
-        return f"""Transactions: {self.transactions}\n
-                Proof: {self.nonce}\n
-                Previous Hash: {self.prev_hash}\n
-                Creation date: {self.timestamp}"""
-
-
 class BlockChain:
     """
     The main component of the cryptocurrency that handles the instantiation of the chain, mining, and various general
@@ -43,20 +33,78 @@ class BlockChain:
     :param Node2: One other node in the general network. Required for the network to go online
     :param port: The port to use for the current node.
     :param url: The url to use for the current node's flask API interface
+    :param workers: The number of processes used to mine and to verify long chains. 1 mines in the thread that calls
+                    mine() and verifies chains in the calling thread
+    :param max_block_bytes: The maximum number of bytes the serialized transactions of a block can take
+    :param storage_path: A directory where the chain is persisted. The chain is loaded from it when the node restarts.
+                         The chain only lives in memory if None
+    :param cache_size: The number of blocks whose transactions are kept in memory when the chain is persisted
+    :param announce: If True new transactions and blocks are announced to the other nodes by ID and every node only
+                     requests the ones it has not seen. If False their bodies are pushed to every node
+    :param seen_cache_size: The number of transaction and block IDs remembered to ignore repeated announcements
+    :param block_reward: The amount credited to the miner of every block on top of the fees of its transactions
+    :param enforce_balances: If True transactions whose sender cannot afford them, counting the transactions of the
+                             sender already in the MemPool, are not added to the MemPool
+    :param mempool_size: The maximum number of transactions the MemPool holds before it evicts transactions
+    :param max_tran_per_sender: The maximum number of transactions a single sender can have in the MemPool. No limit if
+                                None
+    :param mempool_max_age: The number of seconds after which a transaction waiting in the MemPool expires.
+                            Transactions never expire if None
+    :param mempool_eviction: What the MemPool evicts when it is full, 'fee' for the transaction with the lowest fee and
+                             'age' for the oldest transaction
     """
-    def __init__(self, miningDiff, Node2, port='50000', url='127.0.0.1'):
-        # chain and unverified_transactions are both lists of dictionary's since blocks and transactions are added with
-        # the .__dict__ extension
-        self.chain = []
-        self.MemPool = MemPool(10, 100)
+    def __init__(self, miningDiff, Node2, port='50000', url='127.0.0.1', workers=1, max_block_bytes=1000000,
+                 storage_path=None, cache_size=1000, announce=True, seen_cache_size=100000, block_reward=0,
+                 enforce_balances=False, mempool_size=100, max_tran_per_sender=None, mempool_max_age=None,
+                 mempool_eviction='fee'):
+        # the chain keeps the headers of the blocks in memory and loads their transactions when they are accessed
+        self.store = BlockStore(storage_path) if storage_path else None
+        self.chain = Chain(self.store, cache_size)
+        self.MemPool = MemPool(10, mempool_size, max_tran_per_sender, mempool_max_age, mempool_eviction)
+        # the transactions of the next block, kept up to date as the MemPool changes
+        self.template = BlockTemplate(self.MemPool, max_block_bytes)
 
         # initialize this node and network
         self.node = Node(url, port)
         self.Network = Network(self.node, [Node2])
+        # transactions are gossiped to the other nodes in batches by a background thread
+        self.gossip = GossipQueue(self.Network)
+        self.announce = announce
+        # IDs of the transactions and blocks already received or being fetched
+        self.seen = SeenCache(seen_cache_size)
+        # announced items are fetched in the background so the node announcing them is answered right away
+        self.fetcher = ThreadPoolExecutor(4, thread_name_prefix='getdata')
         # self.Network.connect_to_network()
 
-        self.create_genesis()
+        if not len(self.chain):
+            self.create_genesis()
+        # confirmed transactions by ID and address and balances of every address, kept up to date as blocks are
+        # appended and removed. When the chain is persisted they are loaded from the snapshots saved by close() and
+        # only the blocks appended after them are read
+        self.tx_index = TxIndex(self.chain, os.path.join(storage_path, 'txindex.json') if storage_path else None)
+        self.ledger = Ledger(self.chain, self.MemPool, block_reward,
+                             path=os.path.join(storage_path, 'ledger.json') if storage_path else None)
+        self.enforce_balances = enforce_balances
         self.miningDiff = miningDiff
+        # the branches competing with the chain and the blocks received before their parent. Every block takes about
+        # 16 ** miningDiff hashes to mine
+        self.tree = BlockTree(self.chain, 16 ** miningDiff)
+        # height and hash of the last block checked by validate_chain
+        self.verified_height = 0
+        self.verified_hash = None
+        self.miner = Miner(workers)
+        self.verifier = ChainVerifier(workers)
+        self.scheduler = MiningScheduler(self)
+        # guards the chain against blocks being added by the mining thread and request handlers at the same time
+        self.lock = threading.RLock()
+        # number of blocks requested at a time and seconds to wait for another node when syncing the chain
+        self.sync_page_size = 500
+        self.sync_timeout = 10
+        # whether blocks are exchanged in the binary wire format with the nodes that support it instead of json
+        self.wire_format = True
+        # counters and histograms served by the /metrics route of the API
+        self.metrics = NodeMetrics(self)
+        self.Network.metrics = self.metrics
 
     def create_genesis(self):
         """
@@ -66,24 +114,50 @@ class BlockChain:
         genesis_block.hash = genesis_block.compute_hash()
         self.chain.append(genesis_block)
 
-    def proof_of_work(self, block: Block) -> sha256:
+    def proof_of_work(self, block: Block, progress=None) -> sha256:
         """
         Called when a miner wants to create a block in order to store transactions and add to the chain. The hash
         computed here becomes the blocks hash if the number of leading 0's is correct. Keeps guessing hashes until
         the hash is correct.
 
         :param block: A Block object that contains certain data
-        :returns: The correct hash that also becomes the mined blocks hash
+        :param progress: An optional function called with the number of nonces tried as the search goes on
+        :returns: The correct hash that also becomes the mined blocks hash or None if mining was aborted
         """
         # TODO: Incorporate Nonce, timestamp, and transaction rotation to account for Nonce max and high hash capacity
-        block.nonce = 0
-        computed_hash = block.compute_hash()
-        while computed_hash[:self.miningDiff] != '0' * self.miningDiff:
-            block.nonce += 1
-            computed_hash = block.compute_hash()
+        result = self.miner.search(block.header_bytes(), self.miningDiff, progress=progress)
+        if result is None:
+            return None
+        block.nonce, computed_hash = result
 
         return computed_hash
 
+    def abort_mining(self):
+        """
+        Stops the proof of work currently running, if any. Used when a competing block replaces the tip of the chain
+        since the block being mined can no longer be added.
+        """
+        self.miner.abort()
+
+    def close(self, timeout: float = 5):
+        """
+        Stops this node: aborts mining, sends the transactions still queued for gossip and shuts down the threads and
+        worker processes of the node. Then saves the transaction index and balances next to the persisted chain, so
+        they are not rebuilt from every block when the node restarts, and closes the store.
+        :param timeout: The maximum number of seconds to wait for the queued transactions to be sent
+        """
+        self.scheduler.close()
+        self.gossip.flush(timeout)
+        self.fetcher.shutdown(wait=False)
+        self.Network.executor.shutdown(wait=False)
+        self.miner.close()
+        self.verifier.close()
+        with self.lock:
+            if self.store is not None:
+                self.tx_index.save()
+                self.ledger.save()
+                self.store.close()
+
     def add_block(self, block: Block, proof_computed_hash: sha256) -> bool:
         """
         Adds a block to this blockchain instance if the computed hash is correct.
@@ -92,11 +166,12 @@ class BlockChain:
         :return: False if the computed hash is wrong or if the previous hash of the block is not the last blocks hash
         and True if the block is successfully appended.
         """
-        prev_hash = self.last_block.hash
-        if prev_hash != block.prev_hash or not self.check_proof(block, proof_computed_hash):
-            return False
-        block.hash = proof_computed_hash
-        self.chain.append(block)
+        with self.lock:
+            prev_hash = self.last_block.hash
+            if prev_hash != block.prev_hash or not self.check_proof(block, proof_computed_hash):
+                return False
+            block.hash = proof_computed_hash
+            self.chain.append(block)
 
         return True
 
@@ -111,120 +186,555 @@ class BlockChain:
         """
         return (computed_hash[:self.miningDiff] == '0' * self.miningDiff) and computed_hash == block.compute_hash()
 
-    def mine(self) -> Block:
+    def mine(self, progress=None) -> Optional[Block]:
+        """
+        Mines a block containing the transactions of the block template on top of the current last block, adds it to the
+        chain and broadcasts it to the other nodes.
+        :param progress: An optional function called with the number of nonces tried as the proof of work goes on
+        :return: The mined Block or None if mining was aborted because a competing block was received
+        """
         # TODO: Integrate GitHub API for open-source mining
         # if self.unverified_transactions:
+        # a competing block received from here on aborts the proof of work, even before the search starts
+        self.miner.reset()
         last_block = self.last_block
-        obj_transactions = self.MemPool.get_top_transactions()
-        # new_transactions = [x.__dict__ for x in obj_transactions]
-        new_transactions = self.obj_to_dict(obj_transactions)
-        new_block = Block(last_block.index + 1, transactions=new_transactions, prev_hash=last_block.hash)
-        proof_work = self.proof_of_work(new_block)
-        self.add_block(new_block, proof_work)
+        obj_transactions, new_transactions = self.template.get_transactions()
+        new_block = Block(last_block.index + 1, transactions=new_transactions, prev_hash=last_block.hash,
+                          miner=self.node.address)
+        started = time.perf_counter()
+        proof_work = self.proof_of_work(new_block, progress)
+        # mining was aborted because a competing block was received
+        if proof_work is None or not self.add_block(new_block, proof_work):
+            return None
+        self.metrics.block_mined(self.miner.hashes, time.perf_counter() - started)
+        self.seen.add(new_block.hash)
+        self.broadcast_block(new_block.to_dict())
 
         # self.MemPool.remove_transactions
 
-        # removes all the verified transactions
-        if self.MemPool.remove_transactions(obj_transactions):
-            self.Network.broadcast({'transactions': new_transactions}, 'transactions_verified')
+        # removes all the verified transactions. Announced blocks are fetched by the other nodes, which remove their
+        # transactions from their own MemPool, so the transactions are only pushed again to nodes receiving bodies
+        if self.MemPool.remove_transactions(obj_transactions) and not self.announce:
+            self.gossip.enqueue('transactions_verified', new_transactions)
 
         return new_block
         # else:
         #     return False
 
-    def validate_chain(self, chain: Union[List[Block], List[dict]]) -> bool:
+    def validate_chain(self, chain: Union[List[Block], List[dict]] = None, full: bool = False) -> bool:
         """
-        Iterates through an entire chain and checks to see if the every previous hash is the hash of the previous block
-        and if the hash of every bloc is valid.
-        :param chain: A list of Block objects or dictionaries representing blocks.
+        Iterates through a chain and checks to see if the every previous hash is the hash of the previous block, if the
+        hash of every block is the hash of its contents and if the hash of every block is valid. When validating this
+        node's own chain only the blocks appended since the last successful validation are checked unless full is True.
+        :param chain: A list of Block objects or dictionaries representing blocks. Defaults to this node's chain.
+        :param full: If True every block of this node's chain is checked again.
         :return: True if the chain is valid and False if the chain is invalid.
         """
-        if not isinstance(chain[0], Block):
-            new_chain = []
-            for x in chain:
-                new_block = Block(x['index'], x['transactions'], x['prev_hash'], x['nonce'], x['timestamp'])
-                new_block.hash = x['hash']
-                new_chain.append(new_block)
-        else:
-            new_chain = chain
-
-        for i in range(len(self.chain) - 1):
-            if new_chain[i].hash != new_chain[i + 1].prev_hash:
+        started = time.perf_counter()
+        try:
+            own_chain = chain is None or chain is self.chain
+            if own_chain:
+                chain = self.chain
+            elif not chain:
+                # a chain starts with its genesis block
                 return False
-            elif new_chain[i].hash[:self.miningDiff] != '0' * self.miningDiff and i != 0:
+            elif not isinstance(chain[0], Block):
+                chain = [Block.from_dict(x) for x in chain]
+
+            start = 0
+            if own_chain and not full and self.verified_height < len(chain) and \
+                    chain.hash_at(self.verified_height) == self.verified_hash:
+                start = self.verified_height + 1
+
+            length = len(chain)
+            prev_block = chain[start - 1] if start else None
+            # the blocks of this node's chain are read from the store a chunk at a time instead of all at once, and
+            # the hashes of long chains are recomputed in parallel by the verifier
+            blocks = chain.iterate(start, length) if own_chain else chain[start:length]
+            if not self.verifier.verify(blocks, self.miningDiff, prev_block, length - start):
                 return False
-        return True
+
+            if own_chain:
+                # remembers the last verified block so the next validation only checks the blocks appended after it
+                self.verified_height = length - 1
+                self.verified_hash = chain.hash_at(length - 1)
+            return True
+        finally:
+            self.metrics.validation_seconds.observe(time.perf_counter() - started)
 
     def compare_chains(self) -> bool:
         """
-        Since the longest chain is considered the valid chain this method requests the chains of all the other nodes and
-        selects the longest one. If none of them are longer than the current chain is still valid.
+        Since the longest chain is considered the valid chain this method asks every other node for the height of its
+        chain and only downloads the blocks of the longest one that this node does not have. If none of them are longer
+        than the current chain is still valid.
         :return: True of the current chain is replaced by a longer chain and False otherwise.
         """
-        network = self.Network.nodes
-        longest_chain = None
-        max_length = len(self.chain)
-        for node in network:
-            response = requests.get(f'{node.full_url}/get_chain')
-            if response.status_code == 200:
-                node_chain_length = response.json()['length']
-                node_chain = response.json()['chain']
-                if node_chain_length > max_length and self.validate_chain(node_chain):
-                    max_length = node_chain_length
-                    longest_chain = node_chain
-        if longest_chain:
-            new_chain = []
-            for x in longest_chain:
-                new_block = Block(x['index'], x['transactions'], x['prev_hash'], x['nonce'], x['timestamp'])
-                new_block.hash = x['hash']
-                new_chain.append(new_block)
-            self.chain = new_chain
-            return True
-        else:
-            return False
+        started = time.perf_counter()
+        try:
+            network = self.Network.nodes
+            best = None
+            max_length = len(self.chain)
+            for node in network:
+                try:
+                    response = requests.get(f'{node.full_url}/chain_tip', timeout=self.sync_timeout)
+                    if response.status_code != 200 or response.json()['height'] + 1 <= max_length:
+                        continue
+                    height = response.json()['height']
+                    fork = self.find_fork_point(node, height)
+                    blocks = self.fetch_blocks(node, fork + 1, height)
+                except (requests.RequestException, KeyError, ValueError) as error:
+                    logging.warning(f"{node} could not be synced with -- {error}")
+                    continue
+                prev_block = self.chain[fork] if fork >= 0 else None
+                if fork + 1 + len(blocks) > max_length and self.verifier.verify(blocks, self.miningDiff, prev_block):
+                    max_length = fork + 1 + len(blocks)
+                    best = (fork + 1, blocks)
+            if best:
+                return self.replace_chain(best[1], best[0])
+            else:
+                return False
+        finally:
+            self.metrics.compare_seconds.observe(time.perf_counter() - started)
+
+    def find_fork_point(self, node: Node, height: int) -> int:
+        """
+        Finds the last block this node has in common with the chain of another node by comparing headers, starting at
+        the tip of this chain and going back a window twice as large every time. In the common case where the other
+        chain extends this one a single header is downloaded.
+        :param node: The other node
+        :param height: The height of the tip of the other node's chain
+        :return: The height of the last block both chains have in common or -1 if they share no block
+        """
+        top = min(len(self.chain) - 1, height)
+        count = 1
+        while top >= 0:
+            start = max(0, top - count + 1)
+            headers = self.fetch_headers(node, start, top - start + 1)
+            for header in reversed(headers):
+                if header['index'] < len(self.chain) and self.chain.hash_at(header['index']) == header['hash']:
+                    return header['index']
+            top = start - 1
+            count *= 2
+        return -1
+
+    def fetch_headers(self, node: Node, start: int, count: int) -> List[dict]:
+        response = requests.get(f'{node.full_url}/headers', params={'from': start, 'count': count},
+                                timeout=self.sync_timeout)
+        response.raise_for_status()
+        return response.json()['headers']
+
+    def fetch_blocks(self, node: Node, start: int, stop: int) -> List[Block]:
+        """
+        Downloads the blocks of another node one page at a time.
+        :param node: The other node
+        :param start: The height of the first block to download
+        :param stop: The height of the last block to download
+        :return: A list of Block objects
+        """
+        blocks = []
+        while start + len(blocks) <= stop:
+            count = min(self.sync_page_size, stop - start - len(blocks) + 1)
+            response = requests.get(f'{node.full_url}/blocks', params={'from': start + len(blocks), 'count': count},
+                                    headers=self.accept_header, timeout=self.sync_timeout)
+            response.raise_for_status()
+            if response.headers.get('Content-Type', '').startswith(wire.CONTENT_TYPE):
+                page = wire.decode_message(response.content)[0]
+            else:
+                page = response.json()['blocks']
+            if not page:
+                break
+            blocks.extend(Block.from_dict(x) for x in page)
+        return blocks
+
+    def replace_chain(self, new_chain: List[Block], start: int = 0, require_longer: bool = True) -> bool:
+        """
+        Replaces the chain of this node from a given height with the blocks of another chain and stops mining since the
+        block being mined no longer extends the chain. The blocks both chains have in common are kept.
+        :param new_chain: A list of Block objects that has already been validated.
+        :param start: The height of the first block of new_chain. The blocks of this chain below it are kept
+        :param require_longer: If True the chain is only replaced if the resulting chain is longer than this chain
+        :return: True if the chain was replaced and False if this chain changed in a way that the new blocks no longer
+                 connect to it or are no longer longer than it
+        """
+        self.abort_mining()
+        with self.lock:
+            if start > len(self.chain) or (require_longer and start + len(new_chain) <= len(self.chain)) or \
+                    (start and new_chain and self.chain.hash_at(start - 1) != new_chain[0].prev_hash):
+                return False
+            # keeps the blocks both chains have in common
+            height = start
+            while height < min(start + len(new_chain), len(self.chain)) and \
+                    self.chain.hash_at(height) == new_chain[height - start].hash:
+                height += 1
+            # only the blocks after the fork point are replaced, the removed ones are kept as a branch
+            disconnected, connected = self.tree.switch(height, new_chain[height - start:])
+            if self.store is not None:
+                self.store.flush()
+        self._update_mempool(disconnected, connected)
+        return True
+
+    def _update_mempool(self, disconnected: List[Block], connected: List[Block]):
+        """
+        Removes the transactions of the blocks appended to the chain from the MemPool and puts the transactions of the
+        blocks removed from the chain that are not in the appended blocks back into it.
+        :param disconnected: The blocks removed from the chain
+        :param connected: The blocks appended to the chain
+        """
+        confirmed = [Transaction.from_dict(x) for block in connected for x in block.transactions]
+        self.MemPool.remove_transactions(confirmed)
+        confirmed_ids = {x.ID for x in confirmed}
+        returned = [Transaction.from_dict(x) for block in disconnected for x in block.transactions
+                    if x['ID'] not in confirmed_ids]
+        if returned:
+            self.MemPool.insert_multiple_transactions(returned)
 
     def propagate_transaction(self, transaction: Transaction) -> bool:
         """
-        Takes a new transaction, makes sure its not a duplicate, and then makes all the other nodes aware of this new
-        transaction.
+        Takes a new transaction, makes sure its not a duplicate, and then queues it to make all the other nodes aware of
+        this new transaction.
         :param transaction: A Transaction object.
         :return: True if the transaction is added to the mempool and propagated to the other nodes in the network.
         """
-        # makes sure the transaction had not already been added
-        for x in self.MemPool.unverified_transactions:
-            if transaction.ID == x.ID:
-                return False
+        return self.propagate_transactions([transaction])[0] == 'added'
 
-        # adds the transaction to memPool and propagates the transaction to the other node MemPools
-        self.MemPool.insert_single_transaction(transaction)
-        self.Network.broadcast({'transaction': transaction.__dict__}, 'add_transaction')
+    @staticmethod
+    def _encodable(transaction: Transaction) -> bool:
+        # a transaction that cannot be encoded would fail every batch it is sent in
+        try:
+            wire.check_transaction(transaction.to_dict())
+        except ValueError:
+            return False
+        return True
 
+    def propagate_transactions(self, transactions: List[Transaction]) -> List[str]:
+        """
+        Adds a batch of new transactions to the MemPool in one pass and queues the ones that were added to be sent to
+        the other nodes together.
+        :param transactions: A list of Transaction objects
+        :return: The status of every transaction: 'added', 'duplicate' if it is already in the MemPool or earlier in the
+                 batch, 'invalid' if it does not fit the wire format, 'insufficient_funds' if balances are enforced and
+                 its sender cannot afford it, or 'rejected' if the MemPool refused it
+        """
+        # the balances checked must not change before the transactions are inserted
+        with self.lock:
+            statuses = []
+            new_transactions = []
+            # position of every new transaction in the batch
+            positions = []
+            batch_ids = set()
+            # what the senders of the batch spend in the transactions of the batch before the current one
+            batch_spent = Counter()
+            for transaction in transactions:
+                # makes sure the transaction had not already been added
+                if transaction.ID in batch_ids or transaction.ID in self.MemPool:
+                    statuses.append('duplicate')
+                elif not self._encodable(transaction):
+                    statuses.append('invalid')
+                elif self.enforce_balances and transaction.amount + transaction.fee > \
+                        self.ledger.spendable(transaction.sender) - batch_spent[transaction.sender]:
+                    statuses.append('insufficient_funds')
+                else:
+                    batch_spent[transaction.sender] += transaction.amount + transaction.fee
+                    batch_ids.add(transaction.ID)
+                    positions.append(len(statuses))
+                    statuses.append('rejected')
+                    new_transactions.append(transaction)
+
+            # adds the transactions to memPool and propagates them to the other node MemPools
+            admitted = self.MemPool.insert_multiple_transactions(new_transactions)
+        added = [x for x, valid in zip(new_transactions, admitted) if valid]
+        for i, transaction, valid in zip(positions, new_transactions, admitted):
+            if valid:
+                statuses[i] = 'added'
+                self.seen.add(transaction.ID)
+        if not added:
+            return statuses
+        if self.announce:
+            self.gossip.enqueue('inv', [{'type': 'tx', 'ID': x.ID} for x in added], key='inventory',
+                                extra={'node': self.node.to_dict()})
+        else:
+            self.gossip.enqueue('add_transactions', [x.to_dict() for x in added])
+
+        return statuses
+
+    def receive_block(self, x: dict) -> bool:
+        """
+        Adds a block received from another node to the block tree. If the block, or orphans waiting for it, extend the
+        chain or give a branch more work than the chain, the chain is updated, the MemPool is updated with the
+        transactions of the blocks appended to and removed from the chain and the block is passed on to the other nodes.
+        :param x: The dictionary of a block including its hash
+        :return: True if the chain changed and False otherwise
+        :raises ValueError: If a field of the block is missing or has a type that cannot be encoded
+        """
+        wire.check_block(x)
+        new_block = Block.from_dict(x)
+        if not self.check_proof(new_block, x['hash']):
+            return False
+        new_block.hash = x['hash']
+        with self.lock:
+            _, disconnected, connected = self.tree.add(new_block)
+        self.seen.add(new_block.hash)
+        if not connected:
+            return False
+
+        # the block being mined no longer extends the chain
+        self.abort_mining()
+        self._update_mempool(disconnected, connected)
+        self.broadcast_block(x)
         return True
 
-    def update_node(self, node: Node) -> Response:
+    def broadcast_block(self, x: dict):
+        """
+        Sends a block to the other nodes right away instead of queueing it since the blocks mined by the other nodes are
+        wasted work until they receive it. Only the hash of the block is sent when announcing.
+        :param x: The dictionary of a block including its hash
+        """
+        if self.announce:
+            inventory = [{'type': 'block', 'ID': x['hash']}]
+            self.Network.broadcast({'inventory': inventory, 'node': self.node.to_dict()}, 'inv')
+        else:
+            self.Network.broadcast({'block': x}, 'add_block')
+
+    def receive_inventory(self, inventory: List[dict], node: Node) -> int:
+        """
+        Handles the transaction and block IDs announced by another node. The items this node has not seen are marked as
+        seen, so announcements of them by other nodes are ignored, and requested from the announcing node in the
+        background.
+        :param inventory: A list of {'type': 'tx' or 'block', 'ID': the ID of the transaction or hash of the block}
+        :param node: The node that announced the items
+        :return: The number of items requested
+        """
+        wanted = []
+        for item in inventory:
+            if item['type'] == 'tx':
+                known = item['ID'] in self.MemPool
+            else:
+                known = self.tree.contains(item['ID'])
+            if not known and self.seen.add(item['ID']):
+                wanted.append(item)
+        if wanted:
+            self.fetcher.submit(self.fetch_inventory, node, wanted)
+        return len(wanted)
+
+    def fetch_inventory(self, node: Node, inventory: List[dict]):
+        """
+        Requests the bodies of announced items from the node that announced them and adds them to this node. Items the
+        other node could not send are forgotten so they are requested again when another node announces them.
+        :param node: The node that announced the items
+        :param inventory: The items to request
+        """
+        try:
+            response = self.Network.session(node).post(f'{node.full_url}/getdata', json={'inventory': inventory},
+                                                       timeout=self.Network.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.RequestException, ValueError) as error:
+            logging.warning(f"{node} could not send the announced items -- {error}")
+            for item in inventory:
+                self.seen.discard(item['ID'])
+            return
+
+        received = set()
+        transactions = [Transaction.from_dict(x) for x in data.get('transactions', [])]
+        received.update(x.ID for x in transactions)
+        self.propagate_transactions(transactions)
+        for x in data.get('blocks', []):
+            try:
+                self.receive_block(x)
+            except ValueError as error:
+                logging.warning(f"{node} sent a malformed block -- {error}")
+                continue
+            received.add(x['hash'])
+            # the parent of an orphan is requested from the node that sent it, one ancestor at a time
+            if self.tree.is_orphan(x['hash']) and not self.tree.contains(x['prev_hash']) and \
+                    self.seen.add(x['prev_hash']):
+                self.fetcher.submit(self.fetch_inventory, node, [{'type': 'block', 'ID': x['prev_hash']}])
+        for item in inventory:
+            if item['ID'] not in received:
+                self.seen.discard(item['ID'])
+
+    def get_inventory_data(self, inventory: List[dict]) -> dict:
+        """
+        :param inventory: The items requested by another node
+        :return: The dictionaries of the requested transactions and blocks this node has
+        """
+        transactions, blocks = [], []
+        for item in inventory:
+            if item['type'] == 'tx':
+                transaction = self.MemPool.transactions.get(item['ID'])
+                if transaction is not None:
+                    transactions.append(transaction.to_dict())
+            else:
+                block = self.tree.get(item['ID'])
+                if block is not None:
+                    blocks.append(block.to_dict())
+        return {'transactions': transactions, 'blocks': blocks}
+
+    def update_node(self, node: Node, stream: bool = True) -> Response:
         """
         Copies all the data from the current node to another node. Used mainly when a brand new node is inserted into
-        a network.
+        a network. By default the blocks are streamed as NDJSON starting after the last block both nodes have in common,
+        so neither node holds the whole chain in memory and a sync that was interrupted resumes where it stopped.
         :param node: A Node object.
+        :param stream: If False the whole chain and MemPool are sent in a single message
         :return: The response object from the post request.
         """
+        url = node.full_url + '/update_node'
+        if stream:
+            try:
+                response = requests.get(f'{node.full_url}/chain_tip', timeout=self.sync_timeout)
+                response.raise_for_status()
+                start = self.find_fork_point(node, response.json()['height']) + 1
+            except (requests.RequestException, KeyError, ValueError) as error:
+                logging.warning(f"{node} did not send its chain tip, sending the whole chain -- {error}")
+                start = 0
+            response = requests.post(url, data=self.export_chain(start), timeout=self.sync_timeout,
+                                     headers={'Content-Type': 'application/x-ndjson'})
+            # the other node does not support streaming
+            if response.status_code != 415:
+                return response
+
         # transactions = [x.__dict__ for x in self.MemPool.unverified_transactions]
         transactions = self.obj_to_dict(self.MemPool.unverified_transactions)
         # chain = [x.__dict__ for x in self.chain]
         chain = self.obj_to_dict(self.chain)
-        url = node.full_url + '/update_node'
+        if self.wire_format:
+            response = requests.post(url, data=wire.encode_message(chain, transactions),
+                                     headers={'Content-Type': wire.CONTENT_TYPE})
+            # the other node does not support the wire format
+            if response.status_code != 415:
+                return response
         return requests.post(url, json={"chain": chain, "transactions": transactions})
 
+    def export_chain(self, start: int = 0, chunk_bytes: int = 65536) -> Iterator[bytes]:
+        """
+        Serializes the chain from a given height and the MemPool as NDJSON, one block or transaction per line after a
+        first line holding the height of the first block. Blocks are read one at a time as the stream is consumed.
+        :param start: The height of the first block to export
+        :param chunk_bytes: The number of bytes of lines gathered before they are yielded
+        :return: An iterator of chunks of lines
+        """
+        def lines():
+            yield {'start': start}
+            for block in self.chain.iterate(start, len(self.chain)):
+                yield {'block': block.to_dict()}
+            for transaction in self.MemPool.unverified_transactions:
+                yield {'transaction': transaction.to_dict()}
+
+        chunk = bytearray()
+        for line in lines():
+            chunk += json.dumps(line).encode() + b'\n'
+            if len(chunk) >= chunk_bytes:
+                yield bytes(chunk)
+                chunk.clear()
+        if chunk:
+            yield bytes(chunk)
+
+    def import_chain(self, lines: Iterable[bytes]) -> bool:
+        """
+        Imports a chain exported by export_chain. Blocks are checked and added sync_page_size at a time as they are
+        read, replacing the blocks of this chain from the first height of the export, so only one page of blocks is held
+        in memory. If the stream is interrupted or holds an invalid block the blocks added so far are kept, so the next
+        export to this node can start after them. The MemPool is replaced once the whole stream was read.
+        :param lines: The lines of the export, for example the body of a request
+        :return: True if the whole stream was imported and False otherwise
+        """
+        start = 0
+        page = []
+        transactions = []
+        complete = True
+        try:
+            for line in lines:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if 'start' in item:
+                    start = item['start']
+                elif 'block' in item:
+                    page.append(Block.from_dict(item['block']))
+                    if len(page) >= self.sync_page_size:
+                        if not self._import_blocks(page, start):
+                            return False
+                        start += len(page)
+                        page = []
+                else:
+                    transactions.append(Transaction.from_dict(item['transaction']))
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            logging.warning(f"the chain could not be completely imported -- {error}")
+            complete = False
+
+        # the blocks read before the stream ended are kept even if it was interrupted
+        if page and not self._import_blocks(page, start):
+            return False
+        if complete:
+            self.MemPool.unverified_transactions = transactions
+        return complete
+
+    def _import_blocks(self, blocks: List[Block], start: int) -> bool:
+        prev_block = self.chain[start - 1] if 0 < start <= len(self.chain) else None
+        if start > len(self.chain) or not self.verifier.verify(blocks, self.miningDiff, prev_block):
+            return False
+        return self.replace_chain(blocks, start, require_longer=False)
+
+    def transaction_proof(self, ID: str) -> Optional[dict]:
+        """
+        Finds a confirmed transaction through the transaction index and proves it is in its block.
+        :param ID: The ID of the transaction
+        :return: The transaction, the height and hash of its block, its position in the block, the merkle root of the
+                 block and the merkle proof linking the transaction to the root, or None if the transaction is not in
+                 the chain
+        """
+        found = self.find_transaction(ID)
+        if found is None:
+            return None
+        transactions = self.chain.transactions(found['height'])
+        header = self.chain.header(found['height'])
+        found.update(merkle_root=header['merkle_root'], proof=merkle_proof(transactions, found['position']))
+        return found
+
+    def find_transaction(self, ID: str) -> Optional[dict]:
+        """
+        :param ID: The ID of a transaction
+        :return: The transaction, the height and hash of its block, its position in the block and its number of
+                 confirmations, or None if the transaction is not in the chain
+        """
+        with self.lock:
+            location = self.tx_index.locate(ID)
+            if location is None:
+                return None
+            height, position = location
+            return {'transaction': self.chain.transactions(height)[position], 'height': height, 'position': position,
+                    'block_hash': self.chain.hash_at(height), 'confirmations': len(self.chain) - height}
+
+    def address_history(self, address: str, offset: int = 0, limit: int = 100) -> dict:
+        """
+        :param address: An address
+        :param offset: The number of transactions to skip, starting from the newest
+        :param limit: The maximum number of transactions returned
+        :return: The number of confirmed transactions of the address and a page of them from the newest to the oldest
+        """
+        with self.lock:
+            transactions = [self.find_transaction(ID) for ID in self.tx_index.history(address, offset, limit)]
+            return {'address': address, 'total': self.tx_index.history_size(address), 'offset': offset,
+                    'transactions': transactions}
+
     def obj_to_dict(self, objects: Union[Node, Transaction, List[Node], List[Transaction]]) -> Union[dict, List[dict]]:
         """
         Used to convert an object or list of objects to dictionaries.
-        :param objects: Any class instance or list of class instances
+        :param objects: Any class instance or list of class instances, or a chain
         :return: A list of dictionaries if objects was a list and a dictionary if objects is just one object.
         """
-        if isinstance(objects, list):
-            return [x.__dict__ for x in objects]
+        if isinstance(objects, (Block, Node, Transaction)):
+            return objects.to_dict()
         else:
-            return objects.__dict__
+            return [x.to_dict() for x in objects]
+
+    @property
+    def accept_header(self) -> dict:
+        """The Accept header of the requests for blocks, preferring the binary wire format when it is enabled."""
+        if self.wire_format:
+            return {'Accept': f'{wire.CONTENT_TYPE}, application/json;q=0.9'}
+        return {'Accept': 'application/json'}
 
     @property
     def last_block(self) -> int:
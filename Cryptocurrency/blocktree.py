@@ -0,0 +1,207 @@
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from .block import Block
+
+
+class BlockTree:
+    """
+    The blocks of every branch a node knows about keyed by hash, with the best branch stored in a Chain and the other
+    branches kept in memory. Blocks may arrive in any order: a block whose parent is unknown is kept in an orphan pool
+    and connected as soon as its parent arrives.
+
+    Every block has the cumulative work of its branch up to it, the sum of the work of the block and of its ancestors.
+    When a branch gets more work than the chain, the chain is reorganized: only the blocks after the fork point are
+    removed and the blocks of the branch appended, so a reorganization costs the depth of the fork instead of the length
+    of the chain. The removed blocks are kept as a branch so the chain can switch back to them.
+
+    The proof of work and hash of a block are checked by the caller before the block is added to the tree.
+
+    :param chain: The Chain holding the best branch
+    :param block_work: The work of a single block, the expected number of hashes needed to mine it
+    :param max_depth: The number of blocks below the tip of the chain that can be reorganized. Branches forking deeper
+                      are rejected and branches whose fork point falls that far behind are forgotten
+    :param max_orphans: The number of orphan blocks kept, the oldest orphans are dropped first
+    """
+
+    def __init__(self, chain, block_work: int = 1, max_depth: int = 100, max_orphans: int = 100):
+        self.chain = chain
+        self.block_work = block_work
+        self.max_depth = max_depth
+        self.max_orphans = max_orphans
+        # hash -> (block, cumulative work) of the blocks that are not in the chain
+        self._branches = {}
+        # hash -> block of the blocks whose parent is unknown, from the oldest to the newest
+        self._orphans = OrderedDict()
+        # hash of a missing parent -> hashes of its orphan children
+        self._waiting = {}
+        self._lock = threading.RLock()
+
+    @property
+    def work(self) -> int:
+        """The cumulative work of the chain."""
+        return len(self.chain) * self.block_work
+
+    def add(self, block: Block) -> Tuple[str, List[Block], List[Block]]:
+        """
+        Adds a block whose proof of work was checked to the tree, along with the orphans waiting for it.
+        :param block: A Block object whose hash is set
+        :return: The status of the block, the blocks removed from the chain and the blocks appended to it, oldest first.
+                 The status is 'extended' if the block was appended to the chain, 'reorg' if the chain switched to its
+                 branch, 'branch' if it was kept in a branch with less work than the chain, 'orphan' if its parent is
+                 unknown, 'duplicate' if it is already known, 'stale' if it forks deeper than max_depth and 'invalid'
+                 if its index does not follow the index of its parent
+        """
+        with self._lock:
+            if self.contains(block.hash):
+                return 'duplicate', [], []
+            if block.prev_hash not in self._branches and self.chain.height_of(block.prev_hash) is None:
+                self._add_orphan(block)
+                return 'orphan', [], []
+
+            disconnected, connected = [], []
+            status = self._attach(block, disconnected, connected)
+            if status in ('extended', 'reorg', 'branch'):
+                # the orphans waiting for the block, and for their own children, can be connected now
+                parents = [block.hash]
+                while parents:
+                    for child in self._waiting.pop(parents.pop(), []):
+                        orphan = self._orphans.pop(child)
+                        if self._attach(orphan, disconnected, connected) in ('extended', 'reorg', 'branch'):
+                            parents.append(orphan.hash)
+            return status, disconnected, connected
+
+    def _add_orphan(self, block: Block):
+        self._orphans[block.hash] = block
+        self._waiting.setdefault(block.prev_hash, []).append(block.hash)
+        while len(self._orphans) > self.max_orphans:
+            dropped_hash, dropped = self._orphans.popitem(last=False)
+            siblings = self._waiting[dropped.prev_hash]
+            siblings.remove(dropped_hash)
+            if not siblings:
+                del self._waiting[dropped.prev_hash]
+
+    def _attach(self, block: Block, disconnected: List[Block], connected: List[Block]) -> str:
+        tip = len(self.chain) - 1
+        parent_height = self.chain.height_of(block.prev_hash)
+        if parent_height is not None:
+            if block.index != parent_height + 1:
+                return 'invalid'
+            if parent_height == tip:
+                self.chain.append(block)
+                connected.append(block)
+                self._prune()
+                return 'extended'
+            if parent_height < tip - self.max_depth:
+                return 'stale'
+            parent_work = (parent_height + 1) * self.block_work
+        else:
+            parent, parent_work = self._branches[block.prev_hash]
+            if block.index != parent.index + 1:
+                return 'invalid'
+
+        work = parent_work + self.block_work
+        self._branches[block.hash] = (block, work)
+        if work <= self.work:
+            return 'branch'
+
+        # the branch has more work than the chain, its blocks are collected back to the fork point
+        branch = [block]
+        while branch[-1].prev_hash in self._branches:
+            branch.append(self._branches[branch[-1].prev_hash][0])
+        branch.reverse()
+        removed, appended = self.switch(self.chain.height_of(branch[0].prev_hash) + 1, branch)
+        # blocks appended and removed again by the orphans connected after them cancel out
+        removed_hashes = {x.hash for x in removed}
+        appended_hashes = {x.hash for x in appended}
+        connected_hashes = {x.hash for x in connected}
+        disconnected_hashes = {x.hash for x in disconnected}
+        connected[:] = [x for x in connected if x.hash not in removed_hashes]
+        disconnected[:] = [x for x in disconnected if x.hash not in appended_hashes]
+        disconnected.extend(x for x in removed if x.hash not in connected_hashes)
+        connected.extend(x for x in appended if x.hash not in disconnected_hashes)
+        return 'reorg'
+
+    def switch(self, height: int, blocks: List[Block]) -> Tuple[List[Block], List[Block]]:
+        """
+        Replaces the blocks of the chain from a given height with the blocks of another branch. The removed blocks are
+        kept as a branch.
+        :param height: The height of the first block to replace
+        :param blocks: The Block objects of the other branch from the given height, already checked
+        :return: The blocks removed from the chain and the blocks appended to it
+        """
+        with self._lock:
+            removed = list(self.chain.iterate(height, len(self.chain)))
+            self.chain.truncate(height)
+            for block in blocks:
+                self.chain.append(block)
+                self._branches.pop(block.hash, None)
+            for block in removed:
+                self._branches[block.hash] = (block, (block.index + 1) * self.block_work)
+            self._prune()
+            return removed, blocks
+
+    def _prune(self):
+        # branches forking deeper than max_depth can no longer replace the chain. A branch is dropped as a whole, a
+        # branch keeping only its higher blocks would no longer lead back to the chain
+        lowest = len(self.chain) - 1 - self.max_depth
+        if not self._branches or min(x.index for x, _ in self._branches.values()) > lowest:
+            return
+        # hash -> height of the fork point of the branch holding the block
+        forks = {}
+        for block_hash in self._branches:
+            path = []
+            while block_hash in self._branches and block_hash not in forks:
+                path.append(block_hash)
+                block_hash = self._branches[block_hash][0].prev_hash
+            fork = forks[block_hash] if block_hash in forks else self.chain.height_of(block_hash)
+            forks.update((x, fork) for x in path)
+        self._branches = {k: v for k, v in self._branches.items() if forks[k] is not None and forks[k] >= lowest}
+
+    def contains(self, block_hash: str) -> bool:
+        return block_hash in self._branches or block_hash in self._orphans or \
+            self.chain.height_of(block_hash) is not None
+
+    def get(self, block_hash: str) -> Optional[Block]:
+        """
+        :param block_hash: The hash of a block
+        :return: The block with the given hash if it is in the chain or in a branch and None otherwise
+        """
+        height = self.chain.height_of(block_hash)
+        if height is not None:
+            return self.chain[height]
+        entry = self._branches.get(block_hash)
+        return entry[0] if entry is not None else None
+
+    def is_orphan(self, block_hash: str) -> bool:
+        return block_hash in self._orphans
+
+    @property
+    def orphans(self) -> int:
+        """The number of blocks waiting for their parent."""
+        return len(self._orphans)
+
+    def tips(self) -> List[dict]:
+        """
+        :return: The tip of the chain and of every branch, with their height, cumulative work and, for the branches,
+                 the number of blocks after their fork point, from the most work to the least
+        """
+        with self._lock:
+            parents = {x.prev_hash for x, _ in self._branches.values()}
+            tips = [{'hash': self.chain.hash_at(len(self.chain) - 1), 'height': len(self.chain) - 1,
+                     'work': self.work, 'branch_length': 0, 'status': 'active'}]
+            for block_hash, (block, work) in self._branches.items():
+                if block_hash in parents:
+                    continue
+                length = 1
+                ancestor = block
+                while ancestor.prev_hash in self._branches:
+                    ancestor = self._branches[ancestor.prev_hash][0]
+                    length += 1
+                tips.append({'hash': block_hash, 'height': block.index, 'work': work, 'branch_length': length,
+                             'status': 'valid-fork'})
+            return sorted(tips, key=lambda x: -x['work'])
+
+    def __len__(self) -> int:
+        return len(self._branches)
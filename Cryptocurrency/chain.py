@@ -0,0 +1,210 @@
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import repeat
+from typing import Iterator, List, Optional, Union
+
+from .block import Block
+from .storage import BlockStore
+
+
+class Chain:
+    """
+    A list-like sequence of the blocks of a BlockChain that keeps the headers of every block in memory in compact
+    arrays and loads the transactions of a block only when the block is accessed. Blocks are rebuilt from their header
+    and transactions every time they are accessed, so changing a Block returned by the chain does not change the chain.
+
+    When the chain is backed by a BlockStore the transactions are read from disk and the transactions of the most
+    recently accessed blocks are kept in an LRU cache, so the memory used is bounded whatever the length of the chain.
+    Without a store the transactions are kept in memory. When a chain is loaded from a store only the hashes are read,
+    from the fixed width entries of its index, and every other field of a header is parsed from the store the first
+    time the header is needed, so loading a long chain does not parse every header.
+
+    The previous hash of a block is not stored since it is the hash of the block before it, which is checked before any
+    block is added to the chain. The previous hash of the genesis block is kept on its own.
+
+    :param store: An optional BlockStore the chain is loaded from and persisted to
+    :param cache_size: The number of blocks whose transactions are kept in the cache when the chain has a store
+    """
+
+    def __init__(self, store: Optional[BlockStore] = None, cache_size=1000):
+        self.store = store
+        self.cache_size = cache_size
+        self._hashes = bytearray()
+        self._merkle_roots = bytearray()
+        self._nonces = array('Q')
+        self._timestamps = []
+        self._miners = []
+        # whether the fields of every header other than its hash have been read from the store
+        self._parsed = bytearray()
+        self._genesis_prev_hash = None
+        # hash -> height, built the first time a block is looked up by hash
+        self._heights = None
+        # transactions of every block when there is no store and of the recently accessed blocks otherwise
+        self._bodies = [] if store is None else OrderedDict()
+        # the store reads and writes through shared file objects
+        self._lock = threading.RLock()
+        # objects notified through block_appended(height, block) and chain_truncated(height) whenever blocks are
+        # appended to or removed from the chain
+        self.listeners = []
+
+        if store is not None and len(store):
+            count = len(store)
+            self._hashes += store.hashes()
+            self._merkle_roots += bytes(32 * count)
+            self._nonces.extend(repeat(0, count))
+            self._timestamps = [None] * count
+            self._miners = [None] * count
+            self._parsed = bytearray(count)
+            self._genesis_prev_hash = store.get_header(0)['prev_hash']
+
+    def _append_header(self, header: dict):
+        if not self._timestamps:
+            self._genesis_prev_hash = header['prev_hash']
+        self._hashes += bytes.fromhex(header['hash'])
+        self._merkle_roots += bytes.fromhex(header['merkle_root'])
+        self._nonces.append(header['nonce'])
+        self._timestamps.append(header['timestamp'])
+        self._miners.append(header.get('miner'))
+        self._parsed.append(1)
+        if self._heights is not None:
+            self._heights[header['hash']] = len(self._timestamps) - 1
+
+    def _parse_header(self, height: int):
+        header = self.store.get_header(height)
+        self._merkle_roots[height * 32:(height + 1) * 32] = bytes.fromhex(header['merkle_root'])
+        self._nonces[height] = header['nonce']
+        self._timestamps[height] = header['timestamp']
+        self._miners[height] = header.get('miner')
+        self._parsed[height] = 1
+
+    def append(self, block: Block):
+        """
+        Appends a block that has already been checked to the end of the chain.
+        :param block: A Block object whose hash is set
+        """
+        with self._lock:
+            # the merkle root is stored with the header so headers can be served without reading the transactions
+            record = block.to_dict()
+            record['merkle_root'] = block.merkle_root
+            if self.store is not None:
+                self.store.append(record)
+                self._cache(len(self), block.transactions)
+            else:
+                self._bodies.append(block.transactions)
+            self._append_header(record)
+            for listener in self.listeners:
+                listener.block_appended(len(self) - 1, block)
+
+    def truncate(self, height: int):
+        """
+        Removes every block from the given height to the tip.
+        :param height: The height of the first block to remove
+        """
+        with self._lock:
+            if height >= len(self):
+                return
+            if self._heights is not None:
+                for i in range(height, len(self)):
+                    self._heights.pop(self.hash_at(i), None)
+            del self._hashes[height * 32:]
+            del self._merkle_roots[height * 32:]
+            del self._nonces[height:]
+            del self._timestamps[height:]
+            del self._miners[height:]
+            del self._parsed[height:]
+            if self.store is not None:
+                self.store.truncate(height)
+                for i in [x for x in self._bodies if x >= height]:
+                    del self._bodies[i]
+            else:
+                del self._bodies[height:]
+            for listener in self.listeners:
+                listener.chain_truncated(height)
+
+    def hash_at(self, height: int) -> str:
+        return self._hashes[height * 32:(height + 1) * 32].hex()
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        """
+        :param block_hash: The hash of a block
+        :return: The height of the block with the given hash or None if it is not in the chain
+        """
+        with self._lock:
+            if self._heights is None:
+                self._heights = {self.hash_at(i): i for i in range(len(self))}
+            return self._heights.get(block_hash)
+
+    def header(self, height: int) -> dict:
+        """
+        :param height: The height of a block
+        :return: The dictionary of the block at the given height with the merkle root of its transactions instead of its
+                 transactions. Only reads the header from disk the first time it is needed after the chain is loaded
+        """
+        height = self._check_height(height)
+        if not self._parsed[height]:
+            with self._lock:
+                if not self._parsed[height]:
+                    self._parse_header(height)
+        return {'index': height, 'nonce': self._nonces[height], 'timestamp': self._timestamps[height],
+                'prev_hash': self.hash_at(height - 1) if height else self._genesis_prev_hash,
+                'miner': self._miners[height], 'hash': self.hash_at(height),
+                'merkle_root': self._merkle_roots[height * 32:(height + 1) * 32].hex()}
+
+    def transactions(self, height: int) -> list:
+        """
+        :param height: The height of a block
+        :return: The transactions of the block at the given height, read from the store if they are not cached
+        """
+        height = self._check_height(height)
+        with self._lock:
+            if self.store is None:
+                return self._bodies[height]
+            transactions = self._bodies.get(height)
+            if transactions is None:
+                transactions = self.store.get_body(height)
+                self._cache(height, transactions)
+            else:
+                self._bodies.move_to_end(height)
+            return transactions
+
+    def _cache(self, height: int, transactions: list):
+        self._bodies[height] = transactions
+        if len(self._bodies) > self.cache_size:
+            self._bodies.popitem(last=False)
+
+    def _check_height(self, height: int) -> int:
+        if height < 0:
+            height += len(self)
+        if not 0 <= height < len(self):
+            raise IndexError('block height out of range')
+        return height
+
+    def _block(self, height: int, transactions: list) -> Block:
+        x = self.header(height)
+        block = Block(x['index'], transactions, x['prev_hash'], x['nonce'], x['timestamp'], x['miner'])
+        block.hash = x['hash']
+        return block
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[Block, List[Block]]:
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(len(self)))]
+        return self._block(item, self.transactions(item))
+
+    def __iter__(self) -> Iterator[Block]:
+        return self.iterate()
+
+    def iterate(self, start: int = 0, stop: int = None) -> Iterator[Block]:
+        """
+        Reads the blocks sequentially without filling the cache with every block of the chain.
+        :param start: The height of the first block
+        :param stop: The height after the last block. Defaults to the length of the chain when iteration starts
+        """
+        for height in range(start, len(self) if stop is None else stop):
+            with self._lock:
+                cached = self.store is None or height in self._bodies
+                transactions = self.transactions(height) if cached else self.store.get_body(height)
+            yield self._block(height, transactions)
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
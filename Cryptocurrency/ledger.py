@@ -0,0 +1,135 @@
+import threading
+from collections import defaultdict
+from typing import Optional
+
+from .block import Block
+from .mempool import Transaction
+from .storage import load_snapshot, save_snapshot
+
+
+class Ledger:
+    """
+    The balance of every address according to the blocks of a chain, updated as blocks are appended instead of being
+    recomputed from the transactions of every block. A transaction debits its sender the amount and fee and credits its
+    receiver the amount, and the miner of a block is credited the fees of its transactions and the block reward.
+
+    A copy of the balances is kept every snapshot_interval blocks. When the end of the chain is removed, for example
+    when it is replaced by another chain, the balances are restored from the last snapshot below the new tip and only
+    the blocks after the snapshot are applied again instead of every block since the genesis block.
+
+    The ledger also listens to the MemPool to keep the amount every address has committed to transactions that are not
+    in a block yet, so whether a new transaction can be afforded is known without looking at any block.
+
+    Applying the blocks of the chain when the ledger is created reads the transactions of every block. With a path the
+    balances are saved by save() and loaded from it when the ledger is created, and only the blocks appended after they
+    were saved are applied. A snapshot of a block that is no longer in the chain is ignored and every block is applied.
+
+    :param chain: The Chain whose blocks the balances are computed from. Its current blocks are applied when the ledger
+                  is created
+    :param mempool: An optional MemPool whose pending transactions are tracked
+    :param block_reward: The amount credited to the miner of every block on top of the fees
+    :param snapshot_interval: The number of blocks between two snapshots of the balances
+    :param max_snapshots: The number of snapshots kept. Removing more blocks than they cover applies the chain again
+                          from the genesis block
+    :param path: An optional file the balances are saved to and loaded from
+    """
+
+    def __init__(self, chain, mempool=None, block_reward=0, snapshot_interval=100, max_snapshots=10,
+                 path: Optional[str] = None):
+        self.chain = chain
+        self.path = path
+        self.block_reward = block_reward
+        self.snapshot_interval = snapshot_interval
+        self.max_snapshots = max_snapshots
+        self._balances = defaultdict(float)
+        # height -> copy of the balances once the block at that height was applied, from the oldest to the newest
+        self._snapshots = {}
+        # address -> amount and fees of its transactions waiting in the MemPool
+        self._pending = defaultdict(float)
+        self.height = -1
+        self._lock = threading.RLock()
+
+        snapshot = load_snapshot(path, chain) if path is not None else None
+        if snapshot is not None:
+            self.height, balances = snapshot
+            self._balances.update(balances)
+            self._snapshots[self.height] = balances
+        chain.listeners.append(self)
+        for block in chain.iterate(self.height + 1):
+            self.block_appended(block.index, block)
+        if mempool is not None:
+            mempool.listeners.append(self)
+            for transaction in mempool.transactions.values():
+                self.transaction_added(transaction)
+
+    def block_appended(self, height: int, block: Block):
+        """Called by the chain when a block is appended."""
+        with self._lock:
+            self._apply(block.transactions, block.miner)
+            self.height = height
+            if height % self.snapshot_interval == 0:
+                self._snapshots[height] = dict(self._balances)
+                if len(self._snapshots) > self.max_snapshots:
+                    del self._snapshots[next(iter(self._snapshots))]
+
+    def save(self):
+        """Saves the balances to its path so they are loaded instead of recomputed when the node restarts."""
+        with self._lock:
+            save_snapshot(self.path, self.chain, self.height, dict(self._balances))
+
+    def chain_truncated(self, height: int):
+        """Called by the chain when every block from the given height to the tip is removed."""
+        with self._lock:
+            if height > self.height:
+                return
+            for snapshot_height in [x for x in self._snapshots if x >= height]:
+                del self._snapshots[snapshot_height]
+            start = max(self._snapshots, default=-1)
+            self._balances = defaultdict(float, self._snapshots.get(start, {}))
+            # applies the blocks between the snapshot and the new tip again
+            for replayed in range(start + 1, height):
+                self._apply(self.chain.transactions(replayed), self.chain.header(replayed)['miner'])
+            self.height = height - 1
+
+    def _apply(self, transactions: list, miner: Optional[str]):
+        fees = 0
+        for x in transactions:
+            self._balances[x['sender']] -= x['amount'] + x['fee']
+            self._balances[x['receiver']] += x['amount']
+            fees += x['fee']
+        if miner is not None:
+            self._balances[miner] += fees + self.block_reward
+
+    def transaction_added(self, transaction: Transaction):
+        """Called by the MemPool when a transaction is inserted."""
+        with self._lock:
+            self._pending[transaction.sender] += transaction.amount + transaction.fee
+
+    def transaction_removed(self, transaction: Transaction):
+        """Called by the MemPool when a transaction is removed, evicted or expires."""
+        with self._lock:
+            self._pending[transaction.sender] -= transaction.amount + transaction.fee
+            if abs(self._pending[transaction.sender]) < 1e-9:
+                del self._pending[transaction.sender]
+
+    def balance(self, address: str) -> float:
+        """
+        :param address: An address
+        :return: The balance of the address according to the blocks of the chain
+        """
+        return self._balances.get(address, 0)
+
+    def pending(self, address: str) -> float:
+        """
+        :param address: An address
+        :return: The amount and fees of the transactions of the address waiting in the MemPool
+        """
+        return self._pending.get(address, 0)
+
+    def spendable(self, address: str) -> float:
+        """
+        :param address: An address
+        :return: The balance of the address minus what its transactions waiting in the MemPool will spend
+        """
+        with self._lock:
+            return self.balance(address) - self.pending(address)
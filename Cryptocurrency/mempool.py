@@ -1,5 +1,11 @@
+import heapq
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import count
 from uuid import uuid4
-from typing import Union, List, Tuple
+from typing import Union, List
 
 
 # TODO: wallets
@@ -9,6 +15,9 @@ class Transaction:
     The Transaction class represents a transaction between two entities. Comparison is done value-wise. That is, the
     identity of the object does not matter only its contents.
 
+    Transactions keep their fields in slots instead of a __dict__ to use less memory, and are treated as immutable once
+    created: their canonical json serialization is computed the first time it is needed and reused after that.
+
     :param ID: An identifier used to differentiate transactions. Defaults to a random uuid4 with no dashes or spaces
     :param sender: Address of the node/client that is sending a payment.
     :param receiver: Address of the node/client that is receiving the payment.
@@ -17,12 +26,34 @@ class Transaction:
                 contains this transaction
     """
 
+    __slots__ = ('ID', 'sender', 'receiver', 'amount', 'fee', '_json')
+
     def __init__(self, sender, receiver, amount, fee, ID=str(uuid4()).replace('-', '')):
         self.ID = ID
         self.sender = sender
         self.receiver = receiver
         self.amount = amount
         self.fee = fee
+        self._json = None
+
+    @classmethod
+    def from_dict(cls, x: dict) -> 'Transaction':
+        """
+        :param x: The dictionary of a transaction, for example a transaction received from another node
+        :return: A Transaction object
+        """
+        return cls(x['sender'], x['receiver'], x['amount'], x['fee'], x['ID'])
+
+    def to_dict(self) -> dict:
+        return {'ID': self.ID, 'sender': self.sender, 'receiver': self.receiver, 'amount': self.amount, 'fee': self.fee}
+
+    def to_json(self) -> str:
+        """
+        :return: The canonical json serialization of the transaction, with sorted keys, computed once per transaction
+        """
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), sort_keys=True)
+        return self._json
 
     def __repr__(self):
         return f"{self.sender} sent {self.amount}$ to {self.receiver} for a fee of: {self.fee} --- ID: {self.ID}"
@@ -34,9 +65,10 @@ class Transaction:
         """
         Ensures that the equality of Transaction objects is defined by their actual values and not identity.
         :param other: another Transaction object
-        :return: True if the Transaction objects have the same __dict__ and False otherwise
+        :return: True if the Transaction objects have the same fields and False otherwise
         """
-        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and self.ID == other.ID and self.sender == other.sender and \
+            self.receiver == other.receiver and self.amount == other.amount and self.fee == other.fee
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -45,79 +77,213 @@ class Transaction:
 class MemPool:
     """
     The MemPool class is an object that represents the pool of transactions waiting to be verified by miners.
+    Transactions are kept in a dictionary keyed by their ID in order of arrival for constant time lookups and removals,
+    and in two heaps ordered by transaction fee: one to select the transactions with the greatest fees for blocks and
+    one to find the transaction with the lowest fee to evict when the MemPool is full. Removed transactions are left in
+    the heaps and skipped when they reach the top, the heaps are rebuilt once they hold too many of them. Every method
+    takes the lock of the MemPool, so request handlers, the gossip and the mining thread can use it at the same time.
 
     :param max_tran_per_block: The maximum number of transactions each block can contain.
     :param max_tran_per_MemPool: The maximum number of transactions each instance of the MemPool can hold. This is used
                                 to limit the amount of transaction each node keeps track of.
+    :param max_tran_per_sender: The maximum number of transactions a single sender can have in the MemPool. No limit if
+                                None.
+    :param max_age: The number of seconds after which a transaction that has not been verified expires. Transactions
+                    never expire if None.
+    :param eviction: What to evict when the MemPool is full. 'fee' evicts the transaction with the lowest fee if the new
+                     transaction pays a greater fee and 'age' evicts the oldest transaction.
     """
 
-    # TODO: Devise method of recording transaction history so that if collision occurs transactions that were verified
-    # TODO: but aren't anymore get moved
-
-    def __init__(self, max_tran_per_block, max_tran_per_MemPool):
-        # transactions ordered from greatest to least
-        self.unverified_transactions = []
+    def __init__(self, max_tran_per_block, max_tran_per_MemPool, max_tran_per_sender=None, max_age=None,
+                 eviction='fee'):
+        # transactions keyed by their ID in order of arrival
+        self.transactions = OrderedDict()
+        # (sequence, arrival time) of every transaction keyed by ID. A heap entry whose sequence does not match belongs
+        # to a removed transaction. The sequence also keeps transactions with the same fee in order of arrival
+        self._entries = {}
+        # (-fee, sequence, ID) entries, the top of the heap is the transaction with the greatest fee
+        self._heap = []
+        # (fee, sequence, ID) entries, the top of the heap is the transaction with the lowest fee
+        self._low_heap = []
+        self._sequence = count()
+        self._per_sender = Counter()
         # the maximum number of transactions that can be put into a block
         self.max_tran_per_block = max_tran_per_block
         # the maximum number of transactions that an instance of the MemPool can hold
         self.max_tran_per_MemPool = max_tran_per_MemPool
+        self.max_tran_per_sender = max_tran_per_sender
+        self.max_age = max_age
+        self.eviction = eviction
+        self.counters = {'admitted': 0, 'rejected': 0, 'evicted': 0, 'expired': 0}
+        # objects notified through transaction_added(transaction) and transaction_removed(transaction) whenever a
+        # transaction enters or leaves the MemPool. They are called while the lock of the MemPool is held
+        self.listeners = []
+        self._lock = threading.RLock()
 
-    def insert_single_transaction(self, transaction: Transaction) -> Tuple[int, int]:
+    def insert_single_transaction(self, transaction: Transaction) -> bool:
         """
-        Inserts a transaction in the unverified transaction list in its correct place in the order of greatest to least
-        transaction fee.
+        Inserts a transaction in the pool of unverified transactions in its correct place in the order of greatest to
+        least transaction fee. If the MemPool is full a transaction is evicted to make room according to the eviction
+        policy.
 
         :param transaction: A Transaction object
-        :return: False if the MemPool is full and the index where the transaction was inserted if successful
+        :return: True if the transaction was inserted and False if it is a duplicate, its sender has too many
+                 transactions in the MemPool or the MemPool is full and no transaction could be evicted for it
         """
-        if 1 + len(self.unverified_transactions) > self.max_tran_per_MemPool:
-            return -1, self.num_transactions
-        elif transaction not in self.unverified_transactions:
-            new_fee = transaction.fee
-            if self.unverified_transactions:
-                for i in range(len(self.unverified_transactions)):
-                    if new_fee >= self.unverified_transactions[i].fee:
-                        self.unverified_transactions.insert(i, transaction)
-                        return i, len(self.unverified_transactions)
-            else:
-                self.unverified_transactions.append(transaction)
-                return 0, len(self.unverified_transactions)
+        with self._lock:
+            if self.max_age is not None:
+                self.expire()
+            return self._admit(transaction)
 
-    def insert_multiple_transactions(self, transactions: List[Transaction]) -> Union[bool, int]:
+    def insert_multiple_transactions(self, transactions: List[Transaction]) -> List[bool]:
         """
-        Inserts a batch of Transaction objects and orders them by transaction fee.
+        Inserts a batch of Transaction objects and orders them by transaction fee. Each transaction is admitted or
+        rejected on its own so a batch of transactions with low fees cannot keep out transactions with greater fees.
+        Expired transactions are only removed once for the whole batch.
 
         :param transactions: a list of Transaction objects
-        :return: False if the MemPool is full and the number of unverified transactions if successful
+        :return: A list containing for every transaction True if it was inserted and False otherwise
         """
-        if len(transactions) + len(self.unverified_transactions) > self.max_tran_per_MemPool:
+        with self._lock:
+            if self.max_age is not None:
+                self.expire()
+            return [self._admit(x) for x in transactions]
+
+    def _admit(self, transaction: Transaction) -> bool:
+        if transaction.ID in self.transactions or (self.max_tran_per_sender is not None and
+                                                   self._per_sender[transaction.sender] >= self.max_tran_per_sender):
+            self.counters['rejected'] += 1
             return False
-        else:
-            self.unverified_transactions.extend(transactions)
-            self.unverified_transactions.sort(key=lambda x: x.fee, reverse=True)
-            return len(self.unverified_transactions)
+        if len(self.transactions) >= self.max_tran_per_MemPool and not self._evict_for(transaction):
+            self.counters['rejected'] += 1
+            return False
+        self._push(transaction)
+        self.counters['admitted'] += 1
+        return True
 
     def remove_transactions(self, transactions: Union[Transaction, List[Transaction]]) -> bool:
         """
         Removes one or several Transaction objects from the pool of unverified transactions kept in a nodes MemPool.
 
         :param transactions: Either one Transaction object or a list of Transaction objects
-        :return:
+        :return: True if at least one of the transactions was in the MemPool and False otherwise
         """
+        if not isinstance(transactions, list):
+            transactions = [transactions]
         removed = False
-        if isinstance(transactions, list):
+        with self._lock:
             for x in transactions:
-                if x in self.unverified_transactions:
-                    self.unverified_transactions.remove(x)
+                if x.ID in self.transactions:
+                    self._remove(x.ID)
                     removed = True
-        else:
-            if transactions in self.unverified_transactions:
-                self.unverified_transactions.remove(transactions)
         return removed
 
+    def expire(self) -> int:
+        """
+        Removes the transactions that have been waiting for longer than max_age. Only the oldest transactions are
+        visited since transactions are kept in order of arrival.
+        :return: The number of transactions that expired
+        """
+        if self.max_age is None:
+            return 0
+        deadline = time.monotonic() - self.max_age
+        expired = 0
+        with self._lock:
+            while self.transactions:
+                ID = next(iter(self.transactions))
+                if self._entries[ID][1] > deadline:
+                    break
+                self._remove(ID)
+                expired += 1
+            self.counters['expired'] += expired
+        return expired
+
     def get_top_transactions(self) -> List[Transaction]:
-        return self.unverified_transactions[:self.max_tran_per_block]
+        """
+        Pops the transactions with the greatest fees off the heap and pushes them back so that only the top of the heap
+        is visited.
+        :return: At most max_tran_per_block transactions ordered from greatest to least fee
+        """
+        with self._lock:
+            if self.max_age is not None:
+                self.expire()
+            top_entries = []
+            while self._heap and len(top_entries) < self.max_tran_per_block:
+                entry = heapq.heappop(self._heap)
+                # drops the entries of removed transactions
+                if self._is_current(entry):
+                    top_entries.append(entry)
+            for entry in top_entries:
+                heapq.heappush(self._heap, entry)
+            return [self.transactions[entry[2]] for entry in top_entries]
+
+    def _evict_for(self, transaction: Transaction) -> bool:
+        if self.eviction == 'age':
+            victim = next(iter(self.transactions))
+        else:
+            while not self._is_current(self._low_heap[0]):
+                heapq.heappop(self._low_heap)
+            lowest_fee, _, victim = self._low_heap[0]
+            if transaction.fee <= lowest_fee:
+                return False
+        self._remove(victim)
+        self.counters['evicted'] += 1
+        return True
+
+    def _is_current(self, entry: tuple) -> bool:
+        current = self._entries.get(entry[2])
+        return current is not None and current[0] == entry[1]
+
+    def _push(self, transaction: Transaction):
+        sequence = next(self._sequence)
+        self.transactions[transaction.ID] = transaction
+        self._entries[transaction.ID] = (sequence, time.monotonic())
+        self._per_sender[transaction.sender] += 1
+        heapq.heappush(self._heap, (-transaction.fee, sequence, transaction.ID))
+        heapq.heappush(self._low_heap, (transaction.fee, sequence, transaction.ID))
+        for listener in self.listeners:
+            listener.transaction_added(transaction)
+
+    def _remove(self, ID: str):
+        transaction = self.transactions.pop(ID)
+        del self._entries[ID]
+        self._per_sender[transaction.sender] -= 1
+        if not self._per_sender[transaction.sender]:
+            del self._per_sender[transaction.sender]
+        if len(self._heap) + len(self._low_heap) > 4 * len(self._entries) + 128:
+            self._rebuild_heaps()
+        for listener in self.listeners:
+            listener.transaction_removed(transaction)
+
+    def _rebuild_heaps(self):
+        self._heap = [(-x.fee, self._entries[ID][0], ID) for ID, x in self.transactions.items()]
+        self._low_heap = [(x.fee, self._entries[ID][0], ID) for ID, x in self.transactions.items()]
+        heapq.heapify(self._heap)
+        heapq.heapify(self._low_heap)
+
+    def __contains__(self, ID: str) -> bool:
+        return ID in self.transactions
+
+    def __len__(self) -> int:
+        return len(self.transactions)
+
+    @property
+    def unverified_transactions(self) -> List[Transaction]:
+        """All the transactions of the MemPool ordered from greatest to least fee."""
+        with self._lock:
+            return sorted(self.transactions.values(), key=lambda x: (-x.fee, self._entries[x.ID][0]))
+
+    @unverified_transactions.setter
+    def unverified_transactions(self, transactions: List[Transaction]):
+        with self._lock:
+            for ID in list(self.transactions):
+                self._remove(ID)
+            self._heap = []
+            self._low_heap = []
+            for transaction in transactions:
+                if transaction.ID not in self.transactions:
+                    self._push(transaction)
 
     @property
     def num_transactions(self):
-        return len(self.unverified_transactions)
+        return len(self.transactions)
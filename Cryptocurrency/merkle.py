@@ -0,0 +1,83 @@
+"""
+Merkle trees over the transactions of a block. A block commits to its transactions through the root of the tree so its
+header, and therefore its hash, has the same size whatever the number of transactions, and a transaction can be shown
+to be in a block with a proof of a logarithmic number of hashes instead of the whole block.
+
+Leaves and inner nodes are hashed with different prefixes so a leaf can never be passed off as an inner node, and a
+node without a sibling is moved up to the next level as it is instead of being paired with a copy of itself, so
+repeating the last transactions of a block does not give a list of transactions with the same root.
+"""
+import json
+from hashlib import sha256
+from typing import List
+
+# the root of a block without transactions
+EMPTY_ROOT = '0' * 64
+
+_LEAF = b'\x00'
+_NODE = b'\x01'
+
+
+def transaction_hash(transaction: dict) -> bytes:
+    """
+    :param transaction: The dictionary of a transaction
+    :return: The leaf hash of the transaction, the hash of its canonical json serialization
+    """
+    return sha256(_LEAF + json.dumps(transaction, sort_keys=True).encode()).digest()
+
+
+def _parent(left: bytes, right: bytes) -> bytes:
+    return sha256(_NODE + left + right).digest()
+
+
+def _next_level(level: List[bytes]) -> List[bytes]:
+    parents = [_parent(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        parents.append(level[-1])
+    return parents
+
+
+def merkle_root(transactions: List[dict]) -> str:
+    """
+    :param transactions: The dictionaries of the transactions of a block
+    :return: The hex root of the tree of the transactions
+    """
+    level = [transaction_hash(x) for x in transactions]
+    if not level:
+        return EMPTY_ROOT
+    while len(level) > 1:
+        level = _next_level(level)
+    return level[0].hex()
+
+
+def merkle_proof(transactions: List[dict], position: int) -> List[dict]:
+    """
+    :param transactions: The dictionaries of the transactions of a block
+    :param position: The position of the transaction to prove in the block
+    :return: The sibling of the transaction and of each of its ancestors that has one, from the leaves to the root, as
+             {'side': 'left' or 'right', 'hash': the hex hash of the sibling}
+    """
+    level = [transaction_hash(x) for x in transactions]
+    proof = []
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append({'side': 'left' if sibling < position else 'right', 'hash': level[sibling].hex()})
+        level = _next_level(level)
+        position //= 2
+    return proof
+
+
+def verify_proof(transaction: dict, proof: List[dict], root: str) -> bool:
+    """
+    Checks that a transaction is in a block knowing only the merkle root of the block, for example from its header.
+    :param transaction: The dictionary of the transaction
+    :param proof: The proof returned by merkle_proof
+    :param root: The hex merkle root of the block
+    :return: True if the proof links the transaction to the root and False otherwise
+    """
+    current = transaction_hash(transaction)
+    for step in proof:
+        sibling = bytes.fromhex(step['hash'])
+        current = _parent(sibling, current) if step['side'] == 'left' else _parent(current, sibling)
+    return current.hex() == root
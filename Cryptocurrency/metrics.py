@@ -0,0 +1,266 @@
+"""
+Metrics of a node exposed in the Prometheus text format. Counters and histograms are updated where the work happens,
+once per block mined, message sent, chain validated or request served and never once per nonce or transaction, and the
+values that the node already keeps, such as the size and counters of the MemPool, are only read when the metrics are
+scraped, so the hot paths pay nothing for them.
+"""
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# upper bounds in seconds of the buckets of the duration histograms
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _Buckets:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        # the number of observations of every bucket, the last one is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+
+class Metric:
+    """
+    A metric and its values for every combination of label values.
+
+    :param name: The name of the metric
+    :param documentation: The help text of the metric
+    :param labelnames: The names of the labels of the metric
+    :param function: An optional function returning the value of a metric without labels, called when the metric is
+                     scraped instead of updating the metric as the value changes
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 function: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._children[()] = self._child()
+
+    def _child(self):
+        return _Value()
+
+    def labels(self, *values):
+        """
+        :param values: The value of every label of the metric
+        :return: The value of the metric for the given label values
+        """
+        key = tuple(str(x) for x in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._child())
+        return child
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        """:return: The suffix, labels and value of every sample of the metric"""
+        if self.function is not None:
+            yield '', '', self.function()
+            return
+        for key, child in list(self._children.items()):
+            yield '', _labels(self.labelnames, key), child.value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{self.name}{suffix}{labels} {_format(value)}' for suffix, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up, such as a number of messages or bytes."""
+    kind = 'counter'
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+
+class Gauge(Metric):
+    """A value that goes up and down, such as the size of the MemPool."""
+    kind = 'gauge'
+
+    def set(self, value):
+        self._children[()].set(value)
+
+    def inc(self, amount=1):
+        self._children[()].inc(amount)
+
+
+class Histogram(Metric):
+    """
+    The distribution of observed values, such as durations, in buckets of fixed upper bounds.
+
+    :param buckets: The upper bounds of the buckets in increasing order
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self._children[()].observe(value)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        for key, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), list(child.counts)):
+                cumulative += count
+                yield '_bucket', _labels(self.labelnames + ('le',), key + (_format(bound),)), cumulative
+            yield '_sum', _labels(self.labelnames, key), child.sum
+            yield '_count', _labels(self.labelnames, key), cumulative
+
+
+class Summary(Metric):
+    """
+    Quantiles of a set of values computed when the metric is scraped.
+
+    :param function: A function returning the values
+    :param quantiles: The quantiles reported
+    """
+    kind = 'summary'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], List[float]],
+                 quantiles: Sequence[float] = (0.1, 0.5, 0.9, 0.99)):
+        self.quantiles = quantiles
+        super().__init__(name, documentation, function=function)
+
+    def samples(self) -> Iterator[Tuple[str, str, float]]:
+        values = sorted(self.function())
+        for q in self.quantiles:
+            value = values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+            yield '', _labels(('quantile',), (str(q),)), value
+        yield '_sum', '', sum(values)
+        yield '_count', '', len(values)
+
+
+class Registry:
+    """The metrics of a node, rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class NodeMetrics(Registry):
+    """
+    The metrics of a BlockChain: mining, the MemPool, the messages sent to the other nodes, chain validation and the
+    requests served by the API.
+
+    :param blockchain: The BlockChain whose state is read when the metrics are scraped
+    """
+
+    def __init__(self, blockchain):
+        super().__init__()
+        mempool = blockchain.MemPool
+        r = self.register
+
+        self.blocks_mined = r(Counter('quadkoin_blocks_mined_total', 'Blocks mined by this node.'))
+        self.nonces = r(Counter('quadkoin_nonces_total', 'Nonces tried by the proof of work of the mined blocks.'))
+        self.nonces_per_block = r(Histogram('quadkoin_nonces_per_block', 'Nonces tried to mine a block.',
+                                            buckets=tuple(16 ** x for x in range(1, 9))))
+        self.mining_seconds = r(Histogram('quadkoin_mining_seconds', 'Seconds taken to mine a block.'))
+        self.hash_rate = r(Gauge('quadkoin_hash_rate', 'Hashes per second of the proof of work of the last block.'))
+        r(Gauge('quadkoin_chain_height', 'Height of the tip of the chain.', function=lambda: len(blockchain.chain) - 1))
+        r(Gauge('quadkoin_chain_branches', 'Blocks kept in branches competing with the chain.',
+                function=lambda: len(blockchain.tree)))
+        r(Gauge('quadkoin_orphan_blocks', 'Blocks waiting for their parent.', function=lambda: blockchain.tree.orphans))
+
+        r(Gauge('quadkoin_mempool_transactions', 'Transactions in the MemPool.', function=lambda: len(mempool)))
+        for event in ('admitted', 'rejected', 'evicted', 'expired'):
+            r(Counter(f'quadkoin_mempool_{event}_total', f'Transactions {event} by the MemPool.',
+                      function=lambda event=event: mempool.counters[event]))
+        r(Summary('quadkoin_mempool_fee', 'Fees of the transactions in the MemPool.',
+                  function=lambda: [x.fee for x in list(mempool.transactions.values())]))
+
+        self.messages = r(Counter('quadkoin_messages_sent_total', 'Messages sent to other nodes.', ('peer', 'route')))
+        self.message_failures = r(Counter('quadkoin_message_failures_total', 'Messages that did not reach a node.',
+                                          ('peer', 'route')))
+        self.bytes_sent = r(Counter('quadkoin_bytes_sent_total', 'Bytes of the bodies sent to other nodes.', ('peer',)))
+        self.message_seconds = r(Histogram('quadkoin_message_seconds', 'Seconds taken by another node to answer.',
+                                           ('peer',)))
+        r(Gauge('quadkoin_gossip_backlog', 'Items waiting to be gossiped.', function=lambda: blockchain.gossip.backlog))
+
+        self.validation_seconds = r(Histogram('quadkoin_validate_chain_seconds', 'Seconds taken to validate a chain.'))
+        self.compare_seconds = r(Histogram('quadkoin_compare_chains_seconds',
+                                           'Seconds taken to compare the chain with the other nodes.'))
+        self.request_seconds = r(Histogram('quadkoin_http_request_seconds', 'Seconds taken to serve a request.',
+                                           ('route', 'method')))
+
+    def block_mined(self, nonces: int, seconds: float):
+        self.blocks_mined.inc()
+        self.nonces.inc(nonces)
+        self.nonces_per_block.observe(nonces)
+        self.mining_seconds.observe(seconds)
+        if seconds > 0:
+            self.hash_rate.set(nonces / seconds)
+
+    def message_sent(self, peer: str, route: str, seconds: float, size: int):
+        self.messages.labels(peer, route).inc()
+        self.bytes_sent.labels(peer).inc(size)
+        self.message_seconds.labels(peer).observe(seconds)
+
+    def message_failed(self, peer: str, route: str):
+        self.message_failures.labels(peer, route).inc()
@@ -0,0 +1,295 @@
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from hashlib import sha256
+from typing import Optional, Tuple
+from uuid import uuid4
+
+# cancellation event shared with the worker processes of a Miner. Set by the initializer of every worker process.
+_worker_cancel = None
+
+
+def search_nonce(header: bytes, difficulty: int, start: int = 0, stop: Optional[int] = None, cancel=None,
+                 batch_size: int = 10000, progress=None) -> Optional[Tuple[int, str]]:
+    """
+    Searches for a nonce that gives a hash with the required number of leading 0's. The header of the block is hashed
+    once into a sha256 midstate and only the nonce is hashed on top of a copy of that midstate for every attempt. The
+    hashes produced are identical to Block.compute_hash() so they are accepted by BlockChain.check_proof().
+
+    :param header: The serialized block without its nonce as returned by Block.header_bytes()
+    :param difficulty: The number of required leading 0's
+    :param start: The first nonce to try
+    :param stop: The nonce at which to stop searching (exclusive). Searches forever if None
+    :param cancel: An optional Event. The search stops if it is set. It is checked once every batch_size nonces
+    :param batch_size: The number of nonces tried between two checks of cancel
+    :param progress: An optional function called with the number of nonces tried after every batch
+    :return: A tuple of the nonce and the hash if a valid nonce was found in the range and None otherwise
+    """
+    target = '0' * difficulty
+    midstate = sha256(header)
+    batch_start = start
+    while stop is None or batch_start < stop:
+        if cancel is not None and cancel.is_set():
+            return None
+        batch_stop = batch_start + batch_size if stop is None else min(stop, batch_start + batch_size)
+        for nonce in range(batch_start, batch_stop):
+            attempt = midstate.copy()
+            attempt.update(str(nonce).encode())
+            computed_hash = attempt.hexdigest()
+            if computed_hash.startswith(target):
+                if progress is not None:
+                    progress(nonce - batch_start + 1)
+                return nonce, computed_hash
+        if progress is not None:
+            progress(batch_stop - batch_start)
+        batch_start = batch_stop
+    return None
+
+
+def _init_worker(cancel):
+    global _worker_cancel
+    _worker_cancel = cancel
+
+
+def _search_chunk(header: bytes, difficulty: int, start: int, stop: int) -> Tuple[Optional[Tuple[int, str]], int]:
+    # the number of nonces tried is returned along with the result since a chunk can be stopped before its end
+    batches = []
+    found = search_nonce(header, difficulty, start, stop, _worker_cancel, progress=batches.append)
+    return found, sum(batches)
+
+
+class Miner:
+    """
+    Runs the proof of work search for a block header. With a single worker the search runs in the calling thread and
+    with several workers the nonce space is split into chunks that are handed out to a pool of worker processes. As soon
+    as one worker finds a valid hash and the chunks before it are searched, all the other workers are stopped, so the
+    nonce found is the first valid one whatever the number of workers. A search can also be aborted from another
+    thread, for example when a competing block replaces the tip of the chain.
+
+    :param workers: The number of processes used to mine. 1 mines in the calling thread
+    :param chunk_size: The number of nonces handed to a worker process at a time
+    """
+
+    def __init__(self, workers=1, chunk_size=100000):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._cancel = multiprocessing.Event() if workers > 1 else threading.Event()
+        self._pool = None
+        # the number of hashes computed by the last search, including the chunks stopped before their end
+        self.hashes = 0
+
+    def search(self, header: bytes, difficulty: int, start: int = 0, stop: Optional[int] = None,
+               progress=None) -> Optional[Tuple[int, str]]:
+        """
+        Searches for a valid nonce for the given header.
+        :param header: The serialized block without its nonce as returned by Block.header_bytes()
+        :param difficulty: The number of required leading 0's
+        :param start: The first nonce to try
+        :param stop: The nonce at which to stop searching (exclusive). Searches until a nonce is found if None
+        :param progress: An optional function called with the number of nonces tried every time a batch or chunk of
+                         nonces has been searched
+        :return: A tuple of the nonce and the hash or None if the search was aborted or the range was exhausted. The
+                 number of hashes computed by the search is then in hashes
+        """
+        self.hashes = 0
+        try:
+            if self.workers == 1:
+                return search_nonce(header, difficulty, start, stop, self._cancel, progress=self._counter(progress))
+            return self._search_parallel(header, difficulty, start, stop, progress)
+        finally:
+            # an abort only stops the search it arrived before or during, the next search is not stopped by it
+            self._cancel.clear()
+
+    def _counter(self, progress):
+        def count(nonces: int):
+            self.hashes += nonces
+            if progress is not None:
+                progress(nonces)
+        return count
+
+    def _search_parallel(self, header, difficulty, start, stop, progress):
+        # maps every chunk being searched to the range of nonces it covers
+        pending = {}
+        next_start = start
+
+        def submit():
+            nonlocal next_start
+            if stop is not None and next_start >= stop:
+                return
+            chunk_stop = next_start + self.chunk_size if stop is None else min(stop, next_start + self.chunk_size)
+            future = self.pool.submit(_search_chunk, header, difficulty, next_start, chunk_stop)
+            pending[future] = (next_start, chunk_stop)
+            next_start = chunk_stop
+
+        # keep one chunk queued per worker so no worker waits for the parent between two chunks
+        for _ in range(2 * self.workers):
+            submit()
+
+        result = None
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk_start, chunk_stop = pending.pop(future)
+                    found, hashes = future.result()
+                    self.hashes += hashes
+                    if progress is not None and not self._cancel.is_set():
+                        progress((found[0] + 1 if found else chunk_stop) - chunk_start)
+                    if found is not None and (result is None or found[0] < result[0]):
+                        result = found
+                if result is None:
+                    if not self._cancel.is_set():
+                        for _ in done:
+                            submit()
+                # the chunks before the nonce found are searched to the end so the search returns the first valid
+                # nonce, the same one a search in a single process finds
+                elif all(chunk_start > result[0] for chunk_start, _ in pending.values()):
+                    break
+        finally:
+            # stops the workers that are still searching a chunk
+            self._cancel.set()
+            for future in pending:
+                future.cancel()
+            wait(pending)
+            self.hashes += sum(x.result()[1] for x in pending if not x.cancelled() and x.exception() is None)
+        return result
+
+    def reset(self):
+        """
+        Forgets an abort requested while no search was running. Called before reading the state a block is mined on, so
+        that an abort arriving between that point and the start of the search still stops the search.
+        """
+        self._cancel.clear()
+
+    def abort(self):
+        """
+        Stops the search currently running, or the next one to start if none is running until reset is called. The
+        search then returns None.
+        """
+        self._cancel.set()
+
+    def close(self):
+        """Shuts down the worker processes if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self._cancel,))
+        return self._pool
+
+
+class MiningJob:
+    """
+    A request to mine the next block handled in the background by a MiningScheduler.
+
+    :param ID: An identifier used to look up the job. Defaults to a random uuid4 with no dashes
+    """
+
+    def __init__(self, ID=None):
+        self.ID = ID or uuid4().hex
+        # queued, running, mined, aborted or failed
+        self.status = 'queued'
+        self.nonces = 0
+        self.started = None
+        self.finished = None
+        self.block = None
+
+    def add_progress(self, nonces: int):
+        self.nonces += nonces
+
+    @property
+    def hash_rate(self) -> float:
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.nonces / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status not in ('queued', 'running')
+
+    def to_dict(self) -> dict:
+        return {'ID': self.ID, 'status': self.status, 'nonces': self.nonces, 'hash_rate': self.hash_rate,
+                'block': self.block.to_dict() if self.block is not None else None}
+
+
+class MiningScheduler:
+    """
+    Mines blocks on a background thread so that mining does not block the thread that requested it. Jobs are mined one
+    after the other, each one mining the block that follows the tip of the chain at the time the job starts.
+
+    :param blockchain: The BlockChain whose mine() method is called for every job
+    :param max_jobs: The number of finished jobs remembered so their status can still be looked up
+    """
+
+    def __init__(self, blockchain, max_jobs=100):
+        self.blockchain = blockchain
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self) -> MiningJob:
+        """
+        Queues a new mining job and starts the background thread if it is not running yet.
+        :return: The MiningJob that was queued
+        """
+        job = MiningJob()
+        with self._lock:
+            self.jobs[job.ID] = job
+            self._forget_finished()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='mining-scheduler', daemon=True)
+                self._thread.start()
+        self._queue.put(job)
+        return job
+
+    def get(self, ID: str) -> Optional[MiningJob]:
+        return self.jobs.get(ID)
+
+    def _forget_finished(self):
+        for ID in [ID for ID, job in self.jobs.items() if job.done][:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[ID]
+
+    def close(self):
+        """
+        Aborts the job being mined and the jobs still queued, and waits for the background thread to stop. A job
+        submitted afterwards starts the thread again.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            job.status = 'aborted'
+        # the sentinel stops the thread once the running job returns
+        self._queue.put(None)
+        self.blockchain.miner.abort()
+        thread.join()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job.status = 'running'
+            job.started = time.monotonic()
+            try:
+                job.block = self.blockchain.mine(progress=job.add_progress)
+                job.status = 'mined' if job.block is not None else 'aborted'
+            except Exception:
+                logging.exception(f"Mining job {job.ID} failed")
+                job.status = 'failed'
+            job.finished = time.monotonic()
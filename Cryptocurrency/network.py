@@ -1,15 +1,30 @@
 import requests
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional
 from uuid import uuid4
 import logging
+import threading
 
 
 class Node:
 
+    __slots__ = ('path', 'port', 'address')
+
     def __init__(self, path='127.0.0.1', port='50000', address=str(uuid4()).replace('-', '')):
         self.path = path
         self.port = port
         self.address = address
 
+    @classmethod
+    def from_dict(cls, x: dict) -> 'Node':
+        return cls(x['path'], x['port'], x['address'])
+
+    def to_dict(self) -> dict:
+        return {'path': self.path, 'port': self.port, 'address': self.address}
+
     @property
     def full_url(self):
         return 'http://' + self.path + ':' + self.port
@@ -21,7 +36,7 @@ class Node:
         return f"Node url: {self.full_url}\nNode Address: {self.address}"
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.__dict__ == other.__dict__
+        return isinstance(other, self.__class__) and self.to_dict() == other.to_dict()
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -36,12 +51,24 @@ class Network:
     facing side of the client
     :param nodes: A list of Node objects. If nodes are passed then the nodes in the list will automatically be added to
     the network and will therefore be connected to the current_node.
+    :param timeout: The number of seconds to wait for a node to answer before giving up on it
+    :param max_workers: The maximum number of nodes that are sent a message at the same time
     """
 
-    def __init__(self, current_node, nodes):
+    def __init__(self, current_node, nodes, timeout=5, max_workers=16):
         self.current_node = current_node
         self.nodes = nodes
         self.connected = False
+        self.timeout = timeout
+        # one session per node so the connection to every node is kept alive between messages
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+        # an optional requests transport adapter the sessions send through instead of HTTP, for example to simulate a
+        # network of nodes in a single process
+        self.transport = None
+        # optional NodeMetrics recording the latency, failures and bytes of the messages sent to every node
+        self.metrics = None
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='broadcast')
 
     def __repr__(self):
         print(self.current_node)
@@ -60,7 +87,7 @@ class Network:
         if node not in self.nodes:
             self.nodes.append(node)
             # propagates the new node to all of this networks connected nodes
-            self.broadcast({'node': node.__dict__}, 'add_node')
+            self.broadcast({'node': node.to_dict()}, 'add_node')
             return True
         else:
             # propagation from node to node stops if the node is already in this network (it has already propagated
@@ -75,17 +102,223 @@ class Network:
         :return: N/A
         """
         # TODO: Make the nodes return their networks so the current node gets greater reach
-        payload = {'node': self.current_node.__dict__}
+        payload = {'node': self.current_node.to_dict()}
         self.broadcast(payload, 'add_node')
         self.connected = True
 
-    def broadcast(self, payload: dict, link: str):
-        for node in self.nodes:
-            try:
-                requests.post(f"{node.full_url}/{link}", json=payload)
-            except Exception as error:
-                logging.warning(f"{node} not online -- could not broadcast to this node")
-                print(error)
+    def broadcast(self, payload: dict, link: str) -> Dict[str, Optional[int]]:
+        """
+        Sends a payload to all the nodes of this network at the same time. A node that does not answer within the
+        timeout does not delay the other nodes.
+        :param payload: The json payload to post
+        :param link: The route of the other nodes to post the payload to
+        :return: The status code of the response of every node keyed by the url of the node, None if the node could not
+                 be reached
+        """
+        nodes = list(self.nodes)
+        futures = [self.executor.submit(self.post, node, link, payload) for node in nodes]
+        return {node.full_url: future.result() for node, future in zip(nodes, futures)}
+
+    def post(self, node: Node, link: str, payload: dict) -> Optional[int]:
+        """
+        Posts a payload to a single node through the session kept for that node.
+        :return: The status code of the response or None if the node could not be reached
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session(node).post(f"{node.full_url}/{link.lstrip('/')}", json=payload,
+                                               timeout=self.timeout)
+        except requests.RequestException as error:
+            if self.metrics is not None:
+                self.metrics.message_failed(node.full_url, link)
+            logging.warning(f"{node} not online -- could not broadcast to this node: {error}")
+            return None
+        if self.metrics is not None:
+            size = len(response.request.body or b'')
+            self.metrics.message_sent(node.full_url, link, time.perf_counter() - start, size)
+        return response.status_code
+
+    def session(self, node: Node) -> requests.Session:
+        with self._sessions_lock:
+            session = self._sessions.get(node.full_url)
+            if session is None:
+                session = requests.Session()
+                session.mount('http://', self.transport or HTTPAdapter(pool_connections=1, pool_maxsize=4))
+                self._sessions[node.full_url] = session
+            return session
+
     @property
     def num_nodes(self) -> int:
         return len(self.nodes)
+
+
+class GossipQueue:
+    """
+    Queues the messages sent to the other nodes of a Network instead of sending them right away. Items queued for the
+    same route of the same node are coalesced into a single message holding a list of items, which is sent once the
+    node has max_batch items waiting or flush_interval seconds have passed. Messages are sent by a background thread so
+    queueing never waits on the network, and a node is sent one message at a time so items arrive in order.
+
+    The number of items waiting for every node is bounded by max_backlog. When a node falls behind either its oldest
+    items are dropped to make room or, without drop_oldest, new items are refused so the caller can slow down.
+
+    :param network: The Network whose nodes the messages are sent to
+    :param max_batch: The maximum number of items sent in a single message
+    :param flush_interval: The maximum number of seconds an item waits before being sent
+    :param max_backlog: The maximum number of items waiting to be sent to a single node
+    :param drop_oldest: Whether to drop the oldest items of a node or refuse new items when its backlog is full
+    """
+
+    def __init__(self, network: Network, max_batch=500, flush_interval=0.1, max_backlog=10000, drop_oldest=True):
+        self.network = network
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_backlog = max_backlog
+        self.drop_oldest = drop_oldest
+        self.dropped = 0
+        # url -> {route: (payload key, deque of items, extra fields)} in the order the routes were first used
+        self._pending = {}
+        self._sizes = {}
+        self._nodes = {}
+        # urls of the nodes a message is currently being sent to
+        self._busy = set()
+        # number of callers of flush() waiting for the queues to be empty
+        self._flushing = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def enqueue(self, link: str, items: list, key: str = 'transactions', extra: dict = None) -> bool:
+        """
+        Queues items to be sent to every node of the network.
+        :param link: The route of the other nodes the items are posted to
+        :param items: The items to send. They are sent as {key: [items...]}
+        :param key: The key of the payload holding the list of items
+        :param extra: Fields added to every message sent to the route, such as the node the items come from
+        :return: False if a node refused the items because its backlog is full and True otherwise
+        """
+        accepted = True
+        with self._condition:
+            for node in self.network.nodes:
+                url = node.full_url
+                size = self._sizes.get(url, 0)
+                if size + len(items) > self.max_backlog:
+                    if not self.drop_oldest:
+                        accepted = False
+                        continue
+                    self._drop(url, size + len(items) - self.max_backlog)
+                self._nodes[url] = node
+                self._pending.setdefault(url, {}).setdefault(link, (key, deque(), extra or {}))[1].extend(items)
+                self._sizes[url] = self._sizes.get(url, 0) + len(items)
+                if self._sizes[url] >= self.max_batch:
+                    self._condition.notify()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='gossip', daemon=True)
+                self._thread.start()
+        return accepted
+
+    def _drop(self, url: str, count: int):
+        for _, queue, _ in self._pending.get(url, {}).values():
+            while queue and count:
+                queue.popleft()
+                self._sizes[url] -= 1
+                self.dropped += 1
+                count -= 1
+
+    def _take(self, url: str) -> list:
+        """Takes at most max_batch items of every route of a node. Called with the condition held."""
+        batches = []
+        for link, (key, queue, extra) in self._pending[url].items():
+            items = [queue.popleft() for _ in range(min(self.max_batch, len(queue)))]
+            if items:
+                batches.append((link, key, items, extra))
+                self._sizes[url] -= len(items)
+        return batches
+
+    def _run(self):
+        while True:
+            with self._condition:
+                ready = self._ready()
+                # waits for the time window to pass unless a batch is full or a caller is waiting on flush()
+                if not ready or (not self._flushing and all(self._sizes[url] < self.max_batch for url in ready)):
+                    self._condition.wait(self.flush_interval)
+                    ready = self._ready()
+                for url in ready:
+                    self._busy.add(url)
+                    self.network.executor.submit(self._send, self._nodes[url], self._take(url))
+
+    def _ready(self) -> list:
+        return [url for url, size in self._sizes.items() if size and url not in self._busy]
+
+    def _send(self, node: Node, batches: list):
+        try:
+            for link, key, items, extra in batches:
+                self.network.post(node, link, {key: items, **extra})
+        finally:
+            with self._condition:
+                self._busy.discard(node.full_url)
+                self._condition.notify_all()
+
+    def flush(self, timeout: float = None):
+        """
+        Waits until every queued item has been sent.
+        :param timeout: The maximum number of seconds to wait. Waits as long as needed if None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._flushing += 1
+            try:
+                while any(self._sizes.values()) or self._busy:
+                    self._condition.notify_all()
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            finally:
+                self._flushing -= 1
+
+    @property
+    def backlog(self) -> int:
+        return sum(self._sizes.values())
+
+
+class SeenCache:
+    """
+    A bounded set of the IDs of the transactions and blocks a node has already seen, used to ignore announcements of
+    items the node already has or is already fetching. Once max_size IDs are kept the least recently seen ID is evicted,
+    so an item announced again long after it was evicted is requested again and then ignored by the MemPool or chain.
+
+    :param max_size: The maximum number of IDs kept
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.evicted = 0
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, ID: str) -> bool:
+        """
+        Marks an ID as seen.
+        :param ID: The ID of a transaction or the hash of a block
+        :return: True if the ID had not been seen and False otherwise
+        """
+        with self._lock:
+            if ID in self._ids:
+                self._ids.move_to_end(ID)
+                return False
+            self._ids[ID] = None
+            if len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+                self.evicted += 1
+            return True
+
+    def discard(self, ID: str):
+        """Forgets an ID, for instance when fetching the item failed, so the next announcement of it is not ignored."""
+        with self._lock:
+            self._ids.pop(ID, None)
+
+    def __contains__(self, ID: str) -> bool:
+        return ID in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
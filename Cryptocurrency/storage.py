@@ -0,0 +1,264 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from typing import Iterator, Optional, Tuple
+
+# every record of the segment file starts with the length of the header and body of its block and the crc32 of both
+RECORD_HEADER = struct.Struct('>III')
+# every entry of the index file holds the offset and length of a record of the segment file and the hash of its block
+INDEX_ENTRY = struct.Struct('>QI32s')
+
+
+class BlockStore:
+    """
+    An append-only store of serialized blocks on disk. Blocks are appended as records to a segment file and the offset
+    of every record is kept in an index file of fixed width entries, so the entry of a block is found from its height
+    without reading the segment. The index file is memory-mapped when the store is opened instead of being read. Every
+    record holds the header of the block, which is every field but the transactions, before its body, which is the list
+    of transactions, so headers can be read without reading the bodies.
+
+    Records are written to the segment before their entry is written to the index and both files are only synced once
+    every sync_every appends. When the store is opened after a crash, index entries pointing to incomplete or corrupt
+    records are dropped, complete records missing from the index are indexed again and anything after the last
+    complete record is truncated.
+
+    :param path: The directory where the segment and index files are kept. Created if it does not exist
+    :param sync_every: The number of appends after which both files are synced to disk
+    """
+
+    def __init__(self, path: str, sync_every=100):
+        os.makedirs(path, exist_ok=True)
+        self.segment_path = os.path.join(path, 'blocks.dat')
+        self.index_path = os.path.join(path, 'blocks.idx')
+        self.sync_every = sync_every
+        self._unsynced = 0
+        # hash -> height, built from the index the first time a block is looked up by hash
+        self._heights = None
+
+        for file_path in (self.segment_path, self.index_path):
+            if not os.path.exists(file_path):
+                open(file_path, 'wb').close()
+        self._segment = open(self.segment_path, 'r+b')
+        self._index = open(self.index_path, 'r+b')
+        self._recover()
+        self._map_index()
+
+    def _recover(self):
+        segment_size = os.fstat(self._segment.fileno()).st_size
+        count = os.fstat(self._index.fileno()).st_size // INDEX_ENTRY.size
+
+        # drops the entries of records that were not completely written
+        end = 0
+        while count:
+            self._index.seek((count - 1) * INDEX_ENTRY.size)
+            offset, length, _ = INDEX_ENTRY.unpack(self._index.read(INDEX_ENTRY.size))
+            if offset + RECORD_HEADER.size + length <= segment_size and self._read_record(offset) is not None:
+                end = offset + RECORD_HEADER.size + length
+                break
+            count -= 1
+        self._index.truncate(count * INDEX_ENTRY.size)
+
+        # indexes the complete records written after the last entry of the index
+        self._index.seek(0, os.SEEK_END)
+        while end + RECORD_HEADER.size <= segment_size:
+            record = self._read_record(end)
+            if record is None:
+                break
+            length = len(record[0]) + len(record[1])
+            self._index.write(INDEX_ENTRY.pack(end, length, bytes.fromhex(json.loads(record[0])['hash'])))
+            end += RECORD_HEADER.size + length
+        self._segment.truncate(end)
+        self._sync()
+
+    def _read_record(self, offset: int) -> Optional[Tuple[bytes, bytes]]:
+        self._segment.seek(offset)
+        record_header = self._segment.read(RECORD_HEADER.size)
+        if len(record_header) < RECORD_HEADER.size:
+            return None
+        header_length, body_length, checksum = RECORD_HEADER.unpack(record_header)
+        payload = self._segment.read(header_length + body_length)
+        if len(payload) < header_length + body_length or zlib.crc32(payload) != checksum:
+            return None
+        return payload[:header_length], payload[header_length:]
+
+    def _map_index(self):
+        self._mapped_count = os.fstat(self._index.fileno()).st_size // INDEX_ENTRY.size
+        self._map = mmap.mmap(self._index.fileno(), 0, access=mmap.ACCESS_READ) if self._mapped_count else None
+        # entries appended since the index was mapped
+        self._tail = bytearray()
+
+    def _entry(self, height: int) -> tuple:
+        if height < self._mapped_count:
+            return INDEX_ENTRY.unpack_from(self._map, height * INDEX_ENTRY.size)
+        return INDEX_ENTRY.unpack_from(self._tail, (height - self._mapped_count) * INDEX_ENTRY.size)
+
+    def append(self, block: dict) -> int:
+        """
+        Appends a block to the end of the store.
+        :param block: The dictionary of a block including its hash
+        :return: The height of the block
+        """
+        header = json.dumps({k: v for k, v in block.items() if k != 'transactions'}, separators=(',', ':')).encode()
+        body = json.dumps(block['transactions'], separators=(',', ':')).encode()
+        payload = header + body
+        self._segment.seek(0, os.SEEK_END)
+        offset = self._segment.tell()
+        self._segment.write(RECORD_HEADER.pack(len(header), len(body), zlib.crc32(payload)) + payload)
+        entry = INDEX_ENTRY.pack(offset, len(payload), bytes.fromhex(block['hash']))
+        self._index.seek(0, os.SEEK_END)
+        self._index.write(entry)
+        self._tail += entry
+
+        height = len(self) - 1
+        if self._heights is not None:
+            self._heights[block['hash']] = height
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self._sync()
+        return height
+
+    def get(self, height: int) -> dict:
+        """
+        :param height: The height of the block. Negative heights count from the tip
+        :return: The dictionary of the block at the given height
+        """
+        header, body = self._read(height, True)
+        block = json.loads(header)
+        block['transactions'] = json.loads(body)
+        return block
+
+    def get_header(self, height: int) -> dict:
+        """
+        :param height: The height of the block. Negative heights count from the tip
+        :return: The dictionary of the block at the given height without its transactions
+        """
+        return json.loads(self._read(height, False)[0])
+
+    def get_body(self, height: int) -> list:
+        """
+        :param height: The height of the block. Negative heights count from the tip
+        :return: The transactions of the block at the given height
+        """
+        return json.loads(self._read(height, True)[1])
+
+    def _read(self, height: int, with_body: bool) -> Tuple[bytes, bytes]:
+        if height < 0:
+            height += len(self)
+        if not 0 <= height < len(self):
+            raise IndexError('block height out of range')
+        offset = self._entry(height)[0]
+        self._segment.seek(offset)
+        header_length, body_length, _ = RECORD_HEADER.unpack(self._segment.read(RECORD_HEADER.size))
+        if with_body:
+            payload = self._segment.read(header_length + body_length)
+            return payload[:header_length], payload[header_length:]
+        return self._segment.read(header_length), b''
+
+    def hash_at(self, height: int) -> str:
+        """Reads the hash of the block at the given height from the index without reading the block."""
+        return self._entry(height)[2].hex()
+
+    def hashes(self) -> bytes:
+        """
+        Reads the hash of every block from the index without reading the segment.
+        :return: The 32 byte hashes of the blocks from the genesis block to the tip, concatenated
+        """
+        entries = (self._map[:self._mapped_count * INDEX_ENTRY.size] if self._map is not None else b'') + self._tail
+        # the hash is the last field of every fixed width entry
+        start = INDEX_ENTRY.size - 32
+        return b''.join(entries[i + start:i + INDEX_ENTRY.size] for i in range(0, len(entries), INDEX_ENTRY.size))
+
+    def height_of(self, block_hash: str) -> Optional[int]:
+        """
+        :param block_hash: The hash of a block
+        :return: The height of the block with the given hash or None if it is not in the store
+        """
+        if self._heights is None:
+            self._heights = {self.hash_at(i): i for i in range(len(self))}
+        return self._heights.get(block_hash)
+
+    def iterate(self, start: int = 0) -> Iterator[dict]:
+        """Reads the blocks sequentially from the given height to the tip."""
+        for height in range(start, len(self)):
+            yield self.get(height)
+
+    def iterate_headers(self, start: int = 0) -> Iterator[dict]:
+        """Reads the headers of the blocks sequentially from the given height to the tip without their bodies."""
+        for height in range(start, len(self)):
+            yield self.get_header(height)
+
+    def truncate(self, height: int):
+        """
+        Removes every block from the given height to the tip.
+        :param height: The height of the first block to remove
+        """
+        if height >= len(self):
+            return
+        offset = self._entry(height)[0]
+        if self._map is not None:
+            self._map.close()
+        self._index.truncate(height * INDEX_ENTRY.size)
+        self._segment.truncate(offset)
+        self._sync()
+        self._map_index()
+        self._heights = None
+
+    def _sync(self):
+        # the segment is synced first so the index never points to records that are not on disk
+        for file in (self._segment, self._index):
+            file.flush()
+            os.fsync(file.fileno())
+        self._unsynced = 0
+
+    def flush(self):
+        """Syncs the appends that have not been synced yet."""
+        if self._unsynced:
+            self._sync()
+
+    def close(self):
+        self.flush()
+        if self._map is not None:
+            self._map.close()
+        self._segment.close()
+        self._index.close()
+
+    def __len__(self) -> int:
+        return self._mapped_count + len(self._tail) // INDEX_ENTRY.size
+
+
+def save_snapshot(path: str, chain, height: int, data: dict):
+    """
+    Writes the state of an index of a chain, such as balances, as json so it is not rebuilt from every block when the
+    node restarts. The file is replaced atomically so a crash leaves either the old or the new snapshot.
+    :param path: The path of the snapshot file
+    :param chain: The Chain the state was computed from
+    :param height: The height of the last block applied to the state
+    :param data: The state
+    """
+    snapshot = {'height': height, 'hash': chain.hash_at(height) if height >= 0 else None, 'data': data}
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def load_snapshot(path: str, chain) -> Optional[Tuple[int, dict]]:
+    """
+    :param path: The path of a file written by save_snapshot
+    :param chain: The Chain the state is for
+    :return: The height of the last block applied to the state and the state, or None if there is no snapshot or the
+             block it was taken at is no longer in the chain
+    """
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    height = snapshot.get('height')
+    if not isinstance(height, int) or not 0 <= height < len(chain) or chain.hash_at(height) != snapshot.get('hash'):
+        return None
+    return height, snapshot['data']
@@ -0,0 +1,139 @@
+import heapq
+import threading
+from itertools import count
+from typing import List, Tuple
+
+from .mempool import MemPool, Transaction
+
+
+class BlockTemplate:
+    """
+    Keeps the transactions of the next block to mine up to date as transactions enter and leave the MemPool so that
+    starting to mine does not require going through the MemPool. Transactions are packed greedily by fee per byte of
+    their json serialization until the block is full. The template registers itself as a listener of the MemPool.
+
+    Every transaction of the MemPool is either selected for the block or a candidate. Candidates are kept in a heap
+    ordered from greatest to least fee per byte and selected transactions in a heap ordered from least to greatest fee
+    per byte so that a new transaction with a better fee per byte can take the place of the worst selected ones.
+
+    :param mempool: The MemPool the transactions are taken from
+    :param max_block_bytes: The maximum number of bytes the serialized transactions of a block can take
+    :param max_skipped: The number of candidates too big for the space left that are skipped before filling stops
+    """
+
+    def __init__(self, mempool: MemPool, max_block_bytes=1000000, max_skipped=100):
+        self.max_block_bytes = max_block_bytes
+        self.max_skipped = max_skipped
+        self.size = 0
+        # [fee per byte, sequence, transaction, size, serialized transaction] keyed by transaction ID
+        self._records = {}
+        # IDs of the selected transactions
+        self._selected = set()
+        # (-fee per byte, sequence, ID) of the candidates
+        self._candidates = []
+        # (fee per byte, sequence, ID) of the selected transactions
+        self._selected_heap = []
+        self._sequence = count()
+        self._needs_fill = False
+        self._block = None
+        self._lock = threading.Lock()
+
+        mempool.listeners.append(self)
+        for transaction in mempool.transactions.values():
+            self.transaction_added(transaction)
+
+    def transaction_added(self, transaction: Transaction):
+        """Called by the MemPool when a transaction is inserted."""
+        serialized = transaction.to_dict()
+        size = len(transaction.to_json())
+        record = [transaction.fee / size, next(self._sequence), transaction, size, serialized]
+        with self._lock:
+            self._records[transaction.ID] = record
+            if self._needs_fill or not self._make_room(record):
+                heapq.heappush(self._candidates, (-record[0], record[1], transaction.ID))
+            else:
+                self._select(record)
+
+    def transaction_removed(self, transaction: Transaction):
+        """Called by the MemPool when a transaction is removed, evicted or expires."""
+        with self._lock:
+            record = self._records.pop(transaction.ID, None)
+            if record is not None and transaction.ID in self._selected:
+                self._selected.discard(transaction.ID)
+                self.size -= record[3]
+                self._block = None
+                # the space freed is filled with candidates the next time the transactions are requested
+                self._needs_fill = True
+            if len(self._candidates) + len(self._selected_heap) > 2 * len(self._records) + 128:
+                self._rebuild_heaps()
+
+    def get_transactions(self) -> Tuple[List[Transaction], List[dict]]:
+        """
+        :return: The transactions of the next block ordered from greatest to least fee per byte and their dictionaries
+                 which were serialized once when each transaction was added
+        """
+        with self._lock:
+            if self._needs_fill:
+                self._fill()
+            if self._block is None:
+                records = sorted((self._records[ID] for ID in self._selected), key=lambda x: (-x[0], x[1]))
+                self._block = ([x[2] for x in records], [x[4] for x in records])
+            return self._block
+
+    def _make_room(self, record: list) -> bool:
+        """
+        Unselects the selected transactions with a lower fee per byte than the record if that frees enough space for
+        it. Nothing is unselected if enough space cannot be freed.
+        :return: True if the record fits in the block
+        """
+        needed = self.size + record[3] - self.max_block_bytes
+        unselected = []
+        while needed > 0 and self._selected_heap:
+            entry = heapq.heappop(self._selected_heap)
+            if not self._is_current(entry, True):
+                continue
+            if entry[0] >= record[0]:
+                heapq.heappush(self._selected_heap, entry)
+                break
+            unselected.append(entry)
+            needed -= self._records[entry[2]][3]
+        if needed > 0:
+            for entry in unselected:
+                heapq.heappush(self._selected_heap, entry)
+            return False
+        for entry in unselected:
+            self._selected.discard(entry[2])
+            self.size -= self._records[entry[2]][3]
+            heapq.heappush(self._candidates, (-entry[0], entry[1], entry[2]))
+        return True
+
+    def _fill(self):
+        skipped = []
+        while self._candidates and self.size < self.max_block_bytes and len(skipped) < self.max_skipped:
+            entry = heapq.heappop(self._candidates)
+            if not self._is_current(entry, False):
+                continue
+            record = self._records[entry[2]]
+            if self.size + record[3] <= self.max_block_bytes:
+                self._select(record)
+            else:
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._candidates, entry)
+        self._needs_fill = False
+
+    def _rebuild_heaps(self):
+        self._candidates = [(-x[0], x[1], ID) for ID, x in self._records.items() if ID not in self._selected]
+        self._selected_heap = [(x[0], x[1], ID) for ID, x in self._records.items() if ID in self._selected]
+        heapq.heapify(self._candidates)
+        heapq.heapify(self._selected_heap)
+
+    def _select(self, record: list):
+        self._selected.add(record[2].ID)
+        self.size += record[3]
+        heapq.heappush(self._selected_heap, (record[0], record[1], record[2].ID))
+        self._block = None
+
+    def _is_current(self, entry: tuple, selected: bool) -> bool:
+        record = self._records.get(entry[2])
+        return record is not None and record[1] == entry[1] and (entry[2] in self._selected) == selected
@@ -0,0 +1,107 @@
+import threading
+from typing import List, Optional, Tuple
+
+from .block import Block
+from .storage import load_snapshot, save_snapshot
+
+
+class TxIndex:
+    """
+    An index of the confirmed transactions of a chain: the height of the block and position in the block of every
+    transaction keyed by its ID, and the IDs of the transactions sent or received by every address in the order they
+    were confirmed. The index registers itself as a listener of the chain and is updated as blocks are appended and
+    removed, so replacing the end of the chain only updates the entries of the blocks that changed.
+
+    Indexing the blocks of the chain when the index is created reads the transactions of every block. With a path the
+    index is saved by save() and loaded from it when it is created, and only the blocks appended after it was saved are
+    read. A snapshot of a block that is no longer in the chain is ignored and the whole chain is indexed again.
+
+    :param chain: The Chain to index. Its current blocks are indexed when the index is created
+    :param path: An optional file the index is saved to and loaded from
+    """
+
+    def __init__(self, chain, path: Optional[str] = None):
+        self.chain = chain
+        self.path = path
+        # ID -> (height, position)
+        self._locations = {}
+        # address -> IDs of the transactions of the address from the oldest to the newest
+        self._history = {}
+        # IDs of the transactions of every block, used to remove the entries of removed blocks
+        self._blocks = []
+        self._lock = threading.Lock()
+
+        start = 0
+        snapshot = load_snapshot(path, chain) if path is not None else None
+        if snapshot is not None:
+            height, blocks = snapshot
+            for block_height, (ids, addresses) in enumerate(blocks[:height + 1]):
+                self._add(block_height, ids, [tuple(x) for x in addresses])
+            start = height + 1
+        chain.listeners.append(self)
+        for block in chain.iterate(start):
+            self.block_appended(block.index, block)
+
+    def save(self):
+        """Saves the index to its path so it is loaded instead of rebuilt when the node restarts."""
+        with self._lock:
+            save_snapshot(self.path, self.chain, len(self._blocks) - 1, self._blocks)
+
+    def block_appended(self, height: int, block: Block):
+        """Called by the chain when a block is appended."""
+        with self._lock:
+            self._add(height, [x['ID'] for x in block.transactions], [self._addresses(x) for x in block.transactions])
+
+    def _add(self, height: int, ids: List[str], addresses: List[Tuple[str, ...]]):
+        for position, (ID, transaction_addresses) in enumerate(zip(ids, addresses)):
+            self._locations[ID] = (height, position)
+            for address in transaction_addresses:
+                self._history.setdefault(address, []).append(ID)
+        self._blocks.append((ids, addresses))
+
+    def chain_truncated(self, height: int):
+        """Called by the chain when every block from the given height to the tip is removed."""
+        with self._lock:
+            while len(self._blocks) > height:
+                removed_height = len(self._blocks) - 1
+                ids, addresses = self._blocks.pop()
+                for ID, transaction_addresses in zip(reversed(ids), reversed(addresses)):
+                    if self._locations.get(ID, (None,))[0] == removed_height:
+                        del self._locations[ID]
+                    # the transactions of the removed blocks are the last ones of the history of their addresses
+                    for address in transaction_addresses:
+                        history = self._history[address]
+                        history.pop()
+                        if not history:
+                            del self._history[address]
+
+    @staticmethod
+    def _addresses(transaction: dict) -> Tuple[str, ...]:
+        if transaction['sender'] == transaction['receiver']:
+            return transaction['sender'],
+        return transaction['sender'], transaction['receiver']
+
+    def locate(self, ID: str) -> Optional[Tuple[int, int]]:
+        """
+        :param ID: The ID of a transaction
+        :return: The height of the block of the transaction and its position in the block or None if it is not confirmed
+        """
+        return self._locations.get(ID)
+
+    def history(self, address: str, offset: int = 0, limit: int = 100) -> List[str]:
+        """
+        :param address: An address
+        :param offset: The number of transactions to skip, starting from the newest
+        :param limit: The maximum number of transactions returned
+        :return: The IDs of the transactions sent or received by the address from the newest to the oldest
+        """
+        with self._lock:
+            history = self._history.get(address, [])
+            stop = max(0, len(history) - offset)
+            return history[max(0, stop - limit):stop][::-1]
+
+    def history_size(self, address: str) -> int:
+        return len(self._history.get(address, ()))
+
+    def __len__(self) -> int:
+        return len(self._locations)
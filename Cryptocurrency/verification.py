@@ -0,0 +1,117 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable
+
+
+def check_hashes(blocks: list, difficulty: int, genesis: bool = False) -> bool:
+    """
+    Checks that the hash of every block is the hash of its contents and that it has the number of leading 0's required
+    by the mining difficulty. Every block is checked independently of the others so chunks of a chain can be checked in
+    parallel.
+    :param blocks: A list of Block objects
+    :param difficulty: The number of required leading 0's
+    :param genesis: If True the first block is the genesis block, which does not need to satisfy the difficulty. Any
+                    other block claiming an index of 0 must
+    :return: True if every hash is valid and False otherwise
+    """
+    target = '0' * difficulty
+    for i, block in enumerate(blocks):
+        if block.hash != block.compute_hash() or (not (genesis and i == 0) and not block.hash.startswith(target)):
+            return False
+    return True
+
+
+def check_links(blocks: list, prev_block=None) -> bool:
+    """
+    Checks that every block points to the hash of the block before it and that the indices of the blocks follow each
+    other.
+    :param blocks: A list of Block objects
+    :param prev_block: The block before the first block of the list or None if the list starts with the genesis block
+    :return: True if every block links to the previous one and False otherwise
+    """
+    prev = prev_block
+    for block in blocks:
+        if prev is None:
+            if block.index != 0:
+                return False
+        elif block.prev_hash != prev.hash or block.index != prev.index + 1:
+            return False
+        prev = block
+    return True
+
+
+class ChainVerifier:
+    """
+    Verifies long chains by recomputing the hashes of chunks of blocks on a pool of worker processes and then checking
+    the links between the blocks, which is cheap, in the current process. Short chains are verified in the current
+    process since sending the blocks to other processes would cost more than hashing them.
+
+    :param workers: The number of processes used to recompute hashes. 1 verifies everything in the current process
+    :param chunk_size: The number of blocks sent to a worker process at a time
+    :param min_blocks: The number of blocks from which the hashes are recomputed in parallel
+    """
+
+    def __init__(self, workers=1, chunk_size=2000, min_blocks=5000):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.min_blocks = min_blocks
+        self._pool = None
+
+    def is_parallel(self, num_blocks: int) -> bool:
+        return self.workers > 1 and num_blocks >= self.min_blocks
+
+    def verify(self, blocks: Iterable, difficulty: int, prev_block=None, num_blocks: int = None) -> bool:
+        """
+        Checks the hash of every block and the links between the blocks. The blocks are read a chunk at a time, so an
+        iterator over the blocks of a long chain is checked without holding all of them in memory.
+        :param blocks: A list of Block objects or an iterator over Block objects
+        :param difficulty: The number of required leading 0's
+        :param prev_block: The block before the first block of the list or None if the list starts with the genesis
+                           block
+        :param num_blocks: The number of blocks, required when blocks is an iterator
+        :return: True if the blocks are valid and False otherwise
+        """
+        if num_blocks is None:
+            num_blocks = len(blocks)
+        # only the first block of a chain that starts with the genesis block is exempt from the difficulty
+        genesis = prev_block is None
+        blocks = iter(blocks)
+        chunks = iter(lambda: list(islice(blocks, self.chunk_size)), [])
+        if not self.is_parallel(num_blocks):
+            for chunk in chunks:
+                if not (check_hashes(chunk, difficulty, genesis) and check_links(chunk, prev_block)):
+                    return False
+                genesis, prev_block = False, chunk[-1]
+            return True
+
+        # the links are checked here while the hashes of the chunks read before are recomputed by the workers. Only a
+        # few chunks are in flight at a time so the blocks read stay bounded
+        pending = deque()
+        try:
+            for chunk in chunks:
+                if not check_links(chunk, prev_block):
+                    return False
+                pending.append(self.pool.submit(check_hashes, chunk, difficulty, genesis))
+                genesis, prev_block = False, chunk[-1]
+                if len(pending) > 2 * self.workers and not pending.popleft().result():
+                    return False
+            while pending:
+                if not pending.popleft().result():
+                    return False
+            return True
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def close(self):
+        """Shuts down the worker processes if any were started."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers)
+        return self._pool
@@ -0,0 +1,254 @@
+"""
+A compact binary encoding of blocks and transactions, used between nodes instead of json when both support it.
+
+A message is the magic bytes b'QK' and a version byte followed by a list of blocks and a list of transactions. Every
+list starts with the number of its items as an unsigned 32 bit integer and strings are utf-8. All integers are
+big-endian.
+
+A block is its index and nonce as unsigned 64 bit integers, its timestamp and previous hash as strings prefixed by
+their length as an unsigned 32 bit integer, its miner as a flag byte followed by a string if it has one, its hash and
+its transactions. The hash is a flag byte followed by 32 bytes
+for a lowercase hex sha256 digest, by a string for any other hash, or by nothing for a block whose hash is not set.
+
+A transaction is the lengths of its ID, sender and receiver as unsigned 16 bit integers and a flag byte telling whether
+its amount and fee are floats, followed by the three strings and by its amount and fee as signed 64 bit integers or
+doubles. Ints and floats are decoded as the type they were encoded as, so a message decodes to exactly the json it was
+encoded from.
+"""
+import gc
+import struct
+from typing import List, Tuple
+
+CONTENT_TYPE = 'application/x-quadkoin'
+MAGIC = b'QK'
+VERSION = 2
+
+_MESSAGE_HEADER = struct.Struct('>2sB')
+_COUNT = struct.Struct('>I')
+_BLOCK_HEADER = struct.Struct('>QQ')
+_BYTE = struct.Struct('>B')
+# the lengths of the ID, sender and receiver of a transaction and whether its amount and fee are floats
+_TRANSACTION_HEADER = struct.Struct('>HHHB')
+# the amount and fee of a transaction for every combination of the float flags of its header
+_NUMBERS = [struct.Struct('>qq'), struct.Struct('>dq'), struct.Struct('>qd'), struct.Struct('>dd')]
+_NO_HASH = 0
+_DIGEST = 1
+_STRING_HASH = 2
+
+_TRANSACTION_FIELDS = frozenset(('ID', 'sender', 'receiver', 'amount', 'fee'))
+_BLOCK_FIELDS = frozenset(('index', 'nonce', 'timestamp', 'prev_hash', 'transactions', 'hash'))
+_HEX = frozenset('0123456789abcdef')
+
+
+def _write_string(out: bytearray, value: str):
+    if not isinstance(value, str):
+        raise ValueError(f'expected a string and got {value!r}')
+    encoded = value.encode()
+    out += _COUNT.pack(len(encoded))
+    out += encoded
+
+
+def _read_string(data: bytes, offset: int) -> Tuple[str, int]:
+    length, = _COUNT.unpack_from(data, offset)
+    offset += _COUNT.size
+    if offset + length > len(data):
+        raise ValueError('truncated string')
+    return data[offset:offset + length].decode(), offset + length
+
+
+def check_transaction(x: dict) -> int:
+    """
+    Checks that a transaction can be encoded, so a transaction admitted by a node can always be sent to the others.
+    :param x: The dictionary of a transaction
+    :return: The flags telling whether its amount and fee are floats
+    :raises ValueError: If the transaction has other fields or a field has a type or value that cannot be encoded
+    """
+    if x.keys() != _TRANSACTION_FIELDS:
+        raise ValueError(f'a transaction must have exactly the fields {sorted(_TRANSACTION_FIELDS)}')
+    if not all(isinstance(x[field], str) for field in ('ID', 'sender', 'receiver')):
+        raise ValueError('the ID, sender and receiver of a transaction must be strings')
+    if any(len(x[field].encode()) > 0xffff for field in ('ID', 'sender', 'receiver')):
+        raise ValueError('the ID, sender and receiver of a transaction must take less than 65536 bytes')
+    flags = 0
+    for bit, value in enumerate((x['amount'], x['fee'])):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f'expected a number and got {value!r}')
+        if isinstance(value, float):
+            flags |= 1 << bit
+        elif not -2 ** 63 <= value < 2 ** 63:
+            raise ValueError(f'{value} does not fit in 64 bits')
+    return flags
+
+
+def check_block(x: dict):
+    """
+    Checks that a block received from another node has every field of a block and that it can be encoded, so a block
+    added to the block tree can always be sent to the others.
+    :param x: The dictionary of a block including its hash
+    :raises ValueError: If a field is missing or has a type or value that cannot be encoded
+    """
+    if not isinstance(x, dict) or not _BLOCK_FIELDS <= x.keys():
+        raise ValueError(f'a block must have the fields {sorted(_BLOCK_FIELDS)}')
+    if not isinstance(x['hash'], str) or not isinstance(x['transactions'], list) or \
+            not all(isinstance(transaction, dict) for transaction in x['transactions']):
+        raise ValueError('the hash of a block must be a string and its transactions a list of objects')
+    encode_block(bytearray(), x)
+
+
+def encode_transaction(out: bytearray, x: dict):
+    """
+    Appends the encoding of a transaction to a buffer.
+    :param out: The buffer
+    :param x: The dictionary of a transaction. It can only have the fields of a Transaction
+    :raises ValueError: If the transaction has other fields or a field has a type that cannot be encoded
+    """
+    flags = check_transaction(x)
+    strings = [x['ID'].encode(), x['sender'].encode(), x['receiver'].encode()]
+    out += _TRANSACTION_HEADER.pack(len(strings[0]), len(strings[1]), len(strings[2]), flags)
+    out += b''.join(strings)
+    out += _NUMBERS[flags].pack(x['amount'], x['fee'])
+
+
+def decode_transaction(data: bytes, offset: int) -> Tuple[dict, int]:
+    """
+    :return: The dictionary of the transaction encoded at the offset and the offset of the end of its encoding
+    """
+    transactions, offset = _decode_transactions(data, offset, 1)
+    return transactions[0], offset
+
+
+def _decode_transactions(data: bytes, offset: int, count: int) -> Tuple[List[dict], int]:
+    # decodes the transactions of a block in a single loop since this is where decoding spends most of its time
+    unpack_header = _TRANSACTION_HEADER.unpack_from
+    numbers = _NUMBERS
+    end = len(data)
+    transactions = []
+    for _ in range(count):
+        id_length, sender_length, receiver_length, flags = unpack_header(data, offset)
+        offset += 7
+        sender_start = offset + id_length
+        receiver_start = sender_start + sender_length
+        numbers_start = receiver_start + receiver_length
+        if numbers_start + 16 > end or flags > 3:
+            raise ValueError('malformed transaction')
+        amount, fee = numbers[flags].unpack_from(data, numbers_start)
+        transactions.append({'ID': data[offset:sender_start].decode(),
+                             'sender': data[sender_start:receiver_start].decode(),
+                             'receiver': data[receiver_start:numbers_start].decode(), 'amount': amount, 'fee': fee})
+        offset = numbers_start + 16
+    return transactions, offset
+
+
+def encode_block(out: bytearray, x: dict):
+    """
+    Appends the encoding of a block to a buffer.
+    :param out: The buffer
+    :param x: The dictionary of a block, with or without its hash
+    :raises ValueError: If a field has a type that cannot be encoded
+    """
+    if isinstance(x['index'], bool) or not isinstance(x['index'], int) or not isinstance(x['nonce'], int):
+        raise ValueError('the index and nonce of a block must be integers')
+    try:
+        out += _BLOCK_HEADER.pack(x['index'], x['nonce'])
+    except struct.error as error:
+        raise ValueError(str(error))
+    _write_string(out, x['timestamp'])
+    _write_string(out, x['prev_hash'])
+    if x.get('miner') is None:
+        out += _BYTE.pack(0)
+    else:
+        out += _BYTE.pack(1)
+        _write_string(out, x['miner'])
+    block_hash = x.get('hash')
+    if block_hash is None:
+        out += _BYTE.pack(_NO_HASH)
+    elif isinstance(block_hash, str) and len(block_hash) == 64 and _HEX.issuperset(block_hash):
+        out += _BYTE.pack(_DIGEST)
+        out += bytes.fromhex(block_hash)
+    else:
+        out += _BYTE.pack(_STRING_HASH)
+        _write_string(out, block_hash)
+    out += _COUNT.pack(len(x['transactions']))
+    for transaction in x['transactions']:
+        encode_transaction(out, transaction)
+
+
+def decode_block(data: bytes, offset: int) -> Tuple[dict, int]:
+    """
+    :return: The dictionary of the block encoded at the offset and the offset of the end of its encoding
+    """
+    index, nonce = _BLOCK_HEADER.unpack_from(data, offset)
+    offset += _BLOCK_HEADER.size
+    timestamp, offset = _read_string(data, offset)
+    prev_hash, offset = _read_string(data, offset)
+    miner = None
+    if data[offset]:
+        miner, offset = _read_string(data, offset + 1)
+    else:
+        offset += 1
+    block = {'index': index, 'nonce': nonce, 'transactions': None, 'timestamp': timestamp, 'prev_hash': prev_hash,
+             'miner': miner}
+    flag = data[offset]
+    offset += 1
+    if flag == _DIGEST:
+        if offset + 32 > len(data):
+            raise ValueError('truncated hash')
+        block['hash'] = data[offset:offset + 32].hex()
+        offset += 32
+    elif flag == _STRING_HASH:
+        block['hash'], offset = _read_string(data, offset)
+    elif flag != _NO_HASH:
+        raise ValueError(f'unknown hash type {flag}')
+    count, = _COUNT.unpack_from(data, offset)
+    block['transactions'], offset = _decode_transactions(data, offset + _COUNT.size, count)
+    return block, offset
+
+
+def encode_message(blocks: List[dict] = (), transactions: List[dict] = ()) -> bytes:
+    """
+    :param blocks: The dictionaries of the blocks to send
+    :param transactions: The dictionaries of the transactions to send
+    :return: The binary message holding the blocks and transactions
+    :raises ValueError: If a block or transaction cannot be encoded
+    """
+    out = bytearray(_MESSAGE_HEADER.pack(MAGIC, VERSION))
+    out += _COUNT.pack(len(blocks))
+    for block in blocks:
+        encode_block(out, block)
+    out += _COUNT.pack(len(transactions))
+    for transaction in transactions:
+        encode_transaction(out, transaction)
+    return bytes(out)
+
+
+def decode_message(data: bytes) -> Tuple[List[dict], List[dict]]:
+    """
+    :param data: A binary message
+    :return: The dictionaries of the blocks and of the transactions of the message
+    :raises ValueError: If the message is not a valid message of a supported version
+    """
+    # the decoded dictionaries cannot form reference cycles, so the cyclic garbage collector is paused instead of
+    # repeatedly scanning the lists of blocks and transactions as they grow
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        magic, version = _MESSAGE_HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'unsupported message version {version}')
+        offset = _MESSAGE_HEADER.size
+        count, = _COUNT.unpack_from(data, offset)
+        offset += _COUNT.size
+        blocks = []
+        for _ in range(count):
+            block, offset = decode_block(data, offset)
+            blocks.append(block)
+        count, = _COUNT.unpack_from(data, offset)
+        transactions, offset = _decode_transactions(data, offset + _COUNT.size, count)
+    except (struct.error, IndexError, UnicodeDecodeError) as error:
+        raise ValueError(f'malformed message: {error}')
+    finally:
+        if collecting:
+            gc.enable()
+    if offset != len(data):
+        raise ValueError('unexpected data after the end of the message')
+    return blocks, transactions
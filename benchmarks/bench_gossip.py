@@ -0,0 +1,105 @@
+"""
+Runs a network of nodes in this process, each serving its own flask app on a local port and connected to every other
+node, and compares announcing transactions and blocks by ID with pushing their bodies to every node. Reports the
+number of messages every node received, the bytes of those messages and of their responses and how long the network
+took to converge.
+Run from the root of the repository with: python -m benchmarks.bench_gossip [num_nodes] [num_transactions]
+"""
+import logging
+import sys
+import threading
+import time
+
+from flask import request
+from werkzeug.serving import make_server
+
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.mempool import Transaction
+from Cryptocurrency.network import Node
+from flask_api.flask_api import create_app
+
+
+def start_nodes(count, announce):
+    """
+    Starts count nodes connected to each other.
+    :return: The BlockChain of every node, the servers to shut down and the messages received and bytes exchanged by
+             every node
+    """
+    blockchains, servers, received = [], [], []
+    for _ in range(count):
+        apps = []
+        # the port is only known once the server is started, so the server is started before the app is created
+        server = make_server('127.0.0.1', 0, lambda environ, start, apps=apps: apps[0](environ, start), threaded=True)
+        blockchain = BlockChain(1, None, str(server.server_port), announce=announce)
+        app = create_app(blockchain)
+        stats = {'messages': 0, 'bytes': 0}
+
+        @app.after_request
+        def count_message(response, stats=stats):
+            # the bodies fetched by getdata come back in responses, so both directions are counted
+            if request.method == 'POST':
+                stats['messages'] += 1
+                stats['bytes'] += (request.content_length or 0) + (response.content_length or 0)
+            return response
+
+        apps.append(app)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        blockchains.append(blockchain)
+        servers.append(server)
+        received.append(stats)
+    for blockchain in blockchains:
+        blockchain.Network.nodes = [Node(port=x.node.port) for x in blockchains if x is not blockchain]
+    return blockchains, servers, received
+
+
+def wait_for(condition, timeout=30):
+    start = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - start > timeout:
+            raise TimeoutError('the network did not converge')
+        time.sleep(0.01)
+    return time.perf_counter() - start
+
+
+def run(num_nodes, num_transactions, announce):
+    blockchains, servers, received = start_nodes(num_nodes, announce)
+    try:
+        for i in range(num_transactions):
+            blockchains[i % num_nodes].propagate_transaction(Transaction('Tim', 'Div', i, 0.1, f'bench-{i}'))
+        tx_time = wait_for(lambda: all(len(x.MemPool) == num_transactions for x in blockchains))
+        tx_stats = [dict(x) for x in received]
+
+        blockchains[0].mine()
+        block_time = wait_for(lambda: all(len(x.chain) == 2 for x in blockchains))
+        block_stats = [{k: x[k] - y[k] for k in x} for x, y in zip(received, tx_stats)]
+    finally:
+        # lets the queued messages reach the other nodes before they are shut down
+        for blockchain in blockchains:
+            blockchain.gossip.flush(timeout=5)
+        for server in servers:
+            server.shutdown()
+    return tx_time, tx_stats, block_time, block_stats
+
+
+def report(name, elapsed, stats):
+    messages = sum(x['messages'] for x in stats)
+    size = sum(x['bytes'] for x in stats)
+    print(f'  {name}: converged in {elapsed:.2f}s, {messages:,} messages, {size:,} bytes '
+          f'({messages / len(stats):,.1f} messages and {size / len(stats):,.0f} bytes per node)')
+
+
+def main(num_nodes=8, num_transactions=50):
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    # messages sent after a run is over fail to reach the nodes that were shut down
+    logging.getLogger().setLevel(logging.ERROR)
+    # the MemPool of a node holds at most 100 transactions
+    num_transactions = min(num_transactions, 100)
+    for announce in (False, True):
+        tx_time, tx_stats, block_time, block_stats = run(num_nodes, num_transactions, announce)
+        print(f"{'inv/getdata' if announce else 'push'} with {num_nodes} nodes:")
+        report(f'{num_transactions} transactions', tx_time, tx_stats)
+        report('1 block', block_time, block_stats)
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
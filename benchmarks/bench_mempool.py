@@ -0,0 +1,78 @@
+"""
+Compares the heap indexed MemPool with the list based MemPool it replaced for insertion, duplicate lookups, removal
+and selecting the top transactions.
+Run from the root of the repository with: python -m benchmarks.bench_mempool [num_transactions]
+"""
+import random
+import sys
+import time
+
+from Cryptocurrency.mempool import MemPool, Transaction
+
+
+class ListMemPool:
+    """The previous MemPool implementation: a list kept ordered from greatest to least fee."""
+
+    def __init__(self, max_tran_per_block, max_tran_per_MemPool):
+        self.unverified_transactions = []
+        self.max_tran_per_block = max_tran_per_block
+        self.max_tran_per_MemPool = max_tran_per_MemPool
+
+    def insert_single_transaction(self, transaction):
+        if 1 + len(self.unverified_transactions) > self.max_tran_per_MemPool:
+            return -1, len(self.unverified_transactions)
+        elif transaction not in self.unverified_transactions:
+            for i in range(len(self.unverified_transactions)):
+                if transaction.fee >= self.unverified_transactions[i].fee:
+                    self.unverified_transactions.insert(i, transaction)
+                    return i, len(self.unverified_transactions)
+            self.unverified_transactions.append(transaction)
+            return len(self.unverified_transactions) - 1, len(self.unverified_transactions)
+
+    def remove_transactions(self, transactions):
+        removed = False
+        for x in transactions:
+            if x in self.unverified_transactions:
+                self.unverified_transactions.remove(x)
+                removed = True
+        return removed
+
+    def contains(self, ID):
+        return any(x.ID == ID for x in self.unverified_transactions)
+
+    def get_top_transactions(self):
+        return self.unverified_transactions[:self.max_tran_per_block]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    for arg in args:
+        function(arg)
+    return time.perf_counter() - start
+
+
+def run(pool, transactions, contains):
+    to_remove = random.sample(transactions, len(transactions) // 10)
+    return {
+        'insert': timed(pool.insert_single_transaction, *transactions),
+        'lookup': timed(contains, *(x.ID for x in to_remove)),
+        'top': timed(lambda _: pool.get_top_transactions(), *range(1000)),
+        'remove': timed(pool.remove_transactions, *([x] for x in to_remove)),
+    }
+
+
+def main(num_transactions=5000):
+    random.seed(0)
+    transactions = [Transaction('Tim', 'Div', 100, round(random.random(), 4), str(i)) for i in range(num_transactions)]
+    heap = MemPool(100, num_transactions)
+    results = {'heap': run(heap, transactions, heap.__contains__)}
+    # the list version is quadratic, only run it when it finishes in a reasonable time
+    if num_transactions <= 20000:
+        listed = ListMemPool(100, num_transactions)
+        results['list'] = run(listed, transactions, listed.contains)
+    for name, timings in results.items():
+        print(f'{name:>5}: ' + '  '.join(f'{op} {seconds * 1000:9.2f}ms' for op, seconds in timings.items()))
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,41 @@
+"""
+Measures the hash rate of the Miner for an increasing number of worker processes.
+Run from the root of the repository with: python -m benchmarks.bench_mining [nonces]
+"""
+import os
+import sys
+import time
+
+from Cryptocurrency.blockchain import Block
+from Cryptocurrency.mining import Miner
+
+
+def full_block(num_transactions=100):
+    transactions = [{'ID': str(i), 'sender': 'Tim', 'receiver': 'Div', 'amount': i, 'fee': 0.1}
+                    for i in range(num_transactions)]
+    return Block(1, transactions, '0' * 64)
+
+
+def hash_rate(workers, header, nonces):
+    miner = Miner(workers)
+    # starts the worker processes before timing
+    miner.search(header, 64, stop=miner.chunk_size * workers if workers > 1 else 1)
+    start = time.perf_counter()
+    # a difficulty of 64 is never reached so exactly `nonces` hashes are computed
+    miner.search(header, 64, stop=nonces)
+    elapsed = time.perf_counter() - start
+    miner.close()
+    return nonces / elapsed
+
+
+def main(nonces=2000000):
+    header = full_block().header_bytes()
+    single = None
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        rate = hash_rate(workers, header, nonces)
+        single = single or rate
+        print(f'{workers} worker(s): {rate:,.0f} hashes/sec ({rate / single:.2f}x)')
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,59 @@
+"""
+Compares the memory used by and the time taken to create and serialize slotted Transaction objects with the __dict__
+based Transaction class they replaced.
+Run from the root of the repository with: python -m benchmarks.bench_models [num_transactions]
+"""
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from Cryptocurrency.mempool import Transaction
+
+
+class DictTransaction:
+    """The previous Transaction implementation, serialized through its __dict__."""
+
+    def __init__(self, sender, receiver, amount, fee, ID):
+        self.ID = ID
+        self.sender = sender
+        self.receiver = receiver
+        self.amount = amount
+        self.fee = fee
+
+
+def measure(name, create, serialize, num_transactions):
+    gc.collect()
+    start = time.perf_counter()
+    transactions = [create('Tim', 'Div', i, 0.1, str(i)) for i in range(num_transactions)]
+    created = time.perf_counter() - start
+
+    # tracing slows allocations down so the memory is measured on a second batch
+    tracemalloc.start()
+    traced = [create('Tim', 'Div', i, 0.1, str(i)) for i in range(num_transactions)]
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+
+    timings = []
+    # the second pass shows the cost of serializing objects that were already serialized once
+    for _ in range(2):
+        start = time.perf_counter()
+        for x in transactions:
+            serialize(x)
+        timings.append(time.perf_counter() - start)
+
+    print(f'{name}: {memory / num_transactions:.0f} bytes per transaction, '
+          f'created {num_transactions / created:,.0f}/sec, serialized {num_transactions / timings[0]:,.0f}/sec, '
+          f'serialized again {num_transactions / timings[1]:,.0f}/sec')
+
+
+def main(num_transactions=1000000):
+    measure('__dict__', DictTransaction, lambda x: json.dumps(x.__dict__, sort_keys=True), num_transactions)
+    measure('__slots__', Transaction, Transaction.to_json, num_transactions)
+    measure('__slots__ to_dict', Transaction, Transaction.to_dict, num_transactions)
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
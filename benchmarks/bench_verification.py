@@ -0,0 +1,41 @@
+"""
+Measures how long a full verification of a chain takes for an increasing number of worker processes.
+Run from the root of the repository with: python -m benchmarks.bench_verification [num_blocks] [transactions_per_block]
+"""
+import os
+import sys
+import time
+
+from Cryptocurrency.blockchain import Block
+from Cryptocurrency.verification import ChainVerifier
+
+
+def synthetic_chain(num_blocks, transactions_per_block=10):
+    """Builds a chain with a difficulty of 0 so no mining is needed."""
+    genesis = Block(0, [], '0')
+    genesis.hash = genesis.compute_hash()
+    chain = [genesis]
+    for i in range(1, num_blocks):
+        transactions = [{'ID': f'{i}-{j}', 'sender': 'Tim', 'receiver': 'Div', 'amount': j, 'fee': 0.1}
+                        for j in range(transactions_per_block)]
+        block = Block(i, transactions, chain[-1].hash)
+        block.hash = block.compute_hash()
+        chain.append(block)
+    return chain
+
+
+def main(num_blocks=100000, transactions_per_block=10):
+    chain = synthetic_chain(num_blocks, transactions_per_block)
+    for workers in range(1, (os.cpu_count() or 1) + 1):
+        verifier = ChainVerifier(workers, min_blocks=0)
+        # starts the worker processes before timing
+        verifier.verify(chain[:verifier.chunk_size * workers], 0)
+        start = time.perf_counter()
+        assert verifier.verify(chain, 0)
+        elapsed = time.perf_counter() - start
+        verifier.close()
+        print(f'{workers} worker(s): {num_blocks:,} blocks in {elapsed:.2f}s ({num_blocks / elapsed:,.0f} blocks/sec)')
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,35 @@
+"""
+Compares encoding and decoding a chain in the binary wire format with the json used by the API, and the size of both.
+Run from the root of the repository with: python -m benchmarks.bench_wire [num_blocks] [transactions_per_block]
+"""
+import json
+import sys
+import time
+
+from Cryptocurrency import wire
+from benchmarks.bench_verification import synthetic_chain
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main(num_blocks=20000, transactions_per_block=10):
+    chain = [x.to_dict() for x in synthetic_chain(num_blocks, transactions_per_block)]
+
+    encoded_json, json_encoding = timed(lambda: json.dumps({'chain': chain}).encode())
+    decoded_json, json_decoding = timed(lambda: json.loads(encoded_json)['chain'])
+    encoded_wire, wire_encoding = timed(wire.encode_message, chain)
+    (decoded_wire, _), wire_decoding = timed(wire.decode_message, encoded_wire)
+    assert decoded_wire == decoded_json == chain
+
+    for name, size, encoding, decoding in (('json', len(encoded_json), json_encoding, json_decoding),
+                                           ('wire', len(encoded_wire), wire_encoding, wire_decoding)):
+        print(f'{name}: {size:,} bytes, encoded in {encoding:.2f}s ({num_blocks / encoding:,.0f} blocks/sec), '
+              f'decoded in {decoding:.2f}s ({num_blocks / decoding:,.0f} blocks/sec)')
+
+
+if __name__ == '__main__':
+    main(*[int(x) for x in sys.argv[1:]])
@@ -0,0 +1,273 @@
+"""
+Simulates a network of nodes in this process. Every node is a BlockChain with its own flask app, and the nodes talk to
+each other through a requests transport adapter that hands every request to the flask test client of the node it is
+addressed to instead of opening a connection, so a network of 50+ nodes runs without starting any server. The transport
+adds a configurable latency to every message and drops a configurable fraction of them.
+
+Reports the number of transactions per second the network delivered to every node, the percentiles of the time a
+transaction took to reach every other node, the time a block took to reach the other nodes and the bytes sent and
+received by every node.
+Run from the root of the repository with:
+python -m benchmarks.simulator [num_nodes] [num_transactions] [latency_ms] [failure_rate] [degree]
+"""
+import logging
+import random
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+from uuid import uuid4
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.mempool import Transaction
+from Cryptocurrency.network import Node
+from flask_api.flask_api import create_app
+
+# the simulated nodes are given consecutive ports from this one, no port is actually opened
+BASE_PORT = 40000
+
+
+class LocalTransport(BaseAdapter):
+    """
+    A requests transport adapter that delivers the requests of one node to the flask test client of the node they are
+    addressed to, after a random delay, and fails a fraction of them as if the other node could not be reached.
+
+    :param clients: The flask test client of every simulated node keyed by 'host:port'
+    :param latency: The mean number of seconds a message takes to reach another node
+    :param jitter: The maximum number of seconds added to or removed from the latency of a message
+    :param failure_rate: The probability that a message is lost
+    :param rng: The random number generator of the delays and failures
+    """
+
+    def __init__(self, clients: dict, latency=0.0, jitter=0.0, failure_rate=0.0, rng=None):
+        super().__init__()
+        self.clients = clients
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random()
+        self.messages = 0
+        self.failures = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        body = request.body or b''
+        if isinstance(body, str):
+            body = body.encode()
+        with self._lock:
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+            lost = self.rng.random() < self.failure_rate
+            self.messages += 1
+            self.bytes_sent += len(body)
+            if lost:
+                self.failures += 1
+        client = self.clients.get(url.netloc)
+        if client is None or lost:
+            raise requests.ConnectionError(f'{url.netloc} could not be reached', request=request)
+        time.sleep(delay)
+
+        headers = {k: v for k, v in request.headers.items() if k.lower() != 'content-length'}
+        result = client.open(url.path, method=request.method, query_string=url.query, headers=headers, data=body)
+        response = requests.Response()
+        response.status_code = result.status_code
+        response.headers = CaseInsensitiveDict(result.headers)
+        response._content = result.get_data()
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        with self._lock:
+            self.bytes_received += len(response._content)
+        return response
+
+    def close(self):
+        pass
+
+
+class Arrivals:
+    """Records when every transaction and block first reached a node, as a MemPool and chain listener."""
+
+    def __init__(self):
+        self.times = {}
+
+    def transaction_added(self, transaction: Transaction):
+        self.times.setdefault(transaction.ID, time.perf_counter())
+
+    def transaction_removed(self, transaction: Transaction):
+        pass
+
+    def block_appended(self, height, block):
+        self.times.setdefault(block.hash, time.perf_counter())
+
+    def chain_truncated(self, height):
+        pass
+
+
+def percentile(values: list, q: float) -> float:
+    """
+    :param values: A list of numbers
+    :param q: The percentile, between 0 and 100
+    :return: The nearest-rank percentile of the values or 0 if there are none
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+class Simulation:
+    """
+    A network of nodes running in this process. Every node is connected to its two neighbours on a ring, so the network
+    is connected, and to random other nodes until it has degree peers.
+
+    :param num_nodes: The number of nodes
+    :param degree: The number of peers of every node
+    :param latency: The mean number of seconds a message takes to reach another node
+    :param jitter: The maximum number of seconds added to or removed from the latency of a message
+    :param failure_rate: The probability that a message is lost
+    :param announce: Whether the nodes announce transactions and blocks by ID or push their bodies
+    :param flush_interval: The number of seconds a node waits to batch transactions before sending them
+    :param mempool_size: The number of transactions the MemPool of every node holds
+    :param seed: The seed of the topology, delays and failures
+    """
+
+    def __init__(self, num_nodes, degree=8, latency=0.0, jitter=0.0, failure_rate=0.0, announce=True,
+                 flush_interval=0.05, mempool_size=10000, seed=0):
+        self.rng = random.Random(seed)
+        self.clients = {}
+        self.blockchains, self.transports, self.arrivals = [], [], []
+        for i in range(num_nodes):
+            blockchain = BlockChain(1, None, str(BASE_PORT + i), announce=announce, mempool_size=mempool_size)
+            # nodes created in the same process share the default address
+            blockchain.node.address = uuid4().hex
+            blockchain.gossip.flush_interval = flush_interval
+            transport = LocalTransport(self.clients, latency, jitter, failure_rate, random.Random(seed + i + 1))
+            blockchain.Network.transport = transport
+            arrivals = Arrivals()
+            blockchain.MemPool.listeners.append(arrivals)
+            blockchain.chain.listeners.append(arrivals)
+            self.clients[f'{blockchain.node.path}:{blockchain.node.port}'] = create_app(blockchain).test_client()
+            self.blockchains.append(blockchain)
+            self.transports.append(transport)
+            self.arrivals.append(arrivals)
+
+        peers = [set() for _ in range(num_nodes)]
+        for i in range(num_nodes):
+            if num_nodes > 1:
+                peers[i].add((i + 1) % num_nodes)
+                peers[(i + 1) % num_nodes].add(i)
+            candidates = [x for x in range(num_nodes) if x != i and x not in peers[i]]
+            for j in self.rng.sample(candidates, max(0, min(len(candidates), degree - len(peers[i])))):
+                peers[i].add(j)
+                peers[j].add(i)
+        for blockchain, node_peers in zip(self.blockchains, peers):
+            blockchain.Network.nodes = [Node(port=x.port, address=x.address)
+                                        for x in (self.blockchains[i].node for i in sorted(node_peers))]
+
+    def run_transactions(self, num_transactions: int, timeout: float = 60) -> dict:
+        """
+        Submits transactions to random nodes and waits until every node has all of them or the timeout passes.
+        :return: The number of transactions, the fraction of them that reached every node, the number of transactions
+                 per second delivered to every node and the percentiles of the seconds a transaction took to reach
+                 another node
+        """
+        sent = {}
+        start = time.perf_counter()
+        for i in range(num_transactions):
+            origin = self.rng.randrange(len(self.blockchains))
+            transaction = Transaction('Tim', 'Div', i, 0.1, uuid4().hex)
+            sent[transaction.ID] = (origin, time.perf_counter())
+            self.blockchains[origin].propagate_transactions([transaction])
+        self._wait(lambda: all(all(x in arrivals.times for x in sent) for arrivals in self.arrivals), timeout)
+
+        latencies = []
+        delivered = 0
+        last = start
+        for ID, (origin, submitted) in sent.items():
+            times = [x.times[ID] for i, x in enumerate(self.arrivals) if i != origin and ID in x.times]
+            latencies.extend(t - submitted for t in times)
+            if len(times) == len(self.arrivals) - 1:
+                delivered += 1
+                last = max([last] + times)
+        elapsed = last - start
+        return {'transactions': num_transactions, 'delivered': delivered / max(1, num_transactions),
+                'tx_per_sec': delivered / elapsed if elapsed > 0 else 0.0,
+                'latency': {f'p{q}': percentile(latencies, q) for q in (50, 90, 99, 100)}}
+
+    def run_block(self, timeout: float = 60) -> dict:
+        """
+        Mines a block on the first node and waits until every node has it or the timeout passes.
+        :return: The fraction of the other nodes the block reached and the percentiles of the seconds it took to reach
+                 them
+        """
+        block = self.blockchains[0].mine()
+        mined = self.arrivals[0].times[block.hash]
+        self._wait(lambda: all(block.hash in x.times for x in self.arrivals), timeout)
+        times = [x.times[block.hash] - mined for x in self.arrivals[1:] if block.hash in x.times]
+        return {'reached': len(times) / max(1, len(self.arrivals) - 1),
+                'propagation': {f'p{q}': percentile(times, q) for q in (50, 90, 100)}}
+
+    def traffic(self) -> dict:
+        """
+        :return: The number of messages sent and lost, the mean and maximum bytes sent and received by a node and the
+                 mean and maximum of their sum. A node receives the responses to its messages, such as the bodies
+                 returned by getdata, so both directions are needed to compare pushing bodies with announcing them
+        """
+        sent = [x.bytes_sent for x in self.transports]
+        received = [x.bytes_received for x in self.transports]
+        total = [x + y for x, y in zip(sent, received)]
+        return {'messages': sum(x.messages for x in self.transports),
+                'failures': sum(x.failures for x in self.transports),
+                'bytes_sent_per_node': sum(sent) / len(sent), 'max_bytes_sent_per_node': max(sent),
+                'bytes_received_per_node': sum(received) / len(received),
+                'max_bytes_received_per_node': max(received),
+                'bytes_per_node': sum(total) / len(total), 'max_bytes_per_node': max(total)}
+
+    @staticmethod
+    def _wait(condition, timeout: float):
+        deadline = time.perf_counter() + timeout
+        while not condition() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """Sends the messages still queued and stops the threads of every node."""
+        # every node flushes its queue before any node stops, since a node may relay what it receives while flushing
+        for blockchain in self.blockchains:
+            blockchain.gossip.flush(timeout=5)
+        for blockchain in self.blockchains:
+            blockchain.close(timeout=0)
+
+
+def main(num_nodes=50, num_transactions=200, latency_ms=5, failure_rate=0.0, degree=8):
+    # lost messages are logged by every node
+    logging.getLogger().setLevel(logging.ERROR)
+    simulation = Simulation(num_nodes, degree=degree, latency=latency_ms / 1000, jitter=latency_ms / 2000,
+                            failure_rate=failure_rate)
+    try:
+        transactions = simulation.run_transactions(num_transactions)
+        block = simulation.run_block()
+    finally:
+        simulation.close()
+    traffic = simulation.traffic()
+
+    latency = transactions['latency']
+    print(f'{num_nodes} nodes with {degree} peers, {latency_ms}ms latency and {failure_rate:.0%} of messages lost:')
+    print(f"  {num_transactions} transactions: {transactions['tx_per_sec']:,.1f} transactions/sec, "
+          f"{transactions['delivered']:.0%} reached every node, propagation p50 {latency['p50'] * 1000:.0f}ms "
+          f"p90 {latency['p90'] * 1000:.0f}ms p99 {latency['p99'] * 1000:.0f}ms max {latency['p100'] * 1000:.0f}ms")
+    propagation = block['propagation']
+    print(f"  1 block: reached {block['reached']:.0%} of the nodes, p50 {propagation['p50'] * 1000:.0f}ms "
+          f"p90 {propagation['p90'] * 1000:.0f}ms max {propagation['p100'] * 1000:.0f}ms")
+    print(f"  {traffic['messages']:,} messages, {traffic['failures']:,} lost, "
+          f"{traffic['bytes_per_node']:,.0f} bytes per node (max {traffic['max_bytes_per_node']:,}): "
+          f"{traffic['bytes_sent_per_node']:,.0f} sent and {traffic['bytes_received_per_node']:,.0f} received")
+
+
+if __name__ == '__main__':
+    main(*[float(x) if '.' in x else int(x) for x in sys.argv[1:]])
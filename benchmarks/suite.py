@@ -0,0 +1,187 @@
+"""
+Microbenchmarks of the hot paths of a node: hashing a block, the proof of work over a fixed number of nonces, validating
+chains of increasing length, the MemPool at 1k to 1M transactions and serializing the chain in the /get_chain route.
+
+Every benchmark is run several times and its best time kept. The results are written as json and compared with a
+stored baseline, and the suite exits with status 1 when a benchmark is slower than its baseline by more than the
+threshold, so a change to a hot path can be shown not to slow it down. Timings depend on the machine, so the baseline
+has to be recorded on the machine the suite is compared on, with --update-baseline.
+Run from the root of the repository with: python -m benchmarks.suite [--quick] [--threshold 0.25] [--update-baseline]
+"""
+import argparse
+import gc
+import json
+import logging
+import platform
+import random
+import sys
+import time
+
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.mempool import MemPool, Transaction
+from Cryptocurrency.network import Node
+from Cryptocurrency import wire
+from benchmarks.bench_mining import full_block
+from benchmarks.bench_verification import synthetic_chain
+from flask_api.flask_api import create_app
+
+BASELINE = 'benchmarks/baseline.json'
+RESULTS = 'benchmarks/results.json'
+
+
+def measure(run, setup=None, repeat=5) -> float:
+    """
+    :param run: The function timed. It is passed the value returned by setup
+    :param setup: An optional function called before every run, outside of the timing
+    :param repeat: The number of runs
+    :return: The number of seconds of the fastest run
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+        # like timeit, garbage collections triggered by earlier allocations are kept out of the timing
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run(state)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+
+def bench_compute_hash(quick):
+    block = full_block()
+    block.header_bytes()
+
+    def run(_):
+        for nonce in range(count):
+            block.nonce = nonce
+            block.compute_hash()
+
+    count = 20000 if quick else 200000
+    yield 'block.compute_hash', count, measure(run)
+
+
+def bench_proof_of_work(quick):
+    blockchain = BlockChain(1, Node(port='50001'))
+    header = full_block().header_bytes()
+    count = 50000 if quick else 500000
+    # a difficulty of 64 is never reached so exactly count nonces are tried
+    yield 'proof_of_work', count, measure(lambda _: blockchain.miner.search(header, 64, stop=count))
+
+
+def bench_validate_chain(quick):
+    blockchain = BlockChain(0, Node(port='50001'))
+    for length in (100, 1000) if quick else (100, 1000, 10000):
+        # blocks are checked from their dictionaries, as when they are received from another node
+        chain = [x.to_dict() for x in synthetic_chain(length)]
+        yield f'validate_chain.{length}_blocks', length, measure(lambda _: blockchain.validate_chain(chain))
+
+
+def bench_mempool(quick):
+    rng = random.Random(0)
+    for size in (1000, 10000) if quick else (1000, 10000, 100000, 1000000):
+        transactions = [Transaction('Tim', 'Div', i, round(rng.uniform(0.01, 1), 4), str(i)) for i in range(size)]
+        repeat = 5 if size < 100000 else 1
+
+        def filled():
+            mempool = MemPool(100, size)
+            mempool.insert_multiple_transactions(transactions)
+            return mempool
+
+        def top(mempool):
+            for _ in range(100):
+                mempool.get_top_transactions()
+
+        yield f'mempool.insert.{size}', size, measure(lambda x: x.insert_multiple_transactions(transactions),
+                                                      lambda: MemPool(100, size), repeat)
+        yield f'mempool.top_100.{size}', 100, measure(top, filled, repeat)
+        yield f'mempool.remove.{size}', size, measure(lambda x: x.remove_transactions(transactions), filled, repeat)
+
+
+def bench_get_chain(quick):
+    blockchain = BlockChain(0, Node(port='50001'))
+    length = 1000
+    blockchain.replace_chain(synthetic_chain(length)[1:], 1)
+    client = create_app(blockchain).test_client()
+    yield f'get_chain.json.{length}_blocks', length, measure(lambda _: client.get('/get_chain'))
+    yield f'get_chain.wire.{length}_blocks', length, \
+        measure(lambda _: client.get('/get_chain', headers={'Accept': wire.CONTENT_TYPE}))
+
+
+BENCHMARKS = [bench_compute_hash, bench_proof_of_work, bench_validate_chain, bench_mempool, bench_get_chain]
+
+
+def run_suite(quick=False, benchmarks=None) -> dict:
+    """
+    :param quick: If True the smaller sizes of every benchmark are run
+    :param benchmarks: The benchmark functions to run, all of them if None
+    :return: The seconds and number of operations of every benchmark and the nanoseconds per operation keyed by name
+    """
+    results = {}
+    for benchmark in benchmarks or BENCHMARKS:
+        for name, operations, seconds in benchmark(quick):
+            results[name] = {'operations': operations, 'seconds': seconds, 'ns_per_op': seconds / operations * 1e9}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    :param results: The results of run_suite
+    :param baseline: The results of an earlier run
+    :param threshold: The fraction by which a benchmark can be slower than its baseline before it is a regression
+    :return: The name, baseline and current nanoseconds per operation and ratio of every benchmark in both runs that
+             regressed past the threshold
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline:
+            ratio = result['ns_per_op'] / baseline[name]['ns_per_op']
+            if ratio > 1 + threshold:
+                regressions.append((name, baseline[name]['ns_per_op'], result['ns_per_op'], ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Runs the microbenchmarks and compares them with a baseline.')
+    parser.add_argument('--quick', action='store_true', help='only run the smaller sizes')
+    parser.add_argument('--output', default=RESULTS, help='where the json results are written')
+    parser.add_argument('--baseline', default=BASELINE, help='the json results compared with')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='the fraction by which a benchmark can be slower than its baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='writes the results to the baseline')
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    results = run_suite(args.quick)
+    report = {'python': platform.python_version(), 'machine': platform.machine(), 'quick': args.quick,
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+    except FileNotFoundError:
+        baseline = {}
+    for name, result in results.items():
+        previous = baseline.get(name)
+        change = f"{result['ns_per_op'] / previous['ns_per_op'] - 1:+.1%}" if previous else 'new'
+        print(f"{name:<36} {result['ns_per_op']:>14,.0f} ns/op  {change}")
+
+    if args.update_baseline:
+        # a quick run only updates the benchmarks it ran
+        report['results'] = dict(baseline, **results)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        return 0
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after, ratio in regressions:
+        print(f'REGRESSION {name}: {before:,.0f} -> {after:,.0f} ns/op ({ratio:.2f}x)')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
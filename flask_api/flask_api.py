@@ -1,130 +1,395 @@
-from flask import Flask, request, jsonify
+import json
+import math
+import os
+import time
+from itertools import islice
+from flask import Flask, Response, g, request, jsonify
+from werkzeug.exceptions import ClientDisconnected
+from Cryptocurrency import wire
 from Cryptocurrency.blockchain import BlockChain, Block
 from Cryptocurrency.network import Node
 from Cryptocurrency.mempool import Transaction
 
+# the maximum number of headers and blocks returned by a single request to /headers and /blocks
+MAX_HEADERS = 2000
+MAX_BLOCKS = 500
+# the maximum number of transactions returned by a single request to /address/<address>/history
+MAX_HISTORY = 1000
+# the number of transactions of an NDJSON body added to the MemPool at a time
+NDJSON_CHUNK = 1000
+# the message and status code answered to /add_transaction for every status returned by propagate_transactions
+TRANSACTION_RESPONSES = {
+    'added': ('Transaction successfully added', 201),
+    'duplicate': ('Transaction already propagated', 200),
+    'invalid': ('The transaction does not fit the wire format', 400),
+    'insufficient_funds': ('The sender cannot afford the transaction', 422),
+    'rejected': ('The MemPool is full or holds too many transactions of the sender', 409),
+}
+
+
+def parse_transaction(x) -> Transaction:
+    """
+    Builds a Transaction from the dictionary received by the API after checking its fields.
+    :param x: The dictionary of a transaction
+    :return: A Transaction object
+    :raises ValueError: If a field is missing, has the wrong type or does not fit the wire format
+    """
+    if not isinstance(x, dict):
+        raise ValueError('a transaction must be an object')
+    for field in ('sender', 'receiver', 'ID'):
+        if not isinstance(x.get(field), str) or not x[field]:
+            raise ValueError(f'{field} must be a non-empty string')
+    for field in ('amount', 'fee'):
+        if not isinstance(x.get(field), (int, float)) or isinstance(x[field], bool):
+            raise ValueError(f'{field} must be a number')
+        if not math.isfinite(x[field]) or x[field] < 0:
+            raise ValueError(f'{field} must be a non-negative finite number')
+    # the transaction must fit the wire format to be sent to the other nodes
+    wire.check_transaction({field: x[field] for field in ('ID', 'sender', 'receiver', 'amount', 'fee')})
+    return Transaction.from_dict(x)
+
+
+def parse_node(x) -> Node:
+    """
+    Builds a Node from the dictionary received by the API after checking its fields.
+    :param x: The dictionary of a node
+    :return: A Node object
+    :raises ValueError: If a field is missing or is not a string
+    """
+    if not isinstance(x, dict) or not all(isinstance(x.get(field), str) for field in ('path', 'port', 'address')):
+        raise ValueError('a node must be an object whose path, port and address are strings')
+    return Node.from_dict(x)
+
+
+def parse_inventory(x) -> list:
+    """
+    Checks the inventory of an announcement or of a request for the announced items received by the API.
+    :param x: A list of {'type': 'tx' or 'block', 'ID': the ID of the transaction or hash of the block}
+    :return: The inventory
+    :raises ValueError: If the inventory is not a list or one of its items does not have this shape
+    """
+    if not isinstance(x, list) or not all(isinstance(item, dict) and item.get('type') in ('tx', 'block') and
+                                          isinstance(item.get('ID'), str) for item in x):
+        raise ValueError("the inventory must be a list of {'type': 'tx' or 'block', 'ID': string}")
+    return x
+
+
+def prefers_wire() -> bool:
+    """Whether the client of the current request prefers the binary wire format to json."""
+    return request.accept_mimetypes.best_match(['application/json', wire.CONTENT_TYPE]) == wire.CONTENT_TYPE
+
+
+def read_lines():
+    """Reads the body of the current request line by line as it arrives."""
+    try:
+        yield from request.stream
+    except ClientDisconnected as error:
+        raise OSError('the request body was interrupted') from error
+
+
+def create_app(blockchain: BlockChain) -> Flask:
+    """
+    Creates the flask API interface of a node. Several nodes can be run in the same process by creating an app for
+    each of their BlockChain instances.
+    :param blockchain: The BlockChain of the node
+    :return: The flask app serving the routes of the node
+    """
+    app = Flask(__name__)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.teardown_request
+    def record_latency(error=None):
+        # recorded on teardown so requests failing with an unhandled exception are counted too. Requests are grouped by
+        # route rather than by path so the number of series stays bounded
+        if 'request_start' not in g:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        blockchain.metrics.request_seconds.labels(route, request.method).observe(time.perf_counter() - g.request_start)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(blockchain.metrics.render(), mimetype='text/plain; version=0.0.4'), 200
+
+    @app.route('/get_chain', methods=['GET'])
+    def get_chain():
+        payload = [x.to_dict() for x in blockchain.chain]
+        # nodes that accept the binary wire format are sent the chain in it
+        if prefers_wire():
+            return Response(wire.encode_message(payload), mimetype=wire.CONTENT_TYPE,
+                            headers={'X-Chain-Length': str(len(blockchain.chain))}), 200
+        # payload = json.dumps(blockchain.chain, default=lambda x: x.__dict__)
+        response = {'chain': payload, 'length': len(blockchain.chain)}
+        return jsonify(response), 200
+
+    @app.route('/chain_tip', methods=['GET'])
+    def chain_tip():
+        last_block = blockchain.last_block
+        return jsonify({'height': last_block.index, 'hash': last_block.hash}), 200
+
+    @app.route('/chain_tips', methods=['GET'])
+    def chain_tips():
+        # the tip of the chain and of the branches competing with it
+        return jsonify({'tips': blockchain.tree.tips(), 'orphans': blockchain.tree.orphans}), 200
+
+    @app.route('/headers', methods=['GET'])
+    def get_headers():
+        start = request.args.get('from', 0, type=int)
+        count = min(request.args.get('count', MAX_HEADERS, type=int), MAX_HEADERS)
+        if start < 0 or count < 0:
+            return jsonify({'message': 'from and count must not be negative'}), 400
+        stop = min(start + count, len(blockchain.chain))
+        payload = [blockchain.chain.header(i) for i in range(start, stop)]
+        return jsonify({'headers': payload, 'height': len(blockchain.chain) - 1}), 200
+
+    @app.route('/blocks', methods=['GET'])
+    def get_blocks():
+        start = request.args.get('from', 0, type=int)
+        count = min(request.args.get('count', MAX_BLOCKS, type=int), MAX_BLOCKS)
+        if start < 0 or count < 0:
+            return jsonify({'message': 'from and count must not be negative'}), 400
+        # the blocks are read without going through the cache so a peer syncing the chain does not evict the recent
+        # blocks other requests read
+        stop = min(start + count, len(blockchain.chain))
+        payload = [x.to_dict() for x in blockchain.chain.iterate(start, stop)]
+        if prefers_wire():
+            return Response(wire.encode_message(payload), mimetype=wire.CONTENT_TYPE,
+                            headers={'X-Chain-Height': str(len(blockchain.chain) - 1)}), 200
+        return jsonify({'blocks': payload, 'height': len(blockchain.chain) - 1}), 200
+
+    @app.route('/mine_block', methods=['GET'])
+    def mine_block():
+        # mining happens in the background so the other routes are not blocked while the proof of work runs
+        job = blockchain.scheduler.submit()
+        response = {'message': 'Mining started, check /mining_status for progress',
+                    'job': job.to_dict()}
+        return jsonify(response), 202
+
+    @app.route('/mining_status/<job_id>', methods=['GET'])
+    def mining_status(job_id):
+        job = blockchain.scheduler.get(job_id)
+        if job is None:
+            return jsonify({'message': 'Unknown mining job'}), 404
+        return jsonify({'job': job.to_dict()}), 200
+
+    @app.route('/add_block', methods=['POST'])
+    def add_block():
+        data = request.get_json(silent=True)
+        try:
+            changed = blockchain.receive_block(data.get('block') if isinstance(data, dict) else None)
+        except ValueError as error:
+            return jsonify({'message': f'Malformed block: {error}'}), 400
+        if not changed:
+            return jsonify({'message': 'Block rejected'}), 200
+        return jsonify({'message': 'Block successfully added'}), 201
+
+    @app.route('/inv', methods=['POST'])
+    def inv():
+        # the announced items this node is missing are requested from the announcing node in the background
+        data = request.get_json(silent=True)
+        try:
+            if not isinstance(data, dict):
+                raise ValueError('expected an object with a node and an inventory')
+            node = parse_node(data.get('node'))
+            inventory = parse_inventory(data.get('inventory'))
+        except ValueError as error:
+            return jsonify({'message': f'Malformed announcement: {error}'}), 400
+        requested = blockchain.receive_inventory(inventory, node)
+        return jsonify({'message': f'{requested} items requested'}), 202
+
+    @app.route('/getdata', methods=['POST'])
+    def getdata():
+        data = request.get_json(silent=True)
+        try:
+            inventory = parse_inventory(data.get('inventory') if isinstance(data, dict) else None)
+        except ValueError as error:
+            return jsonify({'message': f'Malformed request: {error}'}), 400
+        return jsonify(blockchain.get_inventory_data(inventory)), 200
+
+    @app.route('/tx_proof/<transaction_id>', methods=['GET'])
+    def tx_proof(transaction_id):
+        # the proof can be checked against the merkle root of the block header returned by /headers
+        proof = blockchain.transaction_proof(transaction_id)
+        if proof is None:
+            return jsonify({'message': 'Transaction not found in the chain'}), 404
+        return jsonify(proof), 200
+
+    @app.route('/tx/<transaction_id>', methods=['GET'])
+    def get_transaction(transaction_id):
+        found = blockchain.find_transaction(transaction_id)
+        if found is None:
+            return jsonify({'message': 'Transaction not found in the chain'}), 404
+        return jsonify(found), 200
+
+    @app.route('/address/<address>/history', methods=['GET'])
+    def address_history(address):
+        offset = max(0, request.args.get('offset', 0, type=int))
+        limit = min(max(0, request.args.get('limit', 100, type=int)), MAX_HISTORY)
+        return jsonify(blockchain.address_history(address, offset, limit)), 200
+
+    @app.route('/balance/<address>', methods=['GET'])
+    def balance(address):
+        ledger = blockchain.ledger
+        response = {'address': address, 'balance': ledger.balance(address), 'pending': ledger.pending(address),
+                    'spendable': ledger.spendable(address), 'height': ledger.height}
+        return jsonify(response), 200
+
+    @app.route('/validate_chain', methods=['GET'])
+    def validate_chain():
+        # only the blocks appended since the last validation are checked unless full=true is passed
+        if blockchain.validate_chain(full=request.args.get('full') == 'true'):
+            response = {'message': 'The blockchain is valid!', 'verified_height': blockchain.verified_height}
+        else:
+            response = {'message': 'The blockchain is invalid!'}
+
+        return jsonify(response), 200
+
+    @app.route('/add_transaction', methods=['POST'])
+    def add_transaction():
+        data = request.get_json(silent=True)
+        try:
+            new_transaction = parse_transaction(data.get('transaction') if isinstance(data, dict) else None)
+        except ValueError as error:
+            return jsonify({'message': f'Invalid transaction: {error}'}), 400
+
+        status = blockchain.propagate_transactions([new_transaction])[0]
+        message, code = TRANSACTION_RESPONSES[status]
+        return jsonify({'message': message, 'status': status}), code
+
+    @app.route('/add_transactions', methods=['POST'])
+    def add_transactions():
+        # accepts {'transactions': [...]}, a bare array or an NDJSON body with one transaction per line. NDJSON bodies
+        # are read as a stream and added in chunks so the whole body is never held in memory
+        if request.mimetype == 'application/x-ndjson':
+            lines = (line for line in request.stream if line.strip())
+            chunks = iter(lambda: list(islice(lines, NDJSON_CHUNK)), [])
+        else:
+            data = request.get_json(silent=True)
+            data = data.get('transactions') if isinstance(data, dict) else data
+            if not isinstance(data, list):
+                return jsonify({'message': 'Expected a list of transactions'}), 400
+            chunks = [data]
+
+        results = []
+        for chunk in chunks:
+            valid = []
+            for x in chunk:
+                try:
+                    new_transaction = parse_transaction(json.loads(x) if isinstance(x, bytes) else x)
+                except ValueError as error:
+                    results.append({'ID': x.get('ID') if isinstance(x, dict) else None, 'status': 'invalid',
+                                    'error': str(error)})
+                    continue
+                valid.append(len(results))
+                results.append({'ID': new_transaction.ID, 'status': None, 'transaction': new_transaction})
+            # the valid transactions of the chunk are inserted together and gossiped as one batch
+            statuses = blockchain.propagate_transactions([results[i].pop('transaction') for i in valid])
+            for i, status in zip(valid, statuses):
+                results[i]['status'] = status
+
+        added = sum(x['status'] == 'added' for x in results)
+        return jsonify({'message': f'{added} transactions successfully added', 'results': results}), 201
+
+    @app.route('/update_node', methods=['POST'])
+    def update_node():
+        # streamed chains are imported a page of blocks at a time as the body is read
+        if request.mimetype == 'application/x-ndjson':
+            if blockchain.import_chain(read_lines()):
+                return jsonify({'message': 'Successful', 'height': len(blockchain.chain) - 1}), 201
+            response = {'message': 'The chain was only partially imported', 'height': len(blockchain.chain) - 1}
+            return jsonify(response), 400
+
+        if request.mimetype == wire.CONTENT_TYPE:
+            try:
+                chain, transactions = wire.decode_message(request.get_data())
+            except ValueError as error:
+                return jsonify({'message': f'Malformed message: {error}'}), 400
+        else:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict) or not isinstance(data.get('chain'), list) or \
+                    not isinstance(data.get('transactions'), list):
+                return jsonify({'message': 'Expected a chain and a list of transactions'}), 400
+            chain, transactions = data['chain'], data['transactions']
+        try:
+            for x in chain:
+                wire.check_block(x)
+            transactions = [parse_transaction(x) for x in transactions]
+        except ValueError as error:
+            return jsonify({'message': f'Malformed message: {error}'}), 400
+        new_chain = [Block.from_dict(x) for x in chain]
+        # every hash of the chain is recomputed, in parallel for long chains
+        if not blockchain.validate_chain(new_chain):
+            return jsonify({'message': 'The chain is invalid'}), 400
+
+        blockchain.replace_chain(new_chain, require_longer=False)
+        blockchain.MemPool.unverified_transactions = transactions
+
+        return jsonify({'message': 'Successful'}), 201
+
+    @app.route('/get_unverified_transactions', methods=['GET'])
+    def get_unverified_transactions():
+        payload = [x.to_dict() for x in blockchain.MemPool.unverified_transactions]
+        return jsonify({'Transactions': payload}), 200
+
+    @app.route('/mempool_stats', methods=['GET'])
+    def mempool_stats():
+        response = {'size': blockchain.MemPool.num_transactions, 'counters': blockchain.MemPool.counters}
+        return jsonify(response), 200
+
+    @app.route('/add_node', methods=['POST'])
+    def add_node():
+        data = request.json['node']
+        new_node = Node.from_dict(data)
+        blockchain.Network.add_node(new_node)
+        response = {'message': 'Node successfully connected!'}
+        return jsonify(response), 201
+
+    @app.route('/transactions_verified', methods=['POST'])
+    def transactions_verified():
+        data = request.json['transactions']
+
+        # remove transactions from this MemPool
+        transactions = [Transaction.from_dict(x) for x in data]
+        validity = blockchain.MemPool.remove_transactions(transactions)
+
+        # if transactions have already been removed then this node has already propagated this action to the other nodes
+        # nodes announcing blocks leave it to the other nodes to remove the transactions of the blocks they fetch
+        if validity and not blockchain.announce:
+            # propagate remove call to the other nodes
+            blockchain.gossip.enqueue('transactions_verified', data)
+
+        response = {'message': 'Transactions successfully verified and removed from MemPool'}
+        return jsonify(response), 201
+
+    @app.route('/chain_consensus', methods=['GET'])
+    def chain_consensus():
+        blockchain.compare_chains()
+        return jsonify({'message': 'The chain was updated!'}), 200
+
+    @app.route('/connect_to_network', methods=['GET'])
+    def connect_to_network():
+        blockchain.Network.connect_to_network()
+        return jsonify({'message': 'Node info sent to network'})
+
+    @app.route('/get_nodes', methods=['GET'])
+    def get_nodes():
+        payload = [x.to_dict() for x in blockchain.Network.nodes]
+        return jsonify({'message': payload}), 200
+
+    @app.route('/receive_data', methods=['POST'])
+    def receive_data():
+        print(request.json)
+        return jsonify({'message': 'It works'}), 200
+
+    return app
 
-app = Flask(__name__)
 
 first = Node(port='50001')
-blockchain = BlockChain(1, first, '50000', '127.0.0.1')
-
-
-@app.route('/get_chain', methods=['GET'])
-def get_chain():
-    payload = [x.__dict__ for x in blockchain.chain]
-    # payload = json.dumps(blockchain.chain, default=lambda x: x.__dict__)
-    response = {'chain': payload, 'length': len(blockchain.chain)}
-    return jsonify(response), 200
-
-
-@app.route('/mine_block', methods=['GET'])
-def mine_block():
-    block = blockchain.mine()
-    response = {'message': 'Congratulations, you successfully mined a block!',
-                'block': block.__dict__}
-    # 'index': block.index,
-    # 'timestamp': block.timestamp,
-    # 'proof': block.hash,
-    # 'previous_hash': block.prev_hash
-    return jsonify(response), 200
-
-
-@app.route('/validate_chain', methods=['GET'])
-def validate_chain():
-    temp = [x.__dict__ for x in blockchain.chain]
-    if blockchain.validate_chain(temp):
-        response = {'message': 'The blockchain is valid!'}
-    else:
-        response = {'message': 'The blockchain is invalid!'}
-
-    return jsonify(response), 200
-
-
-@app.route('/add_transaction', methods=['POST'])
-def add_transaction():
-    data = request.json['transaction']
-
-    new_transaction = Transaction(data['sender'], data['receiver'], data['amount'], data['fee'], data['ID'])
-
-    if blockchain.propagate_transaction(new_transaction):
-        return jsonify({'message': 'Transaction successfully added'}), 201
-    else:
-        return jsonify({'message': 'Transaction already propagated'}), 201
-
-
-@app.route('/update_node', methods=['POST'])
-def update_node():
-    new_chain = []
-    chain = request.json['chain']
-    for x in chain:
-        new_block = Block(x['index'], x['transactions'], x['prev_hash'], x['nonce'], x['timestamp'])
-        new_block.hash = x['hash']
-        new_chain.append(new_block)
-
-    transactions = request.json['transactions']
-    transactions = [Transaction(x['sender'], x['receiver'], x['amount'], x['fee'], x['ID']) for x in transactions]
-
-    blockchain.chain = new_chain
-    blockchain.MemPool.unverified_transactions = transactions
-
-    return jsonify({'message': 'Successful'}), 201
-
-
-@app.route('/get_unverified_transactions', methods=['GET'])
-def get_unverified_transactions():
-    payload = [x.__dict__ for x in blockchain.MemPool.unverified_transactions]
-    return jsonify({'Transactions': payload}), 200
-
-
-@app.route('/add_node', methods=['POST'])
-def add_node():
-    data = request.json['node']
-    new_node = Node(data['path'], data['port'], data['address'])
-    blockchain.Network.add_node(new_node)
-    response = {'message': 'Node successfully connected!'}
-    return jsonify(response), 201
-
-
-@app.route('/transactions_verified', methods=['POST'])
-def transactions_verified():
-    data = request.json['transactions']
-
-    # remove transactions from this MemPool
-    transactions = [Transaction(x['sender'], x['receiver'], x['amount'], x['fee'], x['ID']) for x in data]
-    validity = blockchain.MemPool.remove_transactions(transactions)
-
-    # if transactions have already been removed then this node has already propagated this action to the other nodes
-    if validity:
-        # propagate remove call to the other nodes
-        blockchain.Network.broadcast({'transactions': data}, '/transactions_verified')
-
-    response = {'message': 'Transactions successfully verified and removed from MemPool'}
-    return jsonify(response), 201
-
-
-@app.route('/chain_consensus', methods=['GET'])
-def chain_consensus():
-    blockchain.compare_chains()
-    return jsonify({'message': 'The chain was updated!'}), 200
-
-
-@app.route('/connect_to_network', methods=['GET'])
-def connect_to_network():
-    blockchain.Network.connect_to_network()
-    return jsonify({'message': 'Node info sent to network'})
-
-
-@app.route('/get_nodes', methods=['GET'])
-def get_nodes():
-    payload = [x.__dict__ for x in blockchain.Network.nodes]
-    return jsonify({'message': payload}), 200
-
-
-@app.route('/receive_data', methods=['POST'])
-def receive_data():
-    print(request.json)
-    return jsonify({'message': 'It works'}), 200
+# the chain is persisted in the directory given by QUADKOIN_STORAGE if it is set
+blockchain = BlockChain(1, first, '50000', '127.0.0.1', storage_path=os.environ.get('QUADKOIN_STORAGE'))
+app = create_app(blockchain)
 
 
 if __name__ == '__main__':
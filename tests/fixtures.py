@@ -1,12 +1,22 @@
 import pytest
 from flask_api import flask_api
 import json
+import time
 
 @pytest.fixture
 def client():
     return flask_api.app.test_client()
 
 
+def mine(client):
+    """Starts a mining job and waits for it to finish. Returns the final status of the job."""
+    job = client.get('mine_block').get_json()['job']
+    while job['status'] in ('queued', 'running'):
+        time.sleep(0.01)
+        job = client.get(f"mining_status/{job['ID']}").get_json()['job']
+    return job
+
+
 @pytest.fixture
 def transactions():
     return {'transaction':
@@ -0,0 +1,13 @@
+from benchmarks.suite import bench_compute_hash, compare, run_suite
+
+
+def test_suite_detects_regressions():
+    results = run_suite(quick=True, benchmarks=[bench_compute_hash])
+    assert results['block.compute_hash']['ns_per_op'] > 0
+
+    baseline = {'block.compute_hash': dict(results['block.compute_hash'])}
+    assert compare(results, baseline, 0.25) == []
+    baseline['block.compute_hash']['ns_per_op'] /= 2
+    assert [x[0] for x in compare(results, baseline, 0.25)] == ['block.compute_hash']
+    # benchmarks missing from the baseline are not regressions
+    assert compare(results, {}, 0.25) == []
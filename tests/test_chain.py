@@ -1,8 +1,22 @@
 # USE python -m pytest tests/ TO INITIATE ALL TESTS -- This is due to fixture importing modules
 
 
-from fixtures import client  # DO NOT REMOVE THIS IMPORT BC IT IS USED EVEN IF PYCHARM SAYS IT IS NOT
+from fixtures import client, mine  # DO NOT REMOVE THIS IMPORT BC IT IS USED EVEN IF PYCHARM SAYS IT IS NOT
+import threading
+import time
+from hashlib import sha256
+
 from flask import json
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.network import Node
+from Cryptocurrency.mempool import Transaction
+from Cryptocurrency.block import Block
+from Cryptocurrency.blocktree import BlockTree
+from Cryptocurrency.chain import Chain
+from Cryptocurrency.merkle import EMPTY_ROOT, merkle_proof, merkle_root, verify_proof
+from Cryptocurrency.mining import Miner, MiningScheduler, search_nonce
+from Cryptocurrency.verification import ChainVerifier
+from flask_api.flask_api import create_app
 
 
 def test_get_chain(client):
@@ -22,7 +36,7 @@ def test_get_chain(client):
 
 def test_mine_block(client):
     client.get('get_chain')
-    client.get('mine_block')
+    mine(client)
     response = client.get('get_chain')
 
     data = json.loads(response.get_data(as_text=True))
@@ -39,7 +53,7 @@ def test_mine_block(client):
 
 def test_validate_chain(client):
     client.get('get_chain')
-    client.get('mine_block')
+    mine(client)
     response = client.get('get_chain')
 
     data = json.loads(response.get_data(as_text=True))
@@ -56,4 +70,498 @@ def test_validate_chain(client):
     new_response = client.get('validate_chain')
     new_data = json.loads(new_response.get_data(as_text=True))
 
-    assert new_data['message'] == 'The blockchain is valid!'
\ No newline at end of file
+    assert new_data['message'] == 'The blockchain is valid!'
+    assert new_data['verified_height'] == length - 1
+
+    new_response = client.get('validate_chain?full=true')
+    new_data = json.loads(new_response.get_data(as_text=True))
+
+    assert new_data['message'] == 'The blockchain is valid!'
+
+
+def test_mining_status(client):
+    response = client.get('mine_block')
+    assert response.status_code == 202
+
+    job = mine(client)
+    assert job['status'] == 'mined'
+    assert job['nonces'] >= 1
+    assert job['block']['hash'][:1] == '0'
+
+    response = client.get('mining_status/unknown')
+    assert response.status_code == 404
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_midstate_hash():
+    block = Block(3, [{'ID': '1', 'sender': 'Tim', 'receiver': 'Div', 'amount': 1, 'fee': 0}], 'prev', 7, 'now', 'Tim')
+    header = {'index': 3, 'prev_hash': 'prev', 'timestamp': 'now', 'merkle_root': block.merkle_root, 'miner': 'Tim'}
+    full_header = json.dumps(header, sort_keys=True).encode()
+    # a difficulty of 0 accepts the first nonce tried
+    assert search_nonce(block.header_bytes(), 0, start=7) == (7, sha256(full_header + b'7').hexdigest())
+    assert block.compute_hash() == sha256(full_header + b'7').hexdigest()
+
+    # every field covered by the header changes the hash, and the cached header
+    hashes = {block.compute_hash()}
+    changes = [('index', 4), ('prev_hash', 'other'), ('timestamp', 'later'), ('miner', 'Div'), ('nonce', 8),
+               ('transactions', [])]
+    for field, value in changes:
+        setattr(block, field, value)
+        midstate_hash = search_nonce(block.header_bytes(), 0, start=block.nonce)[1]
+        assert midstate_hash == block.compute_hash()
+        assert midstate_hash not in hashes
+        hashes.add(midstate_hash)
+    assert block.merkle_root != header['merkle_root']
+
+
+def test_parallel_miner():
+    header = Block(1, [], 'prev', timestamp='now').header_bytes()
+    serial = search_nonce(header, 2)
+    miner = Miner(2, chunk_size=50)
+    try:
+        # the chunks before the one where a nonce is found are searched to the end, so the first valid nonce is found
+        assert miner.search(header, 2) == serial
+        # every chunk searched before the nonce was found is counted
+        assert miner.hashes >= serial[0] + 1
+        assert serial[1].startswith('00') and serial[1] == sha256(header + str(serial[0]).encode()).hexdigest()
+        assert miner.search(header, 64, stop=500) is None
+
+        # a search that would never end is stopped by abort
+        results = []
+        search = threading.Thread(target=lambda: results.append(miner.search(header, 64)))
+        search.start()
+        time.sleep(0.5)
+        started = time.monotonic()
+        miner.abort()
+        search.join(5)
+        assert not search.is_alive() and results == [None]
+        assert time.monotonic() - started < 2
+    finally:
+        miner.close()
+
+
+def test_mining_scheduler():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    scheduler = MiningScheduler(blockchain, max_jobs=2)
+    jobs = [scheduler.submit(), scheduler.submit()]
+    wait_until(lambda: all(x.done for x in jobs))
+    # the jobs are mined one after the other, each on top of the block mined by the one before
+    assert [x.status for x in jobs] == ['mined', 'mined']
+    assert jobs[1].block.prev_hash == jobs[0].block.hash and len(blockchain.chain) == 3
+    assert scheduler.get(jobs[0].ID) is jobs[0] and scheduler.get('unknown') is None
+
+    # a job whose proof of work is aborted
+    blockchain.miningDiff = 64
+    job = scheduler.submit()
+    assert scheduler.get(jobs[0].ID) is None
+    wait_until(lambda: job.nonces > 0)
+    blockchain.abort_mining()
+    wait_until(lambda: job.done)
+    assert job.status == 'aborted' and job.block is None
+
+    def fail(progress=None):
+        raise RuntimeError('mining failed')
+
+    blockchain.mine = fail
+    job = scheduler.submit()
+    wait_until(lambda: job.done)
+    assert job.status == 'failed' and job.finished is not None
+
+
+def test_close_stops_node():
+    blockchain = BlockChain(64, Node(port='50001'))
+    blockchain.Network.nodes = []
+    jobs = [blockchain.scheduler.submit(), blockchain.scheduler.submit()]
+    wait_until(lambda: jobs[0].nonces > 0)
+    thread = blockchain.scheduler._thread
+    blockchain.close()
+    # the running job and the queued one are aborted and the threads and pools are stopped
+    assert [x.status for x in jobs] == ['aborted', 'aborted'] and not thread.is_alive()
+    assert blockchain.fetcher._shutdown and blockchain.Network.executor._shutdown
+    assert blockchain.miner._pool is None and blockchain.verifier._pool is None
+
+def test_abort_before_search_starts():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    get_transactions = blockchain.template.get_transactions
+
+    def competing_block_received():
+        # the tip changes after mine() read it but before the proof of work starts
+        blockchain.abort_mining()
+        return get_transactions()
+
+    blockchain.template.get_transactions = competing_block_received
+    assert blockchain.mine() is None and len(blockchain.chain) == 1
+
+    # the aborted search does not stop the next one
+    assert blockchain.miner.search(blockchain.last_block.header_bytes(), 0) is not None
+    # an abort requested while nothing is being mined does not stop the next block
+    blockchain.template.get_transactions = get_transactions
+    blockchain.abort_mining()
+    assert blockchain.mine() is not None
+
+
+def test_validate_chain_detects_tampering():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    blockchain.mine()
+    blockchain.mine()
+    assert blockchain.validate_chain()
+    assert blockchain.verified_height == 2
+
+    # the hash and links are still consistent but the stored contents no longer match the hash
+    blockchain.chain.transactions(1)[:] = [{'ID': '1', 'sender': 'Tim', 'receiver': 'Div', 'amount': 1, 'fee': 0}]
+    assert blockchain.validate_chain()
+    assert not blockchain.validate_chain(full=True)
+    assert not blockchain.validate_chain(list(blockchain.chain))
+
+
+def mined_chain(length, difficulty=1):
+    """Builds a chain of mined blocks without a BlockChain."""
+    genesis = Block(0, [], '0')
+    genesis.hash = genesis.compute_hash()
+    chain = [genesis]
+    for i in range(1, length):
+        chain.append(mined_block(i, [{'ID': str(i), 'sender': 'Tim', 'receiver': 'Div', 'amount': i, 'fee': 0}],
+                                 chain[-1].hash, difficulty))
+    return chain
+
+
+def mined_block(index, transactions, prev_hash, difficulty=1):
+    block = Block(index, transactions, prev_hash)
+    block.nonce, block.hash = search_nonce(block.header_bytes(), difficulty)
+    return block
+
+
+def test_parallel_verifier():
+    chain = mined_chain(7)
+    verifier = ChainVerifier(2, chunk_size=2, min_blocks=0)
+    try:
+        assert verifier.verify(chain, 1)
+        assert verifier.verify(chain[3:], 1, chain[2])
+        assert verifier.verify(iter(chain), 1, num_blocks=len(chain))
+        assert ChainVerifier(chunk_size=2).verify(iter(chain[3:]), 1, chain[2], len(chain) - 3)
+
+        # an unmined block claiming to be a genesis block in the middle of the chain
+        forged = Block(0, [], chain[2].hash)
+        while forged.compute_hash().startswith('0'):
+            forged.nonce += 1
+        forged.hash = forged.compute_hash()
+        assert not verifier.verify(chain[:3] + [forged], 1)
+        assert not ChainVerifier().verify(chain[:3] + [forged], 1)
+        # a mined block whose index does not follow the previous one
+        assert not verifier.verify(chain[:3] + [mined_block(5, [], chain[2].hash)], 1)
+
+        # a mined block that does not link to the block before it
+        broken = chain[:4] + [mined_block(4, [], chain[2].hash)] + chain[5:]
+        assert not verifier.verify(broken, 1)
+
+        # a tampered block in the last chunk
+        tampered = list(chain)
+        tampered[6] = Block.from_dict(dict(chain[6].to_dict(), transactions=[]))
+        assert not verifier.verify(tampered, 1)
+        assert not verifier.verify(iter(tampered), 1, num_blocks=len(tampered))
+    finally:
+        verifier.close()
+
+
+class ClientResponse:
+    """Makes the response of a flask test client look like the response of requests."""
+
+    def __init__(self, response):
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.content = response.get_data()
+        self._response = response
+
+    def json(self):
+        return self._response.get_json()
+
+    def raise_for_status(self):
+        assert self.status_code < 400
+
+
+def test_chain_sync(client, monkeypatch):
+    mine(client)
+    mine(client)
+    tip = client.get('chain_tip').get_json()
+    headers = client.get('headers?from=1&count=1').get_json()['headers']
+    assert headers[0]['index'] == 1 and 'transactions' not in headers[0]
+    assert len(client.get('blocks?from=0&count=2').get_json()['blocks']) == 2
+    # a negative start used to be clamped after the end of the range was computed from it
+    for route in ('blocks', 'headers'):
+        assert client.get(f'{route}?from=-2&count=3').status_code == 400
+        assert client.get(f'{route}?from=0&count=-1').status_code == 400
+
+    requested = []
+
+    def get(url, params=None, headers=None, timeout=None):
+        requested.append(url.split('/')[-1])
+        return ClientResponse(client.get(url.split('/')[-1], query_string=params, headers=headers))
+
+    monkeypatch.setattr('Cryptocurrency.blockchain.requests.get', get)
+    blockchain = BlockChain(1, Node(port='50000'))
+    blockchain.Network.nodes = [Node(port='50000')]
+    blockchain.MemPool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, 'fork'))
+    blockchain.mine()
+
+    # both chains share the genesis block and the block this node mined is replaced
+    assert blockchain.compare_chains()
+    assert len(blockchain.chain) == tip['height'] + 1
+    assert blockchain.last_block.hash == tip['hash']
+    assert blockchain.validate_chain(full=True)
+    assert requested.count('headers') == 2
+
+    requested.clear()
+    assert not blockchain.compare_chains()
+    assert requested == ['chain_tip']
+
+
+def test_streaming_sync(tmp_path, monkeypatch):
+    source = BlockChain(1, Node(port='50001'))
+    source.Network.nodes = []
+    for _ in range(3):
+        source.mine()
+    source.MemPool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, 'pending'))
+    target = BlockChain(1, Node(port='50002'), storage_path=str(tmp_path))
+    target.Network.nodes = []
+    target.sync_page_size = 2
+    target_client = create_app(target).test_client()
+
+    # the stream is cut in the middle of the third block
+    lines = b''.join(source.export_chain()).splitlines(keepends=True)
+    response = target_client.post('update_node', data=b''.join(lines[:4]) + lines[4][:20],
+                                  content_type='application/x-ndjson')
+    assert response.status_code == 400
+    assert response.get_json()['height'] == 2
+    assert len(target.MemPool) == 0
+
+    def get(url, params=None, headers=None, timeout=None):
+        return ClientResponse(target_client.get(url.split('/')[-1], query_string=params, headers=headers))
+
+    def post(url, data=None, headers=None, timeout=None):
+        return ClientResponse(target_client.post(url.split('/')[-1], data=b''.join(data), headers=headers))
+
+    monkeypatch.setattr('Cryptocurrency.blockchain.requests.get', get)
+    monkeypatch.setattr('Cryptocurrency.blockchain.requests.post', post)
+    # the sync resumes after the blocks the target already has
+    assert source.update_node(target.node).status_code == 201
+    assert [x.hash for x in target.chain] == [x.hash for x in source.chain]
+    assert 'pending' in target.MemPool
+    assert target.validate_chain(full=True)
+
+
+def test_update_node_rejects_malformed_bodies():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    blockchain.mine()
+    client = create_app(blockchain).test_client()
+    chain = [x.to_dict() for x in blockchain.chain]
+    transaction = {'sender': 'Tim', 'receiver': 'Div', 'amount': 1, 'fee': 0.1, 'ID': 'update'}
+
+    assert not blockchain.validate_chain([])
+    for body in ({}, {'chain': chain}, {'chain': 'blocks', 'transactions': []}, {'chain': [], 'transactions': []},
+                 {'chain': chain[:1] + [{'index': 1}], 'transactions': []},
+                 {'chain': chain, 'transactions': [dict(transaction, amount='1')]}):
+        assert client.post('update_node', json=body).status_code == 400
+    assert len(blockchain.chain) == 2 and len(blockchain.MemPool) == 0
+    assert client.post('update_node', json={'chain': chain, 'transactions': [transaction]}).status_code == 201
+    assert 'update' in blockchain.MemPool
+
+
+def test_merkle_proofs():
+    transactions = [{'ID': str(i), 'sender': 'Tim', 'receiver': 'Div', 'amount': i, 'fee': 0.1} for i in range(7)]
+    root = merkle_root(transactions)
+    assert all(verify_proof(x, merkle_proof(transactions, i), root) for i, x in enumerate(transactions))
+    assert not verify_proof(dict(transactions[3], amount=100), merkle_proof(transactions, 3), root)
+    # repeating the last transaction changes the root
+    assert merkle_root(transactions + transactions[-1:]) != root
+    assert merkle_root([]) == EMPTY_ROOT
+
+    # the header that is hashed has the same size whatever the number of transactions
+    assert len(Block(1, transactions, '0').header_bytes()) == len(Block(1, [], '0').header_bytes())
+
+
+def test_tx_proof(client):
+    client.post('add_transaction', json={'transaction': {'sender': 'Tim', 'receiver': 'Div', 'amount': 5,
+                                                         'fee': 0.1, 'ID': 'proof'}})
+    mine(client)
+    response = client.get('tx_proof/proof')
+    assert response.status_code == 200
+    proof = response.get_json()
+    header = client.get(f"headers?from={proof['height']}&count=1").get_json()['headers'][0]
+    # a light client only needs the header of the block to check the transaction
+    assert header['hash'] == proof['block_hash']
+    assert verify_proof(proof['transaction'], proof['proof'], header['merkle_root'])
+    assert client.get('tx_proof/missing').status_code == 404
+
+
+def test_transaction_index():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    blockchain.propagate_transactions([Transaction('Tim', 'Div', i, 0.1, f'index-{i}') for i in range(3)])
+    blockchain.mine()
+    blockchain.propagate_transaction(Transaction('Div', 'Raghu', 1, 0.1, 'index-3'))
+    blockchain.mine()
+    client = create_app(blockchain).test_client()
+
+    found = client.get('tx/index-3').get_json()
+    assert (found['height'], found['position'], found['confirmations']) == (2, 0, 1)
+    assert found['transaction']['receiver'] == 'Raghu'
+    assert client.get('tx/missing').status_code == 404
+
+    history = client.get('address/Div/history?limit=2').get_json()
+    assert history['total'] == 4
+    # newest first
+    assert [x['transaction']['ID'] for x in history['transactions']][0] == 'index-3'
+    page = client.get('address/Div/history?offset=2&limit=2').get_json()['transactions']
+    assert len(page) == 2 and all(x['height'] == 1 for x in page)
+
+    # removing the last block removes its transactions from the index
+    blockchain.replace_chain(blockchain.chain[:2], require_longer=False)
+    assert client.get('tx/index-3').status_code == 404
+    assert client.get('address/Raghu/history').get_json()['total'] == 0
+    assert blockchain.tx_index.history_size('Div') == 3
+
+
+def test_balances():
+    blockchain = BlockChain(1, Node(port='50001'), block_reward=50, enforce_balances=True)
+    blockchain.Network.nodes = []
+    miner = blockchain.node.address
+    client = create_app(blockchain).test_client()
+
+    # addresses start without funds
+    unfunded = Transaction(miner, 'Div', 10, 0.5, 'balance-0')
+    assert blockchain.propagate_transactions([unfunded]) == ['insufficient_funds']
+    blockchain.mine()
+    assert client.get(f'balance/{miner}').get_json()['balance'] == 50
+
+    # the second transaction is only affordable without the first one
+    statuses = blockchain.propagate_transactions([Transaction(miner, 'Div', 30, 0.5, 'balance-1'),
+                                                  Transaction(miner, 'Raghu', 30, 0.5, 'balance-2')])
+    assert statuses == ['added', 'insufficient_funds']
+    assert client.get(f'balance/{miner}').get_json()['pending'] == 30.5
+    blockchain.mine()
+    # the miner gets back the fee of its own transaction
+    assert blockchain.ledger.balance(miner) == 50 - 30.5 + 50 + 0.5
+    assert client.get('balance/Div').get_json()['balance'] == 30
+
+    # removing the last block restores the balances of the block before it
+    blockchain.ledger.snapshot_interval = 1
+    blockchain.mine()
+    blockchain.replace_chain(blockchain.chain[:2], require_longer=False)
+    assert blockchain.ledger.balance(miner) == 50
+    assert blockchain.ledger.balance('Div') == 0
+
+
+def test_block_tree_reorg():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    blockchain.propagate_transactions([Transaction('Tim', 'Div', 1, 0.1, 'tree-0')])
+    blockchain.mine()
+    blockchain.mine()
+    truncated = []
+    blockchain.chain.listeners.append(type('Listener', (), {'block_appended': lambda *args: None,
+                                                            'chain_truncated': lambda _, x: truncated.append(x)})())
+
+    # a competing branch forking after the genesis block, sent in reverse order
+    branch = []
+    parent = blockchain.chain[0]
+    for i in range(3):
+        transactions = [Transaction('Raghu', 'Tim', 2, 0.1, 'tree-1').to_dict()] if i == 0 else []
+        block = Block(parent.index + 1, transactions, parent.hash, miner='other')
+        block.hash = blockchain.proof_of_work(block)
+        branch.append(block.to_dict())
+        parent = block
+    blockchain.propagate_transactions([Transaction('Raghu', 'Tim', 2, 0.1, 'tree-1')])
+
+    assert not blockchain.receive_block(branch[2])
+    assert not blockchain.receive_block(branch[1])
+    assert blockchain.tree.orphans == 2
+    assert blockchain.receive_block(branch[0])
+    assert blockchain.tree.orphans == 0
+    assert blockchain.last_block.hash == branch[2]['hash'] and len(blockchain.chain) == 4
+    # only the blocks after the fork point were removed
+    assert truncated == [1]
+    assert blockchain.validate_chain(full=True)
+
+    # the transactions of the removed block wait in the MemPool again and the ones of the branch left it
+    assert 'tree-0' in blockchain.MemPool and blockchain.tx_index.locate('tree-0') is None
+    assert 'tree-1' not in blockchain.MemPool and blockchain.tx_index.locate('tree-1') == (1, 0)
+    tips = create_app(blockchain).test_client().get('chain_tips').get_json()['tips']
+    assert [(x['height'], x['branch_length']) for x in tips] == [(3, 0), (2, 2)]
+    assert not blockchain.receive_block(branch[0])
+
+
+def test_block_tree_deep_fork():
+    genesis = Block(0, [], '0', timestamp='now')
+    genesis.hash = genesis.compute_hash()
+    chain = Chain()
+    chain.append(genesis)
+    tree = BlockTree(chain, max_depth=2)
+
+    def child(parent, miner):
+        block = Block(parent.index + 1, [], parent.hash, timestamp='now', miner=miner)
+        block.hash = block.compute_hash()
+        return block
+
+    # the chain and a branch forking after the genesis block grow side by side, the chain wins the ties
+    a, b = [genesis], [genesis]
+    for _ in range(2):
+        a.append(child(a[-1], 'a'))
+        b.append(child(b[-1], 'b'))
+        assert tree.add(a[-1])[0] == 'extended' and tree.add(b[-1])[0] == 'branch'
+    # the fork point falls more than max_depth below the tip, the whole branch is forgotten
+    a.append(child(a[-1], 'a'))
+    assert tree.add(a[-1])[0] == 'extended'
+    assert len(tree) == 0
+
+    # the branch would now have more work than the chain but can no longer be connected to it
+    b.append(child(b[-1], 'b'))
+    b.append(child(b[-1], 'b'))
+    assert tree.add(b[3])[0] == 'orphan' and tree.add(b[4])[0] == 'orphan'
+    assert chain.hash_at(len(chain) - 1) == a[-1].hash
+    assert tree.add(b[1])[0] == 'stale'
+
+
+def test_metrics():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = [Node(port='1')]
+    client = create_app(blockchain).test_client()
+    blockchain.propagate_transactions([Transaction('Tim', 'Div', 1, 0.5, 'metrics-0')])
+    blockchain.mine()
+    blockchain.validate_chain()
+    client.get('tx/metrics-0')
+    # a request failing with an unhandled exception
+    assert client.post('add_node', json={}).status_code == 500
+
+    response = client.get('metrics')
+    assert response.mimetype == 'text/plain'
+    samples = dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines()
+                   if not line.startswith('#'))
+    assert samples['quadkoin_blocks_mined_total'] == '1'
+    assert int(samples['quadkoin_nonces_total']) == blockchain.miner.hashes == blockchain.last_block.nonce + 1
+    assert samples['quadkoin_chain_height'] == '1'
+    assert samples['quadkoin_mempool_admitted_total'] == '1'
+    assert samples['quadkoin_mempool_transactions'] == '0'
+    assert samples['quadkoin_validate_chain_seconds_count'] == '1'
+    assert samples['quadkoin_http_request_seconds_count{route="/tx/<transaction_id>",method="GET"}'] == '1'
+    assert samples['quadkoin_http_request_seconds_bucket{route="/tx/<transaction_id>",method="GET",le="+Inf"}'] == '1'
+    assert samples['quadkoin_http_request_seconds_count{route="/add_node",method="POST"}'] == '1'
+    # the block announced to a node that is not running
+    assert samples['quadkoin_message_failures_total{peer="http://127.0.0.1:1",route="inv"}'] == '1'
+
+
+def test_other_node_apps():
+    from flask_api import flask_api_2, flask_api_3
+    for module in (flask_api_2, flask_api_3):
+        client = module.app.test_client()
+        for route in ('get_chain', 'validate_chain', 'get_unverified_transactions', 'get_nodes'):
+            assert client.get(route).status_code == 200
@@ -1,7 +1,15 @@
 # DO NOT REMOVE THIS IMPORT BC IT IS USED EVEN IF PYCHARM SAYS IT IS NOT
 from fixtures import client, transactions
 
+import sys
+import threading
+
 from flask import json
+from Cryptocurrency.mempool import MemPool, Transaction
+from Cryptocurrency.template import BlockTemplate
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.network import Node
+from flask_api.flask_api import create_app
 
 
 def test_get_unverified(client):
@@ -25,4 +33,196 @@ def test_add_transaction(client, transactions):
     assert data['Transactions'][0] == transactions['transaction']
 
 
+def test_add_transaction_rejects_invalid():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    single_client = create_app(blockchain).test_client()
+    valid = {'sender': 'Tim', 'receiver': 'Div', 'amount': 1, 'fee': 0.1, 'ID': 'single'}
+    for invalid in ({k: v for k, v in valid.items() if k != 'receiver'}, dict(valid, amount='1'),
+                    dict(valid, fee=-0.1), dict(valid, ID=5)):
+        assert single_client.post('add_transaction', json={'transaction': invalid}).status_code == 400
+    assert single_client.post('add_transaction', json={'other': valid}).status_code == 400
+    assert len(blockchain.MemPool) == 0
+    assert single_client.post('add_transaction', json={'transaction': valid}).status_code == 201
+    response = single_client.post('add_transaction', json={'transaction': valid})
+    assert response.status_code == 200 and response.get_json()['status'] == 'duplicate'
+
+
+def test_add_transaction_status_codes():
+    blockchain = BlockChain(1, Node(port='50001'), block_reward=50, enforce_balances=True, max_tran_per_sender=1)
+    blockchain.Network.nodes = []
+    single_client = create_app(blockchain).test_client()
+    miner = blockchain.node.address
+    blockchain.mine()
+
+    overspend = {'sender': miner, 'receiver': 'Div', 'amount': 60, 'fee': 0.1, 'ID': 'overspend'}
+    response = single_client.post('add_transaction', json={'transaction': overspend})
+    assert response.status_code == 422 and response.get_json()['status'] == 'insufficient_funds'
+    assert 'overspend' not in blockchain.MemPool
+
+    affordable = dict(overspend, amount=20, ID='affordable')
+    assert single_client.post('add_transaction', json={'transaction': affordable}).status_code == 201
+    # the sender already has as many transactions in the MemPool as allowed
+    response = single_client.post('add_transaction', json={'transaction': dict(affordable, ID='capped')})
+    assert response.status_code == 409 and response.get_json()['status'] == 'rejected'
+
+
+def test_add_transactions_batch():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    batch_client = create_app(blockchain).test_client()
+    batch = [{'sender': 'Tim', 'receiver': 'Div', 'amount': 100, 'fee': 0.1, 'ID': 'a'},
+             {'sender': 'Tim', 'receiver': 'Div', 'amount': 100, 'fee': 0.1, 'ID': 'a'},
+             {'sender': 'Tim', 'receiver': 'Div', 'amount': -1, 'fee': 0.1, 'ID': 'b'},
+             {'sender': 'Div', 'receiver': 'Tim', 'amount': 5, 'fee': 0.2, 'ID': 'c'}]
+
+    response = batch_client.post('add_transactions', json=batch)
+    assert response.status_code == 201
+    results = response.get_json()['results']
+    assert [(x['ID'], x['status']) for x in results] == [('a', 'added'), ('a', 'duplicate'), ('b', 'invalid'),
+                                                          ('c', 'added')]
+    assert [x.ID for x in blockchain.MemPool.unverified_transactions] == ['c', 'a']
+
+    ndjson = '\n'.join([json.dumps({'sender': 'Raghu', 'receiver': 'Tim', 'amount': 1, 'fee': 0.3, 'ID': 'd'}),
+                        'not json', json.dumps(batch[0])]) + '\n'
+    response = batch_client.post('add_transactions', data=ndjson, content_type='application/x-ndjson')
+    assert [x['status'] for x in response.get_json()['results']] == ['added', 'invalid', 'duplicate']
+    assert batch_client.post('add_transactions', json={'transactions': 'a'}).status_code == 400
+
+
+def test_transactions_must_fit_the_wire_format():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    wire_client = create_app(blockchain).test_client()
+    too_large = {'sender': 'Tim', 'receiver': 'Div', 'amount': 2 ** 64, 'fee': 0.1, 'ID': 'large'}
+    assert wire_client.post('add_transaction', json={'transaction': too_large}).status_code == 400
+    response = wire_client.post('add_transactions', json=[dict(too_large, ID='x' * 70000), dict(too_large, amount=1)])
+    assert [x['status'] for x in response.get_json()['results']] == ['invalid', 'added']
+
+    assert blockchain.propagate_transactions([Transaction('Tim', 'Div', 1, 2 ** 63, 'fee'),
+                                              Transaction('Tim', 'Div', 1, 0.1, 'ok')]) == ['invalid', 'added']
+    assert 'fee' not in blockchain.MemPool
+
+
+def test_mempool_order_and_removal():
+    pool = MemPool(2, 10)
+    low = Transaction('Tim', 'Div', 100, 0.01, '1')
+    high = Transaction('Raghu', 'Tim', 100, 0.5, '2')
+    middle = Transaction('Div', 'Raghu', 100, 0.1, '3')
+
+    assert pool.insert_single_transaction(low)
+    assert pool.insert_single_transaction(high)
+    assert pool.insert_single_transaction(middle)
+    assert not pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.01, '1'))
+
+    assert pool.get_top_transactions() == [high, middle]
+    assert pool.remove_transactions([high])
+    assert not pool.remove_transactions([high])
+    assert pool.get_top_transactions() == [middle, low]
+    assert pool.unverified_transactions == [middle, low]
+    assert '2' not in pool and len(pool) == 2
+
+
+def test_mempool_eviction():
+    pool = MemPool(10, 2, max_tran_per_sender=2)
+    low = Transaction('Tim', 'Div', 100, 0.01, '1')
+    middle = Transaction('Div', 'Raghu', 100, 0.1, '2')
+    high = Transaction('Raghu', 'Tim', 100, 0.5, '3')
+
+    assert pool.insert_multiple_transactions([low, middle]) == [True, True]
+    # the MemPool is full so the transaction with the lowest fee makes room for a better one
+    assert pool.insert_single_transaction(high)
+    assert '1' not in pool
+    assert not pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.05, '4'))
+    assert pool.get_top_transactions() == [high, middle]
+    assert pool.counters == {'admitted': 3, 'rejected': 1, 'evicted': 1, 'expired': 0}
+
+
+def test_mempool_sender_cap_and_expiry():
+    pool = MemPool(10, 10, max_tran_per_sender=1, max_age=0)
+    assert pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, '1'))
+    assert pool.expire() == 1
+    assert pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, '2'))
+
+    pool = MemPool(10, 10, max_tran_per_sender=1)
+    assert pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, '1'))
+    assert not pool.insert_single_transaction(Transaction('Tim', 'Div', 100, 0.1, '2'))
+
+
+def test_mempool_concurrent_insert_and_remove():
+    pool = MemPool(10, 500)
+    template = BlockTemplate(pool)
+    batches = [[Transaction(f'sender-{i}', 'Div', 1, (i * 37 + j) % 100 / 100, f'{i}-{j}') for j in range(300)]
+               for i in range(4)]
+
+    def insert(batch):
+        for start in range(0, len(batch), 10):
+            pool.insert_multiple_transactions(batch[start:start + 10])
+
+    def remove(batch):
+        for transaction in batch:
+            pool.remove_transactions(transaction)
+            pool.get_top_transactions()
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=insert, args=(x,)) for x in batches] + \
+                  [threading.Thread(target=remove, args=(x,)) for x in batches[:2]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    # the indexes of the MemPool and of its listeners agree with its transactions
+    assert len(pool) <= 500
+    assert set(pool._entries) == set(pool.transactions)
+    assert sum(pool._per_sender.values()) == len(pool)
+    assert pool.get_top_transactions() == pool.unverified_transactions[:10]
+    selected, _ = template.get_transactions()
+    assert all(x.ID in pool for x in selected)
+
+
+def test_blockchain_mempool_limits():
+    blockchain = BlockChain(1, Node(port='50001'), mempool_size=2, max_tran_per_sender=1, mempool_max_age=60,
+                            mempool_eviction='age')
+    blockchain.Network.nodes = []
+    pool = blockchain.MemPool
+    assert (pool.max_tran_per_MemPool, pool.max_tran_per_sender, pool.max_age, pool.eviction) == (2, 1, 60, 'age')
+    statuses = blockchain.propagate_transactions([Transaction('Tim', 'Div', 1, 0.5, '1'),
+                                                  Transaction('Tim', 'Div', 1, 0.5, '2'),
+                                                  Transaction('Div', 'Tim', 1, 0.1, '3'),
+                                                  Transaction('Raghu', 'Tim', 1, 0.1, '4')])
+    # the second transaction of Tim is over the cap and the oldest transaction is evicted for the last one
+    assert statuses == ['added', 'rejected', 'added', 'added']
+    assert list(pool.transactions) == ['3', '4']
+
+
+def test_mempool_stats(client):
+    response = client.get('/mempool_stats')
+    assert response.status_code == 200
+
+    data = json.loads(response.get_data(as_text=True))
+    transactions = client.get('/get_unverified_transactions').get_json()['Transactions']
+    assert data['size'] == len(transactions)
+    assert set(data['counters']) == {'admitted', 'rejected', 'evicted', 'expired'}
+
+
+def test_block_template():
+    pool = MemPool(10, 10)
+    low = Transaction('Tim', 'Div', 100, 0.01, '1')
+    middle = Transaction('Div', 'Raghu', 100, 0.1, '2')
+    high = Transaction('Raghu', 'Tim', 100, 0.5, '3')
+    pool.insert_single_transaction(low)
+    # only two transactions fit in a block
+    template = BlockTemplate(pool, max_block_bytes=2 * len(low.to_json()) + 5)
+
+    pool.insert_single_transaction(middle)
+    assert template.get_transactions()[0] == [middle, low]
+    pool.insert_single_transaction(high)
+    assert template.get_transactions() == ([high, middle], [high.to_dict(), middle.to_dict()])
 
+    pool.remove_transactions([high])
+    assert template.get_transactions()[0] == [middle, low]
@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.mempool import Transaction
+from Cryptocurrency.network import GossipQueue, Network, Node, SeenCache
+from benchmarks.bench_gossip import start_nodes, wait_for
+from benchmarks.simulator import Simulation
+from flask_api.flask_api import create_app
+
+
+def stub_server(delay=0.0):
+    """
+    Starts a local server answering every post after the given delay. Records the bodies it received and the client
+    addresses they came from.
+    """
+    received = []
+    clients = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            received.append(self.rfile.read(int(self.headers['Content-Length'])))
+            clients.add(self.client_address)
+            time.sleep(delay)
+            self.send_response(201)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    server.clients = clients
+    return server, received
+
+
+@pytest.fixture
+def servers():
+    started = [stub_server(), stub_server(), stub_server(delay=1), stub_server(delay=1)]
+    yield started
+    for server, _ in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_broadcast_is_concurrent(servers):
+    nodes = [Node(port=str(server.server_address[1])) for server, _ in servers]
+    # nothing listens on this port
+    offline = Node(port='1')
+    network = Network(Node(port='50000'), nodes + [offline], timeout=0.3)
+
+    start = time.perf_counter()
+    results = network.broadcast({'node': 'data'}, 'add_node')
+    elapsed = time.perf_counter() - start
+
+    # the slow nodes time out together instead of one after the other
+    assert elapsed < 0.9
+    assert [results[node.full_url] for node in nodes] == [201, 201, None, None]
+    assert results[offline.full_url] is None
+    assert all(received == [b'{"node": "data"}'] for _, received in servers)
+
+
+def test_broadcast_reuses_connections(servers):
+    server = servers[0][0]
+    node = Node(port=str(server.server_address[1]))
+    network = Network(Node(port='50000'), [node])
+
+    network.broadcast({'node': 'data'}, 'add_node')
+    session = network.session(node)
+    network.broadcast({'node': 'data'}, 'add_node')
+
+    assert network.session(node) is session
+    assert len(servers[0][1]) == 2
+    # both messages were sent over the same connection
+    assert len(server.clients) == 1
+
+
+def test_gossip_batches(servers):
+    server, received = servers[0]
+    network = Network(Node(port='50000'), [Node(port=str(server.server_address[1]))])
+    gossip = GossipQueue(network, max_batch=2, flush_interval=0.05)
+
+    assert gossip.enqueue('add_transactions', [{'ID': str(i)} for i in range(5)])
+    gossip.flush(timeout=5)
+
+    batches = [json.loads(x)['transactions'] for x in received]
+    assert [x['ID'] for batch in batches for x in batch] == ['0', '1', '2', '3', '4']
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert gossip.backlog == 0
+
+
+def test_gossip_bounds_backlog(servers):
+    server, received = servers[0]
+    network = Network(Node(port='50000'), [Node(port=str(server.server_address[1]))])
+    # nothing is sent before flush is called
+    gossip = GossipQueue(network, max_batch=100, flush_interval=60, max_backlog=4)
+
+    for i in range(5):
+        assert gossip.enqueue('add_transactions', [{'ID': str(i)}])
+    # the oldest transaction was dropped to keep the backlog bounded
+    assert gossip.dropped == 1
+    gossip.flush(timeout=5)
+    assert [x['ID'] for x in json.loads(received[0])['transactions']] == ['1', '2', '3', '4']
+
+    refusing = GossipQueue(network, max_backlog=1, drop_oldest=False)
+    assert refusing.enqueue('add_transactions', [{'ID': '1'}])
+    assert not refusing.enqueue('add_transactions', [{'ID': '2'}])
+
+
+def test_seen_cache_evicts():
+    seen = SeenCache(max_size=2)
+    assert seen.add('a') and seen.add('b')
+    assert not seen.add('a')
+    # b is the least recently seen
+    assert seen.add('c')
+    assert 'b' not in seen and 'a' in seen and seen.evicted == 1
+    seen.discard('a')
+    assert seen.add('a')
+
+
+def test_inventory_gossip():
+    blockchains, servers, received = start_nodes(3, announce=True)
+    try:
+        blockchains[0].propagate_transaction(Transaction('Tim', 'Div', 1, 0.1, 'inv-1'))
+        wait_for(lambda: all('inv-1' in x.MemPool for x in blockchains), timeout=10)
+        for blockchain in blockchains:
+            blockchain.gossip.flush(timeout=5)
+
+        # every node fetched the transaction once and ignored the other announcements of it
+        assert all(x.MemPool.counters['admitted'] == 1 for x in blockchains)
+        assert blockchains[1].get_inventory_data([{'type': 'tx', 'ID': 'inv-1'}, {'type': 'tx', 'ID': 'other'}]) == \
+            {'transactions': [blockchains[0].MemPool.transactions['inv-1'].to_dict()], 'blocks': []}
+        assert blockchains[1].receive_inventory([{'type': 'tx', 'ID': 'inv-1'}], blockchains[0].node) == 0
+
+        # the other nodes remove the transactions of the block they fetched without them being pushed again
+        links = []
+        enqueue = blockchains[2].gossip.enqueue
+        blockchains[2].gossip.enqueue = lambda link, *args, **kw: links.append(link) or enqueue(link, *args, **kw)
+        blockchains[2].mine()
+        wait_for(lambda: all(len(x.chain) == 2 for x in blockchains), timeout=10)
+        wait_for(lambda: all(len(x.MemPool) == 0 for x in blockchains), timeout=10)
+        assert 'transactions_verified' not in links
+        assert received[0]['bytes'] > 0
+    finally:
+        for server in servers:
+            server.shutdown()
+
+
+def test_malformed_gossip():
+    blockchain = BlockChain(1, Node(port='50001'))
+    blockchain.Network.nodes = []
+    client = create_app(blockchain).test_client()
+    block = blockchain.last_block.to_dict()
+    for body in ({}, {'block': None}, {'block': {k: v for k, v in block.items() if k != 'hash'}},
+                 {'block': dict(block, index='1')}, {'block': dict(block, transactions=[{'ID': 1}])}):
+        assert client.post('add_block', json=body).status_code == 400
+    assert client.post('add_block', data='{', content_type='application/json').status_code == 400
+    assert client.post('add_block', json={'block': block}).status_code == 200
+
+    node = blockchain.node.to_dict()
+    for body in ({}, {'node': node}, {'node': node, 'inventory': [{'type': 'tx'}]},
+                 {'node': {'path': '127.0.0.1'}, 'inventory': []}):
+        assert client.post('inv', json=body).status_code == 400
+    assert client.post('getdata', json={}).status_code == 400
+    assert client.post('inv', json={'node': node, 'inventory': []}).status_code == 202
+    assert client.post('getdata', json={'inventory': []}).get_json() == {'transactions': [], 'blocks': []}
+
+
+def test_simulation():
+    simulation = Simulation(5, degree=2, latency=0.001)
+    try:
+        transactions = simulation.run_transactions(20, timeout=10)
+        block = simulation.run_block(timeout=10)
+    finally:
+        simulation.close()
+    assert transactions['delivered'] == 1 and transactions['tx_per_sec'] > 0
+    assert 0 < transactions['latency']['p50'] <= transactions['latency']['p100']
+    assert block['reached'] == 1
+    traffic = simulation.traffic()
+    assert traffic['failures'] == 0 and traffic['bytes_sent_per_node'] > 0 and traffic['bytes_received_per_node'] > 0
+    total = traffic['bytes_sent_per_node'] + traffic['bytes_received_per_node']
+    assert traffic['bytes_per_node'] == pytest.approx(total)
+
+    # every message is lost
+    simulation = Simulation(3, failure_rate=1.0)
+    try:
+        assert simulation.run_transactions(5, timeout=0.5)['delivered'] == 0
+    finally:
+        simulation.close()
+    assert simulation.traffic()['failures'] == simulation.traffic()['messages'] > 0
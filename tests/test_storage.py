@@ -0,0 +1,117 @@
+import os
+
+from Cryptocurrency.blockchain import BlockChain
+from Cryptocurrency.chain import Chain
+from Cryptocurrency.mempool import Transaction
+from Cryptocurrency.network import Node
+from Cryptocurrency.storage import BlockStore
+from flask_api.flask_api import create_app
+
+
+def new_blockchain(path, **kwargs):
+    blockchain = BlockChain(1, Node(port='50001'), storage_path=str(path), **kwargs)
+    blockchain.Network.nodes = []
+    return blockchain
+
+
+def test_chain_survives_restart(tmp_path):
+    blockchain = new_blockchain(tmp_path)
+    blockchain.mine()
+    blockchain.mine()
+    tip = blockchain.last_block.hash
+    blockchain.store.close()
+
+    restarted = new_blockchain(tmp_path)
+    assert len(restarted.chain) == 3
+    assert restarted.last_block.hash == tip
+    assert restarted.chain[1].prev_hash == restarted.chain[0].hash
+    assert restarted.store.height_of(tip) == 2
+    header = {k: v for k, v in restarted.chain[2].to_dict().items() if k != 'transactions'}
+    assert restarted.chain.header(2) == dict(header, merkle_root=restarted.chain[2].merkle_root)
+    assert restarted.chain.height_of(tip) == 2
+    assert restarted.validate_chain(full=True)
+
+
+def test_recovery_after_partial_write(tmp_path):
+    blockchain = new_blockchain(tmp_path)
+    blockchain.mine()
+    blockchain.store.close()
+
+    # a crash in the middle of an append leaves half a record in the segment and half an entry in the index
+    with open(os.path.join(tmp_path, 'blocks.dat'), 'ab') as segment:
+        segment.write(b'\x00\x00\x01\x00garbage')
+    with open(os.path.join(tmp_path, 'blocks.idx'), 'ab') as index:
+        index.write(b'\x00' * 10)
+
+    store = BlockStore(str(tmp_path))
+    assert len(store) == 2
+    assert store.get(-1)['index'] == 1
+
+    store.truncate(1)
+    assert len(store) == 1
+    store.close()
+    assert len(BlockStore(str(tmp_path))) == 1
+
+
+def test_chain_parses_headers_lazily(tmp_path):
+    blockchain = new_blockchain(tmp_path)
+    for _ in range(3):
+        blockchain.mine()
+    tip = blockchain.last_block.hash
+    expected = blockchain.chain.header(2)
+    blockchain.store.close()
+
+    store = BlockStore(str(tmp_path))
+    parsed = []
+    get_header = store.get_header
+    store.get_header = lambda height: parsed.append(height) or get_header(height)
+    chain = Chain(store)
+    # only the previous hash of the genesis block is read when the chain is loaded, the hashes come from the index
+    assert parsed == [0]
+    assert len(chain) == 4
+    assert chain.hash_at(3) == tip and chain.height_of(tip) == 3
+    assert parsed == [0]
+    assert chain.header(2) == expected
+    assert chain.header(2) == expected
+    assert parsed == [0, 2]
+    store.close()
+
+
+def test_blocks_route_bypasses_cache(tmp_path):
+    blockchain = new_blockchain(tmp_path, cache_size=2)
+    for _ in range(4):
+        blockchain.mine()
+    cached = list(blockchain.chain._bodies)
+    response = create_app(blockchain).test_client().get('/blocks?from=0&count=3')
+    assert [x['index'] for x in response.get_json()['blocks']] == [0, 1, 2]
+    # serving old blocks to a peer keeps the recent blocks in the cache
+    assert list(blockchain.chain._bodies) == cached
+    blockchain.close()
+
+
+def test_indexes_reload_from_snapshots(tmp_path):
+    blockchain = new_blockchain(tmp_path, block_reward=10)
+    blockchain.propagate_transactions([Transaction('Tim', 'Div', 3, 0.5, 'a')])
+    blockchain.mine()
+    blockchain.close()
+
+    restarted = new_blockchain(tmp_path, block_reward=10)
+    restarted.propagate_transactions([Transaction('Div', 'Raghu', 1, 0.25, 'b')])
+    restarted.mine()
+    balances = {x: restarted.ledger.balance(x) for x in ('Tim', 'Div', 'Raghu', restarted.node.address)}
+    locations = {x: restarted.tx_index.locate(x) for x in ('a', 'b')}
+    restarted.store.close()
+
+    # the snapshots were saved at height 1 so only the block mined after the first restart is read again
+    reopened = new_blockchain(tmp_path, block_reward=10)
+    assert {x: reopened.ledger.balance(x) for x in balances} == balances
+    assert {x: reopened.tx_index.locate(x) for x in locations} == locations
+    assert reopened.tx_index.history('Div') == ['b', 'a']
+
+    # snapshots of blocks that are no longer in the chain are ignored
+    reopened.store.truncate(1)
+    reopened.store.close()
+    truncated = new_blockchain(tmp_path, block_reward=10)
+    assert truncated.tx_index.locate('a') is None
+    assert truncated.ledger.balance('Tim') == 0
+    truncated.close()
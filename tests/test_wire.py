@@ -0,0 +1,39 @@
+from fixtures import client, mine
+
+import json
+
+import pytest
+
+from Cryptocurrency import wire
+
+
+def test_wire_round_trip():
+    transaction = {'ID': 'a', 'sender': 'Tim', 'receiver': 'Dív', 'amount': 100, 'fee': 0.1}
+    blocks = [{'index': 0, 'nonce': 0, 'transactions': [], 'timestamp': 't', 'prev_hash': '0', 'miner': None},
+              {'index': 1, 'nonce': 7, 'transactions': [transaction], 'timestamp': 't', 'prev_hash': 'ab' * 32,
+               'miner': 'Tim', 'hash': 'cd' * 32}]
+
+    message = wire.encode_message(blocks, [transaction])
+    # decodes to exactly the same json, ints stay ints and floats stay floats
+    assert json.dumps(wire.decode_message(message)) == json.dumps((blocks, [transaction]))
+    assert len(message) < len(json.dumps({'chain': blocks, 'transactions': [transaction]}))
+
+    with pytest.raises(ValueError):
+        wire.decode_message(message[:-1])
+    with pytest.raises(ValueError):
+        wire.decode_message(b'QK' + bytes([wire.VERSION + 1]) + message[3:])
+    with pytest.raises(ValueError):
+        wire.encode_message(transactions=[dict(transaction, amount='100')])
+
+
+def test_wire_negotiation(client):
+    mine(client)
+    as_json = client.get('blocks?from=0&count=2').get_json()['blocks']
+    response = client.get('blocks?from=0&count=2', headers={'Accept': wire.CONTENT_TYPE})
+    assert response.mimetype == wire.CONTENT_TYPE
+    assert wire.decode_message(response.get_data())[0] == as_json
+
+    chain = client.get('get_chain', headers={'Accept': wire.CONTENT_TYPE}).get_data()
+    response = client.post('update_node', data=chain, content_type=wire.CONTENT_TYPE)
+    assert response.status_code == 201
+    assert client.post('update_node', data=b'garbage', content_type=wire.CONTENT_TYPE).status_code == 400